@@ -0,0 +1,301 @@
+import ast
+import os
+import random
+import profiling
+from evaluation import evaluate
+from rollout import RolloutEvaluator
+from search import ExpectiminimaxSearch
+
+
+class RandomAgent:
+    """
+    A class used to represent an agent playing any legal play, chosen uniformly at random.
+
+    ...
+
+    Attributes
+    ----------
+    rng : random.Random
+        source of the random choices
+
+    Methods
+    -------
+    choose_play(state):
+        Returns a random legal play for the player to move.
+    """
+
+    def __init__(self, rng=None):
+        """
+        Parameters
+        ----------
+        rng : random.Random, optional
+            source of the random choices; the random module by default
+        """
+
+        self.rng = random if rng is None else rng
+
+    def choose_play(self, state):
+        """
+        Returns a random legal play for the player to move.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, with the dice rolled
+
+        Returns
+        -------
+        tuple[(int, int, int)]
+        """
+
+        return self.rng.choice(state.legal_plays())
+
+
+def _spread(state, player):
+    """
+    Returns the sum of the squared distances of the player's pieces from being borne off.
+
+    Among plays leading to the same pip count, the one with the smallest spread brings the pieces furthest back
+    forward, which wins races and avoids being gammoned.
+
+    Parameters
+    ----------
+    state : GameState
+        the position
+    player : int
+        index of the player, 1 or 2
+
+    Returns
+    -------
+    int
+    """
+
+    board = state.board
+    if player == 1:
+        spread = 625 * board[24]
+        for i in range(24):
+            if board[i] > 0:
+                spread += board[i] * (24 - i) * (24 - i)
+    else:
+        spread = 625 * board[25]
+        for i in range(24):
+            if board[i] < 0:
+                spread -= board[i] * (i + 1) * (i + 1)
+    return spread
+
+
+class HeuristicAgent:
+    """
+    A class used to represent an agent playing the legal play with the best static evaluation.
+
+    ...
+
+    Equal evaluations, common in races, are broken by the spread of the pieces (see _spread) rather than by the
+    order of the legal plays, which differs between the colours; both players therefore play alike.
+
+    Attributes
+    ----------
+    evaluator : callable
+        static evaluation, taking a GameState whose turn is the player about to roll and a player index, and
+        returning the equity for that player
+
+    Methods
+    -------
+    choose_play(state):
+        Returns the legal play leading to the best evaluated position.
+    """
+
+    def __init__(self, evaluator=evaluate):
+        """
+        Parameters
+        ----------
+        evaluator : callable
+            static evaluation, taking a GameState and a player index
+        """
+
+        self.evaluator = evaluator
+
+    def choose_play(self, state):
+        """
+        Returns the legal play leading to the best evaluated position.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, with the dice rolled
+
+        Returns
+        -------
+        tuple[(int, int, int)]
+        """
+
+        plays = state.legal_plays()
+        if len(plays) == 1:
+            return plays[0]
+        state = state.copy()
+        player = state.turn
+        best_play = None
+        best_value = None
+        best_spread = None
+        for play in plays:
+            records = [state.apply_move(*step) for step in play]
+            dice = state.dice
+            state.end_turn()
+            value = self.evaluator(state, player)
+            if best_value is None or value > best_value:
+                best_play = play
+                best_value = value
+                best_spread = _spread(state, player)
+            elif value == best_value:
+                spread = _spread(state, player)
+                if spread < best_spread:
+                    best_play = play
+                    best_spread = spread
+            state.end_turn()
+            state.dice = dice
+            for record in reversed(records):
+                state.undo_move(record)
+        return best_play
+
+
+class SearchAgent:
+    """
+    A class used to represent an agent choosing plays by expectiminimax search, see ExpectiminimaxSearch.
+
+    ...
+
+    Attributes
+    ----------
+    search : ExpectiminimaxSearch
+        the search, keeping its transposition table between moves
+
+    Methods
+    -------
+    choose_play(state):
+        Returns the best legal play found within the time budget.
+    """
+
+    def __init__(self, time_budget=1.0, max_depth=3, evaluator=evaluate):
+        """
+        Parameters
+        ----------
+        time_budget : float
+            seconds allowed per move
+        max_depth : int
+            maximum number of plays searched ahead
+        evaluator : callable
+            static evaluation, taking a GameState and a player index; the default one is vectorized over the last
+            chance nodes of the search when NumPy is installed
+        """
+
+        batch_evaluator = None
+        if evaluator is evaluate:
+            try:
+                from batch_evaluation import evaluate_batch
+                batch_evaluator = evaluate_batch
+            except ImportError:
+                pass
+        self.search = ExpectiminimaxSearch(time_budget, max_depth, evaluator, batch_evaluator=batch_evaluator)
+
+    def choose_play(self, state):
+        """
+        Returns the best legal play found within the time budget.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, with the dice rolled
+
+        Returns
+        -------
+        tuple[(int, int, int)]
+        """
+
+        return self.search.choose_play(state)
+
+
+AGENTS = {
+    "random": RandomAgent,
+    "heuristic": HeuristicAgent,
+    "search": SearchAgent,
+    "rollout": RolloutEvaluator,
+}
+
+# agents fast enough to play against in the game window
+DIFFICULTIES = ("random", "heuristic", "search")
+
+# agents aiming at strength, which play the opening book's plays in the game window; the random and heuristic
+# levels keep their own, weaker openings
+BOOK_AGENTS = ("search", "rollout", "neural")
+
+try:
+    from neural import DEFAULT_PATH as NEURAL_PATH, NeuralAgent
+    from position_store import BookAgent
+    from hypergammon import DEFAULT_PATH as HYPERGAMMON_PATH, HypergammonAgent
+    AGENTS["neural"] = NeuralAgent
+    # plays from the outcomes of earlier games, see position_store.py
+    AGENTS["book"] = BookAgent
+    AGENTS["hypergammon"] = HypergammonAgent
+    # the network can only be played against once trained, see neural.py
+    if os.path.exists(NEURAL_PATH):
+        DIFFICULTIES += ("neural",)
+    # perfect hypergammon play, once the game is solved, see hypergammon.py
+    if os.path.exists(HYPERGAMMON_PATH):
+        DIFFICULTIES += ("hypergammon",)
+except ImportError:
+    pass
+
+# the decision time of every agent, timed while profiling is enabled, see profiling.py
+for agent_class in AGENTS.values():
+    profiling.register(agent_class, "choose_play")
+
+
+def make_agent(name, **options):
+    """
+    Creates one of the registered agents by name.
+
+    Parameters
+    ----------
+    name : str
+        key of the agent in AGENTS
+    **options
+        passed on to the agent's constructor
+
+    Returns
+    -------
+    object
+        an agent, with a choose_play(state) method
+    """
+
+    if name not in AGENTS:
+        raise ValueError(f"Unknown agent {name!r}, expected one of {', '.join(AGENTS)}")
+    return AGENTS[name](**options)
+
+
+def agent_from_spec(spec):
+    """
+    Creates an agent from a command line style description: a name, optionally followed by options.
+
+    For example "search:time_budget=0.05,max_depth=2". Option values are read as Python literals when possible,
+    as strings otherwise.
+
+    Parameters
+    ----------
+    spec : str
+        name of the agent in AGENTS, then ":" and comma separated name=value options
+
+    Returns
+    -------
+    object
+        an agent, with a choose_play(state) method
+    """
+
+    name, _, option_list = spec.partition(":")
+    options = {}
+    for option in filter(None, option_list.split(",")):
+        key, _, value = option.partition("=")
+        try:
+            options[key.strip()] = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            options[key.strip()] = value.strip()
+    return make_agent(name.strip(), **options)
@@ -1,8 +1,20 @@
 import tkinter as tk
 import tkinter.font as tkf
+import multiprocessing
+import queue
 import random
+import sys
 import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import profiling
+import simulate
+from agents import BOOK_AGENTS, DIFFICULTIES, make_agent
+from evaluation import game_points
+from game_state import VARIANTS, GameState
+from opening_book import default_book
+from records import GameRecordWriter
 
 
 class AIPlayer:
@@ -11,28 +23,48 @@ class AIPlayer:
 
     ...
 
+    The agent runs on its own thread, which sleeps until it receives a "your turn" request and sends the chosen play
+    back through a queue. Everything touching tkinter or the board, including the paced clicks, happens on the main
+    thread through root.after.
+
     Attributes
     ----------
     backgammon_board : BackgammonBoard
         the current game environment
     result_label : tkinter.Label
         holds the results of a dice roll
+    agent : object
+        chooses the plays, see agents.AGENTS
+    book : bool
+        whether the opening book's plays are played before asking the agent
+    player : int
+        index of the player controlled by the AI
+    delay : int
+        milliseconds between simulated actions, to be readable to the human player
     ai_thread : threading.Thread
-        in which the main loop should run
+        in which the agent chooses its plays
+    requests : queue.Queue
+        positions to choose a play for, sent from the main thread; None stops the thread
+    results : queue.Queue
+        plays chosen by the agent, sent to the main thread
+    cancelled : threading.Event
+        set once the game is over or the window closed
 
     Methods
     -------
     ai_turn()
-        Continuously runs the AI, waiting for its turn to take action.
+        Starts the AI's turn: rolls the dice if needed and asks the agent for a play.
     roll_dice()
-        Simulates dice roll, with delay to be readable to the human player.
+        Simulates dice roll, then asks the agent for a play.
     make_move()
-        Simulates piece selection and movement, with delay to be readable to the human player.
+        Sends the position to the agent's thread and waits for its play on the main thread.
     start_ai_thread()
-        Creates ai_thread and runs ai_turn on it.
+        Creates ai_thread, waiting for requests.
+    stop()
+        Cancels any pending action and ends ai_thread.
     """
 
-    def __init__(self, backgammon_board, result_label):
+    def __init__(self, backgammon_board, result_label, agent=None, book=False):
         """
         Provides all the necessary attributes to simulate actions.
 
@@ -42,62 +74,162 @@ class AIPlayer:
             the current game environment, to access properties and simulate actions
         result_label : tkinter.Label
             holds the results of a dice roll, to simulate roll
+        agent : object, optional
+            chooses the plays, with a choose_play(state) method; plays randomly by default
+        book : bool
+            play the opening book's plays, for the agents aiming at strength, see agents.BOOK_AGENTS
         """
 
         self.backgammon_board = backgammon_board
         self.result_label = result_label
+        self.agent = make_agent("random") if agent is None else agent
+        self.book = book
+        self.player = 2
+        self.delay = 1000
         self.ai_thread = None
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.cancelled = threading.Event()
+        self._clicks = []
+        self._after_id = None
 
     def ai_turn(self):
         """
-        Continuously runs the AI, waiting for its turn to take action.
+        Starts the AI's turn: rolls the dice if needed and asks the agent for a play.
+
+        Called on the main thread whenever the turn passes to the AI.
 
         Returns
         -------
         None
         """
 
-        while True:
-            if self.backgammon_board.light_count == 15 or self.backgammon_board.dark_count == 15:
-                break
-            if self.backgammon_board.turn == 2:
-                if len(self.backgammon_board.dice) == 0:
-                    self.roll_dice()
-                self.make_move()
-            time.sleep(0.1)
+        if self.cancelled.is_set() or self.backgammon_board.turn != self.player:
+            return
+        if len(self.backgammon_board.dice) == 0:
+            self._schedule(self.roll_dice)
+        else:
+            self.make_move()
 
     def roll_dice(self):
         """
-        Simulates dice roll, with delay to be readable to the human player.
+        Simulates dice roll, then asks the agent for a play.
 
         Returns
         -------
         None
         """
 
-        time.sleep(1)
         roll_dice(self.result_label, self.backgammon_board)
+        self.make_move()
 
     def make_move(self):
         """
-        Simulates piece selection and movement, with delay to be readable to the human player.
+        Sends the position to the agent's thread and waits for its play on the main thread.
+
+        The play is chosen once per roll by the agent, among all legal full-turn plays, on a copy of the position.
+
+        Returns
+        -------
+        None
+        """
+
+        self.requests.put(self.backgammon_board.state.copy())
+        self._poll_result()
+
+    def _work(self):
+        """
+        Main loop of ai_thread: blocks until a position arrives, then sends back the book's or the agent's play.
 
         Returns
         -------
         None
         """
 
-        move = self.backgammon_board.valid_move_exists()
-        time.sleep(1)
-        self.backgammon_board.decide_action(move[2])
-        time.sleep(1)
-        self.backgammon_board.decide_action(move[1])
+        while True:
+            state = self.requests.get()
+            if state is None or self.cancelled.is_set():
+                break
+            play = self._decide(state)
+            if self.cancelled.is_set():
+                break
+            self.results.put(play)
+
+    def _decide(self, state):
+        """
+        Returns the book's play for the position, if any and the AI plays from the book, else the agent's play.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, with the dice rolled
+
+        Returns
+        -------
+        tuple[(int, int, int)]
+        """
+
+        # the book is read the first time the AI moves; its plays cost no search time
+        book = default_book() if self.book else None
+        play = book.play(state) if book is not None else None
+        return play if play is not None else self.agent.choose_play(state)
+
+    def _poll_result(self):
+        """
+        Checks, on the main thread, whether the agent's play arrived, and if so starts clicking it.
+
+        Returns
+        -------
+        None
+        """
+
+        try:
+            play = self.results.get_nowait()
+        except queue.Empty:
+            self._after_id = root.after(50, self._poll_result)
+            return
+        self._clicks = [column for step in play for column in step[:2]]
+        self._schedule(self._click_next)
+
+    def _click_next(self):
+        """
+        Simulates the next click of the play, with delay to be readable to the human player.
+
+        Once the play is done, passes the turn if dice are left that cannot be used.
+
+        Returns
+        -------
+        None
+        """
+
+        if len(self._clicks) > 0:
+            self.backgammon_board.decide_action(self._clicks.pop(0))
+            self._schedule(self._click_next)
+        elif self.backgammon_board.turn == self.player and self.backgammon_board.state.winner() is None:
+            self.backgammon_board.decide_action(None)
+
+    def _schedule(self, action):
+        """
+        Runs action on the main thread after the delay, unless the AI is stopped first.
+
+        Parameters
+        ----------
+        action : callable
+            the action to run
+
+        Returns
+        -------
+        None
+        """
+
+        if not self.cancelled.is_set():
+            self._after_id = root.after(self.delay, action)
 
     def start_ai_thread(self):
         """
-        Creates ai_thread and runs ai_turn() on it.
+        Creates ai_thread, waiting for requests.
 
-        Preferred to running ai_turn() directly, as that may lag or freeze the game.
+        Preferred to choosing plays on the main thread, as that may lag or freeze the game.
 
         Returns
         -------
@@ -105,13 +237,593 @@ class AIPlayer:
         """
 
         if self.ai_thread is None or not self.ai_thread.is_alive():
-            self.ai_thread = threading.Thread(target=self.ai_turn)
+            self.ai_thread = threading.Thread(target=self._work, daemon=True)
             self.ai_thread.start()
 
+    def stop(self):
+        """
+        Cancels any pending action and ends ai_thread, on game end or window close.
+
+        Returns
+        -------
+        None
+        """
+
+        self.cancelled.set()
+        self.requests.put(None)
+        self._clicks = []
+        if self._after_id is not None:
+            root.after_cancel(self._after_id)
+            self._after_id = None
+
+
+_hint_agents = {}
+
+
+def _hint_play(state, time_budget):
+    """
+    Returns the best play of the position, from the opening book or a search, in a hint worker process.
+
+    Parameters
+    ----------
+    state : GameState
+        the position, with the dice rolled
+    time_budget : float
+        seconds allowed to the search
+
+    Returns
+    -------
+    tuple[(int, int, int)]
+    """
+
+    book = default_book()
+    play = book.play(state) if book is not None else None
+    if play is not None:
+        return play
+    if time_budget not in _hint_agents:
+        _hint_agents[time_budget] = make_agent("search", time_budget=time_budget)
+    return _hint_agents[time_budget].choose_play(state)
+
+
+class HintOverlay:
+    """
+    A class used to show the best play of the human player to move, computed in a background process.
+
+    ...
+
+    The analysis runs in a one process pool, so the window stays responsive however long it takes. Whenever the
+    position changes, the analysis under way is dropped and, for the same turn, started again for the new position.
+
+    Attributes
+    ----------
+    backgammon_board : BackgammonBoard
+        the game
+    time_budget : float
+        seconds allowed to the search of a hint
+    executor : concurrent.futures.ProcessPoolExecutor, optional
+        the hint process, started with the first hint
+    future : concurrent.futures.Future, optional
+        the analysis under way
+    key : tuple, optional
+        the position, dice and turn of the analysis under way or shown
+    turn : int, optional
+        the turn a hint was asked for, None once it is over
+    items : list[int]
+        canvas items of the hint shown
+
+    Methods
+    -------
+    request():
+        Starts the analysis of the position.
+    position_changed():
+        Drops the analysis of an outdated position, starting a new one if a hint was asked for this turn.
+    clear():
+        Removes the hint from the canvas.
+    close():
+        Drops any analysis and stops the hint process.
+    """
+
+    def __init__(self, backgammon_board, time_budget=1.0):
+        """
+        Parameters
+        ----------
+        backgammon_board : BackgammonBoard
+            the game
+        time_budget : float
+            seconds allowed to the search of a hint
+        """
+
+        self.backgammon_board = backgammon_board
+        self.time_budget = time_budget
+        self.executor = None
+        self.future = None
+        self.key = None
+        self.turn = None
+        self.items = []
+        self._after_id = None
+
+    def _position(self):
+        """Returns what identifies the position: its key, sorted dice and turn."""
+
+        state = self.backgammon_board.state
+        return state.position_key(), tuple(sorted(state.dice)), state.turn
+
+    def request(self):
+        """
+        Starts the analysis of the position, if a human player is to move with dice to play.
+
+        Returns
+        -------
+        None
+        """
+
+        board = self.backgammon_board
+        ai_player = board.ai_player
+        if (len(board.dice) == 0 or board.state.winner() is not None or
+                (ai_player is not None and board.turn == ai_player.player)):
+            return
+        self.turn = board.turn
+        if self.key == self._position():
+            return
+        self._drop()
+        if len(board.state.legal_steps()) == 0:
+            return
+        if self.executor is None:
+            # spawned rather than forked, as the window and the AI thread must not be copied into the process
+            self.executor = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"))
+        self.key = self._position()
+        self.future = self.executor.submit(_hint_play, board.state.copy(), self.time_budget)
+        board.turn_label.config(text=f"Player {board.turn}'s Turn. Thinking of a hint...")
+        self._after_id = root.after(50, self._poll)
+
+    def position_changed(self):
+        """
+        Drops the analysis of an outdated position, starting a new one if a hint was asked for this turn.
+
+        Returns
+        -------
+        None
+        """
+
+        if self.key is None or self.key == self._position():
+            return
+        self._drop()
+        if self.turn == self.backgammon_board.turn:
+            self.request()
+        else:
+            self.turn = None
+
+    def _poll(self):
+        """
+        Checks, on the main thread, whether the analysis is done, and if so shows its play.
+
+        If the analysis failed or was cancelled, the player is told and can ask again; if the position changed in
+        the meantime, the turn label goes back to normal.
+
+        Returns
+        -------
+        None
+        """
+
+        self._after_id = None
+        if self.future is None:
+            return
+        if not self.future.done():
+            self._after_id = root.after(50, self._poll)
+            return
+        future, self.future = self.future, None
+        board = self.backgammon_board
+        if future.cancelled() or future.exception() is not None:
+            # the next request starts over, in a new process if this one died
+            self.key = None
+            if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+            board.turn_label.config(text=f"Player {board.turn}'s Turn. The hint failed, try again")
+            return
+        if self.key != self._position():
+            board.turn_label.config(text=f"Player {board.turn}'s Turn")
+            return
+        self._draw(future.result())
+        board.turn_label.config(text=f"Player {board.turn}'s Turn. Hint shown")
+
+    def _draw(self, play):
+        """
+        Draws the play as arrows between the columns, bear offs pointing off the board.
+
+        Parameters
+        ----------
+        play : tuple[(int, int, int)]
+            the play
+
+        Returns
+        -------
+        None
+        """
+
+        board = self.backgammon_board
+        middle_y = board.base_y + 400
+        for number, (selected_piece, clicked_column, _) in enumerate(play):
+            x_1, y_1 = board.columns[selected_piece]
+            if clicked_column is None:
+                x_2, y_2 = board.base_x + 1480, y_1
+            else:
+                x_2, y_2 = board.columns[clicked_column]
+            # moves along a row are curved towards the middle of the board, not to run over the pieces
+            if y_1 != y_2:
+                bend = (y_1 + y_2) / 2
+            else:
+                bend = y_1 + 150 if y_1 < middle_y else y_1 - 150
+            self.items.append(board.canvas.create_line(x_1, y_1, (x_1 + x_2) / 2, bend, x_2, y_2, smooth=True,
+                                                       arrow=tk.LAST, width=6, fill="#d4a017", tags="hint"))
+            self.items.append(board.canvas.create_text((x_1 + x_2) / 2, bend, text=str(number + 1),
+                                                       font=("Eras Medium ITC", 20), fill="#d4a017", tags="hint"))
+
+    def clear(self):
+        """
+        Removes the hint from the canvas.
+
+        Returns
+        -------
+        None
+        """
+
+        for item in self.items:
+            self.backgammon_board.canvas.delete(item)
+        self.items = []
+
+    def _drop(self):
+        """Cancels the analysis under way, if it has not started, ignores it otherwise, and clears the hint."""
+
+        if self.future is not None:
+            self.future.cancel()
+            self.future = None
+        if self._after_id is not None:
+            root.after_cancel(self._after_id)
+            self._after_id = None
+        self.key = None
+        self.clear()
+
+    def close(self):
+        """
+        Drops any analysis and stops the hint process, on game end or window close.
+
+        Returns
+        -------
+        None
+        """
+
+        self._drop()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+class DebugOverlay:
+    """
+    A class used to show the profiling statistics over the board, see profiling.py.
+
+    ...
+
+    Showing the overlay enables profiling and hiding it disables it again, so that the game is only instrumented
+    while watched. Each refresh also records how late it ran as the main loop lag: time the main thread spent busy
+    elsewhere, in moves, redraws or anything else, rather than in the AI's planned pauses.
+
+    Attributes
+    ----------
+    backgammon_board : BackgammonBoard
+        the game whose window shows the overlay
+    interval : int
+        milliseconds between refreshes
+    visible : bool
+        whether the overlay is shown
+
+    Methods
+    -------
+    toggle():
+        Shows or hides the overlay, enabling or disabling profiling.
+    close():
+        Hides the overlay.
+    """
+
+    def __init__(self, backgammon_board, interval=500):
+        """
+        Parameters
+        ----------
+        backgammon_board : BackgammonBoard
+            the game whose window shows the overlay
+        interval : int
+            milliseconds between refreshes
+        """
+
+        self.backgammon_board = backgammon_board
+        self.interval = interval
+        self.visible = False
+        self._after_id = None
+        self._due = None
+
+    def toggle(self):
+        """
+        Shows or hides the overlay, enabling or disabling profiling.
+
+        Returns
+        -------
+        None
+        """
+
+        if self.visible:
+            self.close()
+            return
+        self.visible = True
+        profiling.enable()
+        self._refresh()
+
+    def _refresh(self):
+        """
+        Records the main loop lag, redraws the statistics and schedules the next refresh.
+
+        Returns
+        -------
+        None
+        """
+
+        if self._due is not None:
+            profiling.record("tkinter.main_loop_lag", max(time.perf_counter() - self._due, 0.0))
+        self._draw()
+        self._due = time.perf_counter() + self.interval / 1000
+        self._after_id = root.after(self.interval, self._refresh)
+
+    def _draw(self):
+        """
+        Draws the statistics in the top left corner of the board, above everything else.
+
+        Returns
+        -------
+        None
+        """
+
+        canvas = self.backgammon_board.canvas
+        canvas.delete("debug")
+        statistics = profiling.snapshot()
+        lines = [f"{'':30}{'calls':>8}{'total ms':>11}{'mean':>9}{'p50':>9}{'p95':>9}{'max':>9}"]
+        for kind, values in sorted(statistics["latencies"].items()):
+            lines.append(f"{kind:30}{values['count']:8}{values['total_ms']:11.1f}{values['mean_ms']:9.3f}"
+                         f"{values['p50_ms']:9.3f}{values['p95_ms']:9.3f}{values['max_ms']:9.3f}")
+        for kind, values in sorted(statistics["caches"].items()):
+            lines.append(f"{kind:30} cache hits {values['hit_rate']:6.1%} of {values['hits'] + values['misses']}")
+        if self.backgammon_board.ai_player is not None:
+            lines.append(f"{'AI pause per action':30} {self.backgammon_board.ai_player.delay} ms")
+        text = canvas.create_text(self.backgammon_board.base_x + 10, self.backgammon_board.base_y + 10, anchor="nw",
+                                  text="\n".join(lines), font=("Consolas", 10), fill="#f5eee8", tags="debug")
+        background = canvas.create_rectangle(canvas.bbox(text), fill="#25190e", outline="", tags="debug")
+        canvas.tag_raise(background)
+        canvas.tag_raise(text)
+
+    def close(self):
+        """
+        Hides the overlay and disables profiling, on request, game end or window close.
+
+        Returns
+        -------
+        None
+        """
+
+        if self._after_id is not None:
+            root.after_cancel(self._after_id)
+            self._after_id = None
+        self._due = None
+        if self.visible:
+            self.visible = False
+            profiling.disable()
+            self.backgammon_board.canvas.delete("debug")
+
+
+class _Stopped(Exception):
+    """Raised in the simulation thread of a Spectator when it is stopped."""
+
+
+# seconds between two moves at normal speed, as for the AI player; None plays as fast as the agents choose
+SPEEDS = {"0.25x": 4.0, "0.5x": 2.0, "1x": 1.0, "2x": 0.5, "4x": 0.25, "instant": None}
+
+
+class Spectator:
+    """
+    A class used to play AI agents against each other, game after game, on a background thread.
+
+    ...
+
+    The thread publishes a copy of the position after every roll and move; the window shows the latest one at its
+    own frame rate, so the speed of the games never depends on drawing. The thread waits between moves according
+    to the speed, or only for steps while paused.
+
+    Attributes
+    ----------
+    agents : dict[int, object]
+        the agent of each player
+    delay : float, optional
+        seconds between two moves, None for no wait
+    variant : str
+        the starting layout of the games, see game_state.VARIANTS
+    latest : (int, GameState, dict)
+        number of the publication, position and tally of games: games played and wins per player
+    paused : threading.Event
+        set while paused
+    stopped : threading.Event
+        set once the spectator is stopped
+
+    Methods
+    -------
+    start():
+        Starts the simulation thread.
+    set_speed(delay):
+        Changes the time between two moves.
+    toggle_pause():
+        Pauses or resumes the games.
+    step():
+        Pauses the games and plays the next roll or move.
+    stop():
+        Ends the simulation thread.
+    """
+
+    def __init__(self, agents, delay=1.0, rng=None, variant="standard"):
+        """
+        Parameters
+        ----------
+        agents : dict[int, object]
+            the agent of each player
+        delay : float, optional
+            seconds between two moves, None for no wait
+        rng : random.Random, optional
+            source of the dice values
+        variant : str
+            the starting layout of the games, see game_state.VARIANTS
+        """
+
+        self.agents = agents
+        self.delay = delay
+        self.rng = random.Random() if rng is None else rng
+        self.variant = variant
+        self.games = 0
+        self.wins = {1: 0, 2: 0}
+        self.latest = (0, GameState(1, variant=variant), {"games": 0, "wins": dict(self.wins)})
+        self.paused = threading.Event()
+        self.stopped = threading.Event()
+        self._wake = threading.Event()
+        self._steps = threading.Semaphore(0)
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the simulation thread.
+
+        Returns
+        -------
+        None
+        """
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def set_speed(self, delay):
+        """
+        Changes the time between two moves, cutting short the current wait.
+
+        Parameters
+        ----------
+        delay : float, optional
+            seconds between two moves, None for no wait
+
+        Returns
+        -------
+        None
+        """
+
+        self.delay = delay
+        self._wake.set()
+
+    def toggle_pause(self):
+        """
+        Pauses or resumes the games.
+
+        Returns
+        -------
+        None
+        """
+
+        if self.paused.is_set():
+            # steps asked for but not played yet are dropped, so that the next pause stops at once
+            while self._steps.acquire(blocking=False):
+                pass
+            self.paused.clear()
+        else:
+            self.paused.set()
+
+    def step(self):
+        """
+        Pauses the games and plays the next roll or move.
+
+        Returns
+        -------
+        None
+        """
+
+        self.paused.set()
+        self._wake.set()
+        self._steps.release()
+
+    def stop(self):
+        """
+        Ends the simulation thread, at its next roll or move.
+
+        Returns
+        -------
+        None
+        """
+
+        self.stopped.set()
+        self._wake.set()
+        self._steps.release()
+
+    def _publish(self, state):
+        """Makes a copy of the position the latest one shown."""
+
+        self.latest = (self.latest[0] + 1, state.copy(), {"games": self.games, "wins": dict(self.wins)})
+
+    def _pace(self):
+        """
+        Waits before the next roll or move, according to the speed, or for a step while paused.
+
+        Raises
+        ------
+        _Stopped
+            once the spectator is stopped
+        """
+
+        if not self.paused.is_set() and self.delay is not None:
+            self._wake.wait(self.delay)
+            self._wake.clear()
+        # paused, possibly during the wait by a step: one step's permit lets one roll or move through
+        while not self.stopped.is_set() and self.paused.is_set():
+            if self._steps.acquire(timeout=0.1):
+                break
+        if self.stopped.is_set():
+            raise _Stopped()
+
+    def _run(self):
+        """
+        Main loop of the simulation thread: plays games until stopped.
+
+        Returns
+        -------
+        None
+        """
+
+        try:
+            while True:
+                state = GameState(self.rng.choice((1, 2)), variant=self.variant)
+                self._publish(state)
+                while state.winner() is None:
+                    self._pace()
+                    state.roll(self.rng)
+                    self._publish(state)
+                    play = self.agents[state.turn].choose_play(state.copy())
+                    for step in play:
+                        self._pace()
+                        state.apply_move(*step)
+                        self._publish(state)
+                    if state.winner() is None:
+                        state.end_turn()
+                self.games += 1
+                self.wins[state.winner()] += 1
+                self._publish(state)
+                self._pace()
+        except _Stopped:
+            pass
+
 
 class BackgammonBoard:
     """
-    A class used to represent the Backgammon Board with all its logic.
+    A class used to represent the Backgammon Board, drawing and controlling a headless GameState.
 
     ...
 
@@ -121,6 +833,8 @@ class BackgammonBoard:
         the visuals of the board, including pieces
     turn_label : tkinter.Label
         displays whose turn it is, with additional messages to the player(s)
+    state : GameState
+        the rules and position of the game, shared with the AI
     turn : int
         index of the player who / must make a move, 1 or 2
     light_count_label : tkinter.Label
@@ -136,42 +850,75 @@ class BackgammonBoard:
     piece_radius : int
         radius of a checkers piece
     columns : list[list[int]]
-        holds the coordinates and number of pieces of each color on each space on the board
+        holds the coordinates of each space on the board
     selected_piece : int
         the index of the column from which a piece was selected
+    ai_player : AIPlayer, optional
+        the AI player in single player mode, told when it is its turn
+    recorder : records.GameRecordWriter, optional
+        the game record file every roll and move is appended to
+    turn_roll : (int, int), optional
+        the dice rolled this turn, until the turn is recorded
+    turn_steps : list[(int, int, int)]
+        the moves made this turn, until the turn is recorded
+    undo_stack : list[(int, int, int, bool)]
+        the records of the moves made this turn, see GameState.apply_move, taken back by undo_move
+    hint_overlay : HintOverlay
+        computes and shows the best play on request
+    debug_overlay : DebugOverlay
+        shows the profiling statistics on request
+    piece_items : dict[int, dict[(int, int), int]]
+        per player, the canvas item of the piece at each (column, place in the stack)
+    spare_items : dict[int, list[int]]
+        per player, the hidden canvas items of borne off pieces
     base_x : int
         base x coordinate, relative to starting point of the element in the frame, where the canvas will be drawn
     base_y : int
         base x coordinate, relative to starting point of the element in the frame, where the canvas will be drawn
     dice : list[int]
         list of remaining move distances, based on rolled dice and moves already made
+
     Methods
     -------
     draw_piece(x, y, color):
         Draws one circular checker piece at the specified x and y coordinates, in the specified color.
+    piece_center(column, stack_index, player):
+        Returns the coordinates of the center of a piece, from its column and its place in the column's stack.
     place_pieces():
-        (re)Places all pieces on the board, according to their last saved position.
+        (re)Places all pieces on the board, moving only the pieces whose position changed.
     handle_click():
         Handles left mouse button click event from player(s).
     decide_action():
         Decides what action to take on click event.
+    undo_move():
+        Takes back the last move of a human player's turn.
+    turn_changed():
+        Lets the AI player know when the turn passes to it.
+    record_roll(dice_value_1, dice_value_2):
+        Starts recording a turn with the rolled dice.
+    record_turn():
+        Appends the roll and moves of the turn to the game record.
+    end_game(winner):
+        Records the result, stops the AI player, if any, and shows the win screen.
+    close():
+        Stops the AI player, if any, and closes the game record.
     valid_move(clicked_column, selected_piece):
         Decides whether moving selected_piece to clicked_column is a valid move.
     valid_move_exists():
         Decides if there are any possible valid moves left in the current game state.
     redraw_board():
-        Redraws all elements of the board, including pieces.
+        Redraws the pieces whose position changed.
     draw_board():
         Draws the board itself: border, background, triangles.
     get_clicked_column(x_coord, y_coord):
         Decides which column / space corresponds to the given coordinates, if any.
     """
 
-    def __init__(self, canvas, turn_label, turn, light_count_label, dark_count_label, game_window):
+    def __init__(self, canvas, turn_label, turn, light_count_label, dark_count_label, game_window, variant="standard"):
         """
         Provides all the necessary attributes to simulate a backgammon game board.
 
-        Sets the initial piece positions and the column coordinates.
+        Sets the column coordinates; the initial piece positions come from the GameState.
 
         Parameters
         ----------
@@ -187,40 +934,60 @@ class BackgammonBoard:
             displays how many pieces player 2 bore off
         game_window : tkinter.Frame
             contains all the information of the game screen, to be deleted on win screen transition
+        variant : str
+            the starting layout, see game_state.VARIANTS
         """
 
         self.game_window = game_window
         self.light_count_label = light_count_label
         self.dark_count_label = dark_count_label
-        self.light_count = 0
-        self.dark_count = 0
         self.turn_label = turn_label
         self.canvas = canvas
+        self.state = GameState(turn, variant=variant)
         self.piece_radius = 35
-        self.columns = [[0, 0, 0, 0]] * 25
+        self.columns = [[0, 0]] * 25
         self.selected_piece = None
+        self.ai_player = None
+        self.recorder = None
+        self.turn_roll = None
+        self.turn_steps = []
+        self.undo_stack = []
+        self.hint_overlay = HintOverlay(self)
+        self.debug_overlay = DebugOverlay(self)
+        self.piece_items = {1: {}, 2: {}}
+        self.spare_items = {1: [], 2: []}
         self.base_x = 50
         self.base_y = 50
-        self.turn = turn
-        self.dice = []
         for i in range(6):
             x_left = self.base_x + 35 + i * 105
             x_right = x_left + 95
             y_top_base = self.base_y + 30
             y_bottom_base = self.base_y + 770
-            self.columns[11 - i] = [(x_left + x_right) / 2, y_top_base, 0, 0]
-            self.columns[5 - i] = [(x_left + x_right) / 2 + 710, y_top_base, 0, 0]
-            self.columns[12 + i] = [(x_left + x_right) / 2, y_bottom_base, 0, 0]
-            self.columns[18 + i] = [(x_left + x_right) / 2 + 710, y_bottom_base, 0, 0]
-            self.columns[0][2] = 2
-            self.columns[5][3] = 5
-            self.columns[7][3] = 3
-            self.columns[11][2] = 5
-            self.columns[12][3] = 5
-            self.columns[16][2] = 3
-            self.columns[18][2] = 5
-            self.columns[23][3] = 2
-        self.columns[24] = [self.base_x+700, self.base_y + 400, 0, 0]
+            self.columns[11 - i] = [(x_left + x_right) / 2, y_top_base]
+            self.columns[5 - i] = [(x_left + x_right) / 2 + 710, y_top_base]
+            self.columns[12 + i] = [(x_left + x_right) / 2, y_bottom_base]
+            self.columns[18 + i] = [(x_left + x_right) / 2 + 710, y_bottom_base]
+        self.columns[24] = [self.base_x+700, self.base_y + 400]
+
+    @property
+    def turn(self):
+        """Index of the player who / must make a move, kept by the GameState."""
+        return self.state.turn
+
+    @property
+    def dice(self):
+        """Remaining move distances, kept by the GameState."""
+        return self.state.dice
+
+    @property
+    def light_count(self):
+        """Number of pieces borne off by player 1, kept by the GameState."""
+        return self.state.light_count
+
+    @property
+    def dark_count(self):
+        """Number of pieces borne off by player 2, kept by the GameState."""
+        return self.state.dark_count
 
     def draw_piece(self, x, y, color):
         """
@@ -237,42 +1004,76 @@ class BackgammonBoard:
 
         Returns
         -------
-        None
+        int
+            id of the canvas item
+        """
+
+        return self.canvas.create_oval(x - self.piece_radius, y - self.piece_radius,
+                                       x + self.piece_radius, y + self.piece_radius, fill=color, tags="piece")
+
+    def piece_center(self, column, stack_index, player):
+        """
+        Returns the coordinates of the center of a piece, from its column and its place in the column's stack.
+
+        Pieces are stacked from the edge towards the middle of the board, 5 per row, further rows being shifted.
+
+        Parameters
+        ----------
+        column : int
+            index of the column, 0 to 24
+        stack_index : int
+            place of the piece in the stack, 0 being the closest to the edge
+        player : int
+            index of the player owning the piece, 1 or 2
+
+        Returns
+        -------
+        (float, float)
         """
 
-        self.canvas.create_oval(x - self.piece_radius, y - self.piece_radius,
-                                x + self.piece_radius, y + self.piece_radius, fill=color)
+        x = self.columns[column][0] + self.piece_radius * (stack_index // 5) / 2
+        offset = 2 * (stack_index % 5) * self.piece_radius + self.piece_radius
+        if column < 12 or (column == 24 and player == 2):
+            return x, self.columns[column][1] + offset
+        return x, self.columns[column][1] - offset
 
     def place_pieces(self):
         """
         (re)Places all pieces on the board, according to their last saved position.
 
+        Each piece is a persistent canvas item, remembered by its column and place in the stack. Only the items whose
+        place changed are moved; items of borne off pieces are hidden and reused when needed.
+
         Returns
         -------
         None
         """
 
-        for i, column in enumerate(self.columns):
-            for j in range(column[2]):
-                if i < 12:
-                    self.draw_piece(column[0]+self.piece_radius*(j//5)/2, column[1] + 2 * (j % 5) * self.piece_radius +
-                                    self.piece_radius, "#ebddd1")
-                elif i < 24:
-                    self.draw_piece(column[0]+self.piece_radius*(j//5)/2, column[1] - 2 * (j % 5) * self.piece_radius -
-                                    self.piece_radius, "#ebddd1")
-                else:
-                    self.draw_piece(column[0] + self.piece_radius * (j // 5) / 2,
-                                    column[1] - 2 * (j % 5) * self.piece_radius - self.piece_radius, "#ebddd1")
-            for j in range(column[3]):
-                if i < 12:
-                    self.draw_piece(column[0]+self.piece_radius*(j//5)/2, column[1] + 2 * (j % 5) * self.piece_radius +
-                                    self.piece_radius, "#25190e")
-                elif i < 24:
-                    self.draw_piece(column[0]+self.piece_radius*(j//5)/2, column[1] - 2 * (j % 5) * self.piece_radius -
-                                    self.piece_radius, "#25190e")
+        for player, color in ((1, "#ebddd1"), (2, "#25190e")):
+            placed = self.piece_items[player]
+            spare = self.spare_items[player]
+            wanted = [(i, j) for i in range(25) for j in range(self.state.count(i, player))]
+            wanted_set = set(wanted)
+            freed = [placed.pop(place) for place in [place for place in placed if place not in wanted_set]]
+            for column, stack_index in wanted:
+                if (column, stack_index) in placed:
+                    continue
+                x, y = self.piece_center(column, stack_index, player)
+                if len(freed) > 0:
+                    item = freed.pop()
+                elif len(spare) > 0:
+                    item = spare.pop()
+                    self.canvas.itemconfig(item, state="normal")
                 else:
-                    self.draw_piece(column[0] + self.piece_radius * (j // 5) / 2,
-                                    column[1] + 2 * (j % 5) * self.piece_radius + self.piece_radius, "#25190e")
+                    placed[(column, stack_index)] = self.draw_piece(x, y, color)
+                    continue
+                self.canvas.coords(item, x - self.piece_radius, y - self.piece_radius,
+                                   x + self.piece_radius, y + self.piece_radius)
+                self.canvas.tag_raise(item)
+                placed[(column, stack_index)] = item
+            for item in freed:
+                self.canvas.itemconfig(item, state="hidden")
+                spare.append(item)
 
     def handle_click(self, event):
         """
@@ -296,9 +1097,10 @@ class BackgammonBoard:
         """
         Decides what action to take on click event.
 
-        If no selected piece, set clicked column as selected. If piece already selected check if move is valid.
-        If move is not valid, let the player know. If player has no more valid moves, let the player know.
-        Change turns and declare winner when viable.
+        If no selected piece, set clicked column as selected. If piece already selected check if move starts a legal
+        full-turn play, which must use as many dice as possible. If move is not valid, let the player know. If player
+        has no more valid moves, let the player know. Change turns, telling the AI player, and declare winner when
+        viable.
 
         Parameters
         ----------
@@ -311,53 +1113,156 @@ class BackgammonBoard:
         """
 
         if len(self.dice) > 0:
-            if self.valid_move_exists()[0]:
+            if len(self.state.legal_steps()) > 0:
+                turn_over = False
                 if self.selected_piece is None:
-                    if (clicked_column is not None and self.columns[clicked_column][self.turn + 1] > 0 and
-                            (self.columns[24][self.turn+1] == 0 or clicked_column == 24)):
+                    if (clicked_column is not None and self.state.count(clicked_column, self.turn) > 0 and
+                            (self.state.count(24, self.turn) == 0 or clicked_column == 24)):
                         self.selected_piece = clicked_column
                         self.turn_label.config(text=f"Player {self.turn}'s Turn. Selected col {clicked_column}")
                 else:
-                    valid = self.valid_move(clicked_column, self.selected_piece)
-                    if valid[0]:
-                        self.dice.remove(valid[1])
+                    dice_value = self.state.legal_step(self.selected_piece, clicked_column)
+                    if dice_value is not None:
+                        self.undo_stack.append(self.state.apply_move(self.selected_piece, clicked_column, dice_value))
+                        self.turn_steps.append((self.selected_piece, clicked_column, dice_value))
                         if clicked_column is None:
                             if self.turn == 1:
-                                self.light_count += 1
                                 self.light_count_label.config(text=f"W x {self.light_count}")
-                                if self.light_count == 15:
-                                    root.after(1000, lambda: win_screen(self.game_window, 1))
+                                if self.light_count == self.state.pieces:
+                                    self.end_game(1)
                             else:
-                                self.dark_count += 1
                                 self.dark_count_label.config(text=f"B x {self.dark_count}")
-                                if self.dark_count == 15:
-                                    root.after(1000, lambda: win_screen(self.game_window, 2))
-                        else:
-                            if self.turn == 1 and self.columns[clicked_column][3] == 1:
-                                self.columns[clicked_column][3] = 0
-                                self.columns[24][3] += 1
-                            elif self.turn == 2 and self.columns[clicked_column][2] == 1:
-                                self.columns[clicked_column][2] = 0
-                                self.columns[24][2] += 1
-                            self.columns[clicked_column][self.turn+1] += 1
-                        self.columns[self.selected_piece][self.turn + 1] -= 1
+                                if self.dark_count == self.state.pieces:
+                                    self.end_game(2)
                         self.selected_piece = None
-                        if len(self.dice) == 0:
-                            self.turn = self.turn % 2 + 1
+                        if len(self.dice) == 0 and self.state.winner() is None:
+                            self.record_turn()
+                            self.state.end_turn()
+                            turn_over = True
                         self.turn_label.config(text=f"Player {self.turn}'s Turn")
                 self.redraw_board()
+                if turn_over:
+                    self.turn_changed()
             else:
                 self.selected_piece = None
-                self.dice = []
-                self.turn = self.turn % 2 + 1
+                self.record_turn()
+                self.state.end_turn()
                 self.turn_label.config(text=f"No more valid moves! Player {self.turn}'s Turn")
+                self.turn_changed()
+        self.hint_overlay.position_changed()
+
+    def undo_move(self):
+        """
+        Takes back the last move of a human player's turn, moving the pieces and borne off counts back.
+
+        Only the moves of the current turn can be taken back: the turn is recorded once all dice are used.
+
+        Returns
+        -------
+        None
+        """
+
+        if (len(self.undo_stack) == 0 or self.state.winner() is not None or
+                (self.ai_player is not None and self.turn == self.ai_player.player)):
+            return
+        self.state.undo_move(self.undo_stack.pop())
+        self.turn_steps.pop()
+        self.selected_piece = None
+        self.light_count_label.config(text=f"W x {self.light_count}")
+        self.dark_count_label.config(text=f"B x {self.dark_count}")
+        self.turn_label.config(text=f"Player {self.turn}'s Turn. Move undone")
+        self.redraw_board()
+        self.hint_overlay.position_changed()
+
+    def turn_changed(self):
+        """
+        Lets the AI player know when the turn passes to it.
+
+        Returns
+        -------
+        None
+        """
+
+        if self.ai_player is not None and self.turn == self.ai_player.player:
+            self.ai_player.ai_turn()
+
+    def record_roll(self, dice_value_1, dice_value_2):
+        """
+        Starts recording a turn with the rolled dice.
+
+        Parameters
+        ----------
+        dice_value_1 : int
+            value of the first die
+        dice_value_2 : int
+            value of the second die
+
+        Returns
+        -------
+        None
+        """
+
+        self.turn_roll = (dice_value_1, dice_value_2)
+        self.turn_steps = []
+
+    def record_turn(self):
+        """
+        Appends the roll and moves of the turn to the game record, if any.
+
+        Returns
+        -------
+        None
+        """
+
+        if self.recorder is not None and self.turn_roll is not None:
+            self.recorder.write_turn(self.turn_roll, self.turn_steps)
+        self.turn_roll = None
+        self.turn_steps = []
+        self.undo_stack = []
+
+    def end_game(self, winner):
+        """
+        Records the result, stops the AI player, if any, and shows the win screen.
+
+        Parameters
+        ----------
+        winner : int
+            the index of the winning player, 1 or 2
+
+        Returns
+        -------
+        None
+        """
+
+        self.record_turn()
+        if self.recorder is not None:
+            self.recorder.end_game(winner, game_points(self.state, winner))
+        self.close()
+        root.after(1000, lambda: win_screen(self.game_window, winner))
+
+    def close(self):
+        """
+        Stops the AI player, if any, the hint process and the profiling overlay and closes the game record, on game
+        end or window close.
+
+        Returns
+        -------
+        None
+        """
+
+        if self.ai_player is not None:
+            self.ai_player.stop()
+        self.hint_overlay.close()
+        self.debug_overlay.close()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
 
     def valid_move(self, clicked_column, selected_piece):
         """
         Decides whether moving selected_piece to clicked_column is a valid move.
 
-        It respects all the original rules of the game. It also returns which dice move was used, so that it can be
-        removed from the list.
+        The rules live in GameState.valid_move; see there.
 
         Parameters
         ----------
@@ -371,98 +1276,35 @@ class BackgammonBoard:
         (bool, int)
         """
 
-        if clicked_column is None:
-            if self.turn == 1:
-                for i in range(18):
-                    if self.columns[i][2] != 0:
-                        return False, None
-            else:
-                for i in range(18):
-                    if self.columns[i+6][3] != 0:
-                        return False, None
-        if clicked_column == 24:
-            return False, None
-        if self.turn == 1:
-            if clicked_column is not None and self.columns[clicked_column][3] > 1:
-                return False, None
-            if clicked_column is None:
-                if 24 - selected_piece in self.dice:
-                    return True, 24 - selected_piece
-                for i in range(24 - selected_piece, 6):
-                    if self.columns[23-i][2] != 0:
-                        return False, None
-                max_dice = max(self.dice)
-                if max_dice > 24 - selected_piece:
-                    return True, max_dice
-                return False, None
-            move = clicked_column - selected_piece % 24 + selected_piece // 24
-            if move in self.dice:
-                return True, move
-            return False, None
-        else:
-            if clicked_column is not None and self.columns[clicked_column][2] > 1:
-                return False, None
-            if clicked_column is None:
-                if selected_piece+1 in self.dice:
-                    return True, selected_piece+1
-                for i in range(selected_piece+1, 6):
-                    if self.columns[i][3] != 0:
-                        return False, None
-                max_dice = max(self.dice)
-                if max_dice > selected_piece+1:
-                    return True, max_dice
-                return False, None
-            else:
-                move = selected_piece - clicked_column
-                if move in self.dice:
-                    return True, move
-            return False, None
+        return self.state.valid_move(clicked_column, selected_piece)
 
     def valid_move_exists(self):
         """
         Decides if there are any possible valid moves left in the current game state.
 
-        It respects all the original rules of the game. All moves are checked from lowest to highest index.
-        Returns bool, clicked_column and selected_piece, in that order.
+        The rules live in GameState.valid_move_exists; see there.
 
         Returns
         -------
         (bool, int, int)
         """
-        valid_moves = []
-        if self.columns[24][self.turn+1] != 0:
-            for i in range(24):
-                if self.valid_move(i, 24)[0]:
-                    valid_moves.append((i, 24))
-        else:
-            for i in range(24):
-                if self.columns[i][self.turn+1] != 0:
-                    for j in range(24):
-                        if self.valid_move(j, i)[0]:
-                            valid_moves.append((j, i))
-                    if self.valid_move(None, i)[0]:
-                        valid_moves.append((None, i))
-        if len(valid_moves) == 0:
-            return False, None, None
-        move = random.choice(valid_moves)
-        return True, move[0], move[1]
+
+        return self.state.valid_move_exists()
 
     def redraw_board(self):
         """
-        Redraws all elements of the board, including pieces.
+        Redraws the pieces whose position changed; the board itself is drawn once, by draw_board.
 
         Returns
         -------
         None
         """
 
-        self.canvas.delete("all")
-        self.draw_board()
         self.place_pieces()
 
     def draw_board(self):
         """
-        Draws the board itself: border, background, triangles.
+        Draws the board itself: border, background, triangles, tagged "board". Called once per game.
 
         Returns
         -------
@@ -470,11 +1312,11 @@ class BackgammonBoard:
         """
 
         self.canvas.create_rectangle(self.base_x, self.base_y, self.base_x + 1400, self.base_y + 800,
-                                     outline="#654426", fill="#90663f")
+                                     outline="#654426", fill="#90663f", tags="board")
         self.canvas.create_rectangle(self.base_x + 30, self.base_y + 30, self.base_x + 660, self.base_y + 770,
-                                     outline="#654426", fill="#c9a583")
+                                     outline="#654426", fill="#c9a583", tags="board")
         self.canvas.create_rectangle(self.base_x + 740, self.base_y + 30, self.base_x + 1370, self.base_y + 770,
-                                     outline="#654426", fill="#c9a583")
+                                     outline="#654426", fill="#c9a583", tags="board")
         for i in range(6):
             x_left = self.base_x + 35 + i * 105
             x_right = x_left + 95
@@ -490,14 +1332,14 @@ class BackgammonBoard:
                 fill_color_top = "#f5eee8"
                 fill_color_bottom = "#654426"
             self.canvas.create_polygon(x_left, y_top_base, x_right, y_top_base, (x_left + x_right) / 2, y_top_tip,
-                                       outline="#654426", fill=fill_color_top)
+                                       outline="#654426", fill=fill_color_top, tags="board")
             self.canvas.create_polygon(x_left + 710, y_top_base, x_right + 710, y_top_base, (x_left + x_right) / 2 +
-                                       710, y_top_tip, outline="#654426", fill=fill_color_top)
+                                       710, y_top_tip, outline="#654426", fill=fill_color_top, tags="board")
             self.canvas.create_polygon(x_left, y_bottom_base, x_right, y_bottom_base, (x_left + x_right) / 2,
-                                       y_bottom_tip, outline="#654426", fill=fill_color_bottom)
+                                       y_bottom_tip, outline="#654426", fill=fill_color_bottom, tags="board")
             self.canvas.create_polygon(x_left + 710, y_bottom_base, x_right + 710, y_bottom_base,
                                        (x_left + x_right) / 2 + 710, y_bottom_tip, outline="#654426",
-                                       fill=fill_color_bottom)
+                                       fill=fill_color_bottom, tags="board")
 
     def get_clicked_column(self, x_coord, y_coord):
         """
@@ -542,10 +1384,8 @@ def roll_dice(result_label, backgammon_board):
         dice_value_1 = random.randint(1, 6)
         dice_value_2 = random.randint(1, 6)
         result_label.config(text=f"{dice_value_1}, {dice_value_2}", font=("Eras Medium ITC", 50))
-        if dice_value_1 == dice_value_2:
-            backgammon_board.dice = [dice_value_1] * 4
-        else:
-            backgammon_board.dice = [dice_value_1, dice_value_2]
+        backgammon_board.state.set_dice(dice_value_1, dice_value_2)
+        backgammon_board.record_roll(dice_value_1, dice_value_2)
 
 
 def roll_turn(result_label, player_nr):
@@ -570,7 +1410,8 @@ def roll_turn(result_label, player_nr):
         result_label.config(text=f"Player {player_nr}: {dice_value_1}, {dice_value_2}", font=("Eras Medium ITC", 50))
 
 
-def check_who_starts(result_label_1, result_label_2, winner_label, dice_frame, game_mode):
+def check_who_starts(result_label_1, result_label_2, winner_label, dice_frame, game_mode, difficulty="random",
+                     variant="standard"):
     """
     Rolls two dice for preliminary rolls, displaying the resulting integers.
 
@@ -586,7 +1427,10 @@ def check_who_starts(result_label_1, result_label_2, winner_label, dice_frame, g
         holds all preliminary screen information, for deletion on screen transition
     game_mode : int
         number of human players, 1 or 2, for propagation on screen transition
-
+    difficulty : str
+        name of the AI agent in single player mode, for propagation on screen transition
+    variant : str
+        the starting layout, for propagation on screen transition
 
     Returns
     -------
@@ -613,7 +1457,7 @@ def check_who_starts(result_label_1, result_label_2, winner_label, dice_frame, g
         else:
             winner = 1 if sum(rolls_1) > sum(rolls_2) else 2
             winner_label.config(text=f"Player {winner} wins!")
-            root.after(3000, lambda: start_game(game_mode, dice_frame, winner))
+            root.after(3000, lambda: start_game(game_mode, dice_frame, winner, difficulty, variant))
 
 
 def deselect_piece(backgammon_board):
@@ -663,12 +1507,12 @@ def win_screen(game_window, winner):
     back_button.pack()
 
 
-def start_game(game_mode, preliminary_frame, starting_player):
+def start_game(game_mode, preliminary_frame, starting_player, difficulty="random", variant="standard"):
     """
     Generates UI of game screen after turns are decided.
 
     Displays whose turn it is, the game board, rolled dice values and number of borne off pieces per player.
-    Offers dice roll and piece deselect buttons.
+    Offers dice roll, piece deselect, move undo and hint buttons; F3 shows the profiling overlay.
 
     Parameters
     ----------
@@ -678,6 +1522,10 @@ def start_game(game_mode, preliminary_frame, starting_player):
         holds all the content of the previous screen, for deletion
     starting_player : int
         index of player who goes first, 1 or 2
+    difficulty : str
+        name of the AI agent in single player mode, see agents.DIFFICULTIES
+    variant : str
+        the starting layout, see game_state.VARIANTS
 
     Returns
     -------
@@ -718,20 +1566,38 @@ def start_game(game_mode, preliminary_frame, starting_player):
     deselect_button = tk.Button(borne_off_frame, text="Deselect piece", bg="#f5eee8", fg="#654426",
                                 command=lambda: deselect_piece(backgammon_board), font=("Eras Medium ITC", 20))
     deselect_button.pack(pady=10)
+    undo_button = tk.Button(borne_off_frame, text="Undo move", bg="#f5eee8", fg="#654426",
+                            command=lambda: backgammon_board.undo_move(), font=("Eras Medium ITC", 20))
+    undo_button.pack(pady=10)
+    hint_button = tk.Button(borne_off_frame, text="Hint", bg="#f5eee8", fg="#654426",
+                            command=lambda: backgammon_board.hint_overlay.request(), font=("Eras Medium ITC", 20))
+    hint_button.pack(pady=10)
 
     canvas = tk.Canvas(game_window, bg="#f5eee8", highlightthickness=0)
     canvas.pack(expand=True, fill=tk.BOTH)
     backgammon_board = BackgammonBoard(canvas, turn_label, starting_player, light_count_label, dark_count_label,
-                                       game_window)
+                                       game_window, variant)
     canvas.bind("<Button-1>", backgammon_board.handle_click)
     backgammon_board.draw_board()
     backgammon_board.place_pieces()
+    # records are replayed from the standard layout
+    if variant == "standard":
+        try:
+            backgammon_board.recorder = GameRecordWriter()
+            backgammon_board.recorder.start_game(starting_player)
+        except OSError:
+            # the game is still playable where the record file cannot be written
+            backgammon_board.recorder = None
+    root.protocol("WM_DELETE_WINDOW", lambda: (backgammon_board.close(), root.destroy()))
+    root.bind("<F3>", lambda event: backgammon_board.debug_overlay.toggle())
     if game_mode == 1:
-        ai_player = AIPlayer(backgammon_board, result_label)
+        ai_player = AIPlayer(backgammon_board, result_label, make_agent(difficulty), difficulty in BOOK_AGENTS)
+        backgammon_board.ai_player = ai_player
         ai_player.start_ai_thread()
+        backgammon_board.turn_changed()
 
 
-def preliminary_rolls(game_mode, start_menu):
+def preliminary_rolls(game_mode, start_menu, difficulty="random", variant="standard"):
     """
     Generates UI of game screen where turns are decided.
 
@@ -744,6 +1610,10 @@ def preliminary_rolls(game_mode, start_menu):
         number of human players, 1 or 2
     start_menu : tkinter.Frame
         holds all the content of the previous screen, for deletion
+    difficulty : str
+        name of the AI agent in single player mode, see agents.DIFFICULTIES
+    variant : str
+        the starting layout, see game_state.VARIANTS
 
     Returns
     -------
@@ -764,7 +1634,7 @@ def preliminary_rolls(game_mode, start_menu):
     roll_button_1 = tk.Button(dice_frame, text="Roll Dice", bg="#90663f", fg="#f5eee8",
                               command=lambda: (roll_turn(result_label_1, 1),
                                                check_who_starts(result_label_1, result_label_2, winner_label,
-                                                                dice_frame, game_mode)),
+                                                                dice_frame, game_mode, difficulty, variant)),
                               font=("Eras Medium ITC", 20))
     roll_button_1.pack(pady=10)
     result_label_2 = tk.Label(dice_frame, text="Player2: ", bg="#654426", fg="#f5eee8", font=("Eras Medium ITC", 50))
@@ -773,16 +1643,135 @@ def preliminary_rolls(game_mode, start_menu):
         roll_button_2 = tk.Button(dice_frame, text="Roll Dice", bg="#90663f", fg="#f5eee8",
                                   command=lambda: (roll_turn(result_label_2, 2),
                                                    check_who_starts(result_label_1, result_label_2, winner_label,
-                                                                    dice_frame, game_mode)),
+                                                                    dice_frame, game_mode, difficulty, variant)),
                                   font=("Eras Medium ITC", 20))
         roll_button_2.pack(pady=10)
     else:
         roll_turn(result_label_2, 2)
 
 
+def spectate(start_menu, difficulty_1, difficulty_2, variant="standard", frame_rate=30):
+    """
+    Generates UI of the spectator screen, where two AI agents play game after game.
+
+    The games run on a Spectator thread; the board shows its latest position at most frame_rate times a second,
+    moving only the pieces that changed. Offers pause, step and speed controls; F3 shows the profiling overlay.
+
+    Parameters
+    ----------
+    start_menu : tkinter.Frame
+        holds all the content of the previous screen, for deletion
+    difficulty_1 : str
+        name of the agent of player 1, see agents.DIFFICULTIES
+    difficulty_2 : str
+        name of the agent of player 2
+    variant : str
+        the starting layout of the games, see game_state.VARIANTS
+    frame_rate : int
+        maximum number of times the board is redrawn per second
+
+    Returns
+    -------
+    None
+    """
+
+    start_menu.destroy()
+    game_window = tk.Frame(root, bg="#f5eee8")
+    game_window.pack(fill=tk.BOTH, expand=True)
+
+    turn_label = tk.Label(game_window, text=f"{difficulty_1} vs {difficulty_2}", bg="#654426", fg="#f5eee8",
+                          font=("Eras Medium ITC", 30), height=2)
+    turn_label.pack(side=tk.TOP, fill=tk.BOTH)
+
+    control_frame = tk.Frame(game_window, bg="#654426")
+    control_frame.pack(side=tk.RIGHT, fill=tk.BOTH)
+    result_label = tk.Label(control_frame, text="", bg="#654426", fg="#f5eee8", font=("Eras Medium ITC", 50))
+    result_label.pack(pady=(200, 10), padx=50)
+    tally_label = tk.Label(control_frame, text="", bg="#654426", fg="#f5eee8", font=("Eras Medium ITC", 20))
+    tally_label.pack(pady=10)
+    pause_button = tk.Button(control_frame, text="Pause", bg="#90663f", fg="#f5eee8",
+                             font=("Eras Medium ITC", 20))
+    pause_button.pack(pady=10)
+    step_button = tk.Button(control_frame, text="Step", bg="#90663f", fg="#f5eee8", font=("Eras Medium ITC", 20))
+    step_button.pack(pady=10)
+    speed = tk.StringVar(control_frame, "1x")
+    speed_menu = tk.OptionMenu(control_frame, speed, *SPEEDS)
+    speed_menu.config(width=8, bg="#90663f", fg="#f5eee8", font=("Eras Medium ITC", 20))
+    speed_menu.pack(pady=10)
+    menu_button = tk.Button(control_frame, text="Main menu", bg="#90663f", fg="#f5eee8",
+                            font=("Eras Medium ITC", 20))
+    menu_button.pack(pady=10)
+
+    borne_off_frame = tk.Frame(game_window, bg="#f5eee8")
+    borne_off_frame.pack(side=tk.RIGHT, fill=tk.BOTH)
+    borne_label = tk.Label(borne_off_frame, text="Borne:", bg="#f5eee8", fg="#654426",
+                           font=("Eras Medium ITC", 25))
+    borne_label.pack(pady=(300, 10), padx=50)
+    light_count_label = tk.Label(borne_off_frame, text="W x 0", bg="#f5eee8", fg="#654426",
+                                 font=("Eras Medium ITC", 20))
+    light_count_label.pack(pady=5)
+    dark_count_label = tk.Label(borne_off_frame, text="B x 0", bg="#f5eee8", fg="#654426",
+                                font=("Eras Medium ITC", 20))
+    dark_count_label.pack(pady=5)
+
+    canvas = tk.Canvas(game_window, bg="#f5eee8", highlightthickness=0)
+    canvas.pack(expand=True, fill=tk.BOTH)
+    backgammon_board = BackgammonBoard(canvas, turn_label, 1, light_count_label, dark_count_label, game_window,
+                                       variant)
+    backgammon_board.draw_board()
+    backgammon_board.place_pieces()
+
+    spectator = Spectator({1: make_agent(difficulty_1), 2: make_agent(difficulty_2)}, variant=variant)
+    shown = [0]
+    after_id = [None]
+
+    def render():
+        number, state, tally = spectator.latest
+        if number != shown[0]:
+            shown[0] = number
+            backgammon_board.state = state
+            backgammon_board.place_pieces()
+            light_count_label.config(text=f"W x {state.light_count}")
+            dark_count_label.config(text=f"B x {state.dark_count}")
+            result_label.config(text=", ".join(str(dice_value) for dice_value in state.dice))
+            winner = state.winner()
+            turn_label.config(text=f"Game {tally['games'] + (winner is None)}: " +
+                              (f"Player {winner} won" if winner is not None else f"Player {state.turn}'s Turn"))
+            tally_label.config(text=f"{difficulty_1}: {tally['wins'][1]}\n{difficulty_2}: {tally['wins'][2]}")
+        after_id[0] = root.after(1000 // frame_rate, render)
+
+    def toggle_pause():
+        spectator.toggle_pause()
+        pause_button.config(text="Resume" if spectator.paused.is_set() else "Pause")
+
+    def step():
+        spectator.step()
+        pause_button.config(text="Resume")
+
+    def close():
+        spectator.stop()
+        backgammon_board.debug_overlay.close()
+        if after_id[0] is not None:
+            root.after_cancel(after_id[0])
+
+    def back_to_menu():
+        close()
+        create_start_menu(game_window)
+
+    pause_button.config(command=toggle_pause)
+    step_button.config(command=step)
+    menu_button.config(command=back_to_menu)
+    speed.trace_add("write", lambda *_: spectator.set_speed(SPEEDS[speed.get()]))
+    root.protocol("WM_DELETE_WINDOW", lambda: (close(), root.destroy()))
+    root.bind("<F3>", lambda event: backgammon_board.debug_overlay.toggle())
+    spectator.start()
+    render()
+
+
 def create_start_menu(win_frame=None):
     """
-    Generates UI of main menu screen, where players can decide between the 2 game modes
+    Generates UI of main menu screen, where players can decide between the 2 game modes, the starting layout and the
+    AI difficulty, or watch two AI agents play
 
     Parameters
     ----------
@@ -807,16 +1796,47 @@ def create_start_menu(win_frame=None):
                                font=("Eras Medium ITC", 40))
     game_mode_label.pack(pady=40)
 
+    variant = tk.StringVar(start_menu, "standard")
+    variant_menu = tk.OptionMenu(start_menu, variant, *VARIANTS)
+    variant_menu.config(width=20, bg="#90663f", fg="#f5eee8", font=("Eras Medium ITC", 20))
+    variant_menu.pack(pady=10)
+
     button_2_players = tk.Button(start_menu, text="2 Players (local coop)", width=20, bg="#90663f", fg="#f5eee8",
-                                 command=lambda: preliminary_rolls(2, start_menu), font=("Eras Medium ITC", 30))
+                                 command=lambda: preliminary_rolls(2, start_menu, variant=variant.get()),
+                                 font=("Eras Medium ITC", 30))
     button_2_players.pack(pady=10)
 
+    difficulty = tk.StringVar(start_menu, "random")
     button_1_player = tk.Button(start_menu, text="1 Player (vs AI)", width=20, bg="#90663f", fg="#f5eee8",
-                                command=lambda: preliminary_rolls(1, start_menu), font=("Eras Medium ITC", 30))
+                                command=lambda: preliminary_rolls(1, start_menu, difficulty.get(), variant.get()),
+                                font=("Eras Medium ITC", 30))
     button_1_player.pack(pady=10)
 
+    difficulty_menu = tk.OptionMenu(start_menu, difficulty, *DIFFICULTIES)
+    difficulty_menu.config(width=20, bg="#90663f", fg="#f5eee8", font=("Eras Medium ITC", 20))
+    difficulty_menu.pack(pady=10)
+
+    opponent_difficulty = tk.StringVar(start_menu, "heuristic")
+    button_spectate = tk.Button(start_menu, text="Watch AI vs AI", width=20, bg="#90663f", fg="#f5eee8",
+                                command=lambda: spectate(start_menu, difficulty.get(), opponent_difficulty.get(),
+                                                         variant.get()),
+                                font=("Eras Medium ITC", 30))
+    button_spectate.pack(pady=10)
+
+    opponent_menu = tk.OptionMenu(start_menu, opponent_difficulty, *DIFFICULTIES)
+    opponent_menu.config(width=20, bg="#90663f", fg="#f5eee8", font=("Eras Medium ITC", 20))
+    opponent_menu.pack(pady=10)
+
+
+# timed while profiling is enabled, see profiling.py
+profiling.register(BackgammonBoard, "decide_action")
+profiling.register(BackgammonBoard, "redraw_board")
+profiling.register(AIPlayer, "_decide", "AIPlayer.decision")
+
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "simulate":
+        sys.exit(simulate.main(sys.argv[2:]))
     root = tk.Tk()
     root.title("Backgammon")
     root.geometry("1920x1080")
@@ -0,0 +1,207 @@
+import numpy as np
+from bearoff import default_database
+from game_state import LIGHT_BAR, DARK_BAR
+
+
+# slots of the stacked boards: the 24 points, then the bar and the borne off pieces, like columns[i][2:4] of the
+# original board with a column for each player
+BAR_SLOT = 24
+OFF_SLOT = 25
+
+
+def stack_keys(keys):
+    """
+    Stacks positions, given by their position keys, into an (N, 26, 2) array of piece counts.
+
+    boards[n, i, 0] and boards[n, i, 1] are the numbers of pieces of player 1 and player 2 on point i for i < 24,
+    on the bar for i = BAR_SLOT and borne off for i = OFF_SLOT.
+
+    Parameters
+    ----------
+    keys : sequence[bytes]
+        see GameState.position_key and GameState.legal_positions
+
+    Returns
+    -------
+    numpy.ndarray
+        int8 array of shape (len(keys), 26, 2)
+    """
+
+    # a key is the signed board of 26 bytes followed by the borne off counts of both players
+    signed = np.frombuffer(b"".join(keys), dtype=np.int8).reshape(len(keys), 28)
+    boards = np.empty((len(keys), 26, 2), dtype=np.int8)
+    boards[:, :24, 0] = np.maximum(signed[:, :24], 0)
+    boards[:, :24, 1] = np.maximum(-signed[:, :24], 0)
+    boards[:, BAR_SLOT, 0] = signed[:, LIGHT_BAR]
+    boards[:, BAR_SLOT, 1] = signed[:, DARK_BAR]
+    boards[:, OFF_SLOT] = signed[:, 26:]
+    return boards
+
+
+def stack_positions(states):
+    """
+    Stacks positions into an (N, 26, 2) array of piece counts, see stack_keys.
+
+    Parameters
+    ----------
+    states : sequence[GameState]
+        the positions
+
+    Returns
+    -------
+    numpy.ndarray
+        int8 array of shape (len(states), 26, 2)
+    """
+
+    return stack_keys([state.position_key() for state in states])
+
+
+def _longest_runs(made):
+    """
+    Returns the length of the longest run of consecutive made points of each player.
+
+    The loop runs over the 24 points, each step working on every position at once.
+
+    Parameters
+    ----------
+    made : numpy.ndarray
+        bool array of shape (N, 2, 24)
+
+    Returns
+    -------
+    numpy.ndarray
+        int8 array of shape (N, 2)
+    """
+
+    columns = np.ascontiguousarray(made.transpose(2, 0, 1)).view(np.int8)
+    run = np.zeros(made.shape[:2], dtype=np.int8)
+    longest = run.copy()
+    for column in columns:
+        run += 1
+        run *= column
+        np.maximum(longest, run, out=longest)
+    return longest
+
+
+def features(boards):
+    """
+    Computes the evaluation features of stacked positions, for each player.
+
+    Each feature is an int array of shape (N, 2), column 0 for player 1 and column 1 for player 2:
+    pips (pip count), blots (points with a single piece), made (points with two pieces or more), home (made points
+    in the player's home board), prime (longest run of made points), bar (pieces on the bar), off (pieces borne
+    off) and back (index of the furthest back piece, counted from the player's starting side, 24 if there is none,
+    -1 for a piece on the bar).
+
+    Parameters
+    ----------
+    boards : numpy.ndarray
+        array of shape (N, 26, 2), see stack_positions
+
+    Returns
+    -------
+    dict[str, numpy.ndarray]
+    """
+
+    # each player's points in their own direction of travel, index 0 being where their back pieces start; one
+    # contiguous row per player keeps the reductions along the last axis fast
+    points = np.stack((boards[:, :24, 0], boards[:, 23::-1, 1]), axis=1)
+    bar = boards[:, BAR_SLOT].astype(np.int32)
+    occupied = points > 0
+    made = points >= 2
+    back = np.where(occupied.any(axis=2), occupied.argmax(axis=2), 24)
+    return {
+        "pips": points.astype(np.int32) @ np.arange(24, 0, -1, dtype=np.int32) + 25 * bar,
+        "blots": np.count_nonzero(points == 1, axis=2),
+        "made": np.count_nonzero(made, axis=2),
+        "home": np.count_nonzero(made[:, :, 18:], axis=2),
+        "prime": _longest_runs(made),
+        "bar": bar,
+        "off": boards[:, OFF_SLOT].astype(np.int32),
+        "back": np.where(bar > 0, -1, back),
+    }
+
+
+def game_points_batch(boards, pieces=15):
+    """
+    Returns the points won by player 1 in each stacked position, see evaluation.game_points.
+
+    Parameters
+    ----------
+    boards : numpy.ndarray
+        array of shape (N, 26, 2), see stack_positions
+    pieces : int
+        number of pieces of each player, see GameState.pieces
+
+    Returns
+    -------
+    numpy.ndarray
+        int array of shape (N,): positive if player 1 has borne off every piece, negative if player 2 has, 0 while
+        the game goes on
+    """
+
+    off = boards[:, OFF_SLOT]
+    # a loser with a piece on the bar or in the winner's home board is backgammoned
+    dark_behind = (boards[:, BAR_SLOT, 1] > 0) | (boards[:, 18:24, 1] > 0).any(axis=1)
+    light_behind = (boards[:, BAR_SLOT, 0] > 0) | (boards[:, :6, 0] > 0).any(axis=1)
+    light_points = np.where(off[:, 1] > 0, 1, np.where(dark_behind, 3, 2))
+    dark_points = np.where(off[:, 0] > 0, 1, np.where(light_behind, 3, 2))
+    return np.where(off[:, 0] == pieces, light_points, np.where(off[:, 1] == pieces, -dark_points, 0))
+
+
+def evaluate_batch(boards, player, turns=None, pieces=15):
+    """
+    Estimates the equity of stacked positions for the given player, like evaluation.evaluate but in one call.
+
+    The estimates are the same as evaluate's. Exact bear-off equities need the player about to roll, so they are
+    only looked up when turns is given and the bear-off database was generated.
+
+    Parameters
+    ----------
+    boards : numpy.ndarray
+        array of shape (N, 26, 2), see stack_positions
+    player : int
+        index of the player the equity is computed for, 1 or 2
+    turns : numpy.ndarray, optional
+        index of the player about to roll in each position
+    pieces : int
+        number of pieces of each player, see GameState.pieces
+
+    Returns
+    -------
+    numpy.ndarray
+        float array of shape (N,)
+    """
+
+    values = features(boards)
+    pips = values["pips"]
+    blots = values["blots"]
+    bar = values["bar"]
+    home = values["home"]
+    prime = values["prime"]
+    back = values["back"]
+    score = (pips[:, 1] - pips[:, 0]) / 20
+    # the furthest back pieces of each side, on the board's numbering, decide whether the game is a contact game
+    light_back = np.maximum(back[:, 0], 0)
+    dark_back = 23 - np.maximum(back[:, 1], 0)
+    contact = light_back < dark_back
+    score = score + contact * (0.25 * (blots[:, 1] - blots[:, 0]) + 0.4 * (bar[:, 1] - bar[:, 0]) +
+                               0.12 * (home[:, 0] - home[:, 1]) + 0.1 * (prime[:, 0] - prime[:, 1]))
+    equities = np.tanh(score)
+
+    if turns is not None:
+        database = default_database()
+        if database is not None:
+            race = np.flatnonzero((light_back >= 18) & (dark_back < 6) & (values["off"].max(axis=1) < pieces))
+            for n in race:
+                light = boards[n, 23:17:-1, 0].tolist()
+                dark = boards[n, :6, 1].tolist()
+                if database.covers(light) and database.covers(dark):
+                    if turns[n] == 1:
+                        equities[n] = 2 * database.win_probability(light, dark) - 1
+                    else:
+                        equities[n] = 1 - 2 * database.win_probability(dark, light)
+
+    points = game_points_batch(boards, pieces)
+    equities = np.where(points != 0, points, equities)
+    return equities if player == 1 else -equities
@@ -0,0 +1,401 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+from math import comb
+from game_state import ROLLS
+
+
+MAGIC = b"BGBO"
+HEADER = struct.Struct("<4sHHH")
+MAX_ROLLS = 32
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bearoff.bin")
+
+_ENTRY = struct.Struct(f"<{MAX_ROLLS}H")
+_BINOMIALS = [[comb(n, k) for k in range(8)] for n in range(32)]
+
+
+def position_count(checkers=15):
+    """
+    Returns the number of one-sided positions with up to the given number of pieces on the 6 home points.
+
+    Parameters
+    ----------
+    checkers : int
+        maximum number of pieces
+
+    Returns
+    -------
+    int
+    """
+
+    return comb(checkers + 6, 6)
+
+
+def position_index(position):
+    """
+    Returns the index of a one-sided position, using the combinatorial number system.
+
+    The counts c1..c6 are seen as 6 separators placed among the pieces: separator k sits at c1 + ... + ck + k - 1.
+    The index of the position is the rank of that set of separators, so positions with up to n pieces get the indices
+    0 to position_count(n) - 1, the empty position being 0.
+
+    Parameters
+    ----------
+    position : sequence[int]
+        number of pieces on the 1 to 6 points, 1 being the closest to bearing off
+
+    Returns
+    -------
+    int
+    """
+
+    index = 0
+    separator = -1
+    binomials = _BINOMIALS
+    for k in range(6):
+        separator += position[k] + 1
+        index += binomials[separator][k + 1]
+    return index
+
+
+def _single_moves(position, dice_value):
+    """
+    Lists the positions reached by moving one piece by one dice move, bearing off when possible.
+
+    Parameters
+    ----------
+    position : tuple[int]
+        number of pieces on the 1 to 6 points
+    dice_value : int
+        the dice move
+
+    Returns
+    -------
+    set[tuple[int]]
+    """
+
+    results = set()
+    highest = 0
+    for point in range(6, 0, -1):
+        if position[point - 1] > 0:
+            highest = point
+            break
+    for point in range(1, highest + 1):
+        if position[point - 1] == 0:
+            continue
+        if point > dice_value:
+            moved = list(position)
+            moved[point - 1] -= 1
+            moved[point - 1 - dice_value] += 1
+            results.add(tuple(moved))
+        elif point == dice_value or point == highest:
+            moved = list(position)
+            moved[point - 1] -= 1
+            results.add(tuple(moved))
+    return results
+
+
+def _plays(position, dice_value_1, dice_value_2):
+    """
+    Lists the positions reached by the legal plays of a roll, with no opponent in the way.
+
+    Parameters
+    ----------
+    position : tuple[int]
+        number of pieces on the 1 to 6 points
+    dice_value_1 : int
+        value of the first die
+    dice_value_2 : int
+        value of the second die
+
+    Returns
+    -------
+    set[tuple[int]]
+    """
+
+    if dice_value_1 == dice_value_2:
+        orders = ((dice_value_1,) * 4,)
+    else:
+        orders = ((dice_value_1, dice_value_2), (dice_value_2, dice_value_1))
+    results = set()
+    for order in orders:
+        reached = {position}
+        for dice_value in order:
+            following = set()
+            for current in reached:
+                if any(current):
+                    following |= _single_moves(current, dice_value)
+                else:
+                    following.add(current)
+            reached = following
+        results |= reached
+    return results
+
+
+def generate(path=DEFAULT_PATH, checkers=15):
+    """
+    Computes the one-sided bear-off database and writes it to a binary file.
+
+    Each position gets the distribution of the number of rolls needed to bear all its pieces off, playing every
+    roll so as to minimise the expected number of rolls. Positions are solved from the lowest pip count up, so the
+    positions a roll leads to are always solved first.
+
+    The file holds a header (magic, version, number of pieces, number of rolls per distribution) followed by one
+    entry per position, in position_index order: MAX_ROLLS little-endian 16-bit probabilities, scaled to 65535.
+
+    Parameters
+    ----------
+    path : str
+        file to write
+    checkers : int
+        maximum number of pieces per position, 15 for the full database
+
+    Returns
+    -------
+    None
+    """
+
+    positions = []
+
+    def collect(prefix, left):
+        if len(prefix) == 6:
+            positions.append(tuple(prefix))
+            return
+        for pieces in range(left + 1):
+            collect(prefix + [pieces], left - pieces)
+
+    collect([], checkers)
+    positions.sort(key=lambda position: sum((point + 1) * pieces for point, pieces in enumerate(position)))
+    count = position_count(checkers)
+    distributions = [None] * count
+    expectations = [0.0] * count
+    distributions[0] = [1.0] + [0.0] * (MAX_ROLLS - 1)
+    for position in positions:
+        index = position_index(position)
+        if index == 0:
+            continue
+        distribution = [0.0] * MAX_ROLLS
+        expected = 1.0
+        for dice_value_1, dice_value_2, probability in ROLLS:
+            best = min((position_index(result) for result in _plays(position, dice_value_1, dice_value_2)),
+                       key=expectations.__getitem__)
+            expected += probability * expectations[best]
+            following = distributions[best]
+            for rolls in range(MAX_ROLLS - 1):
+                distribution[rolls + 1] += probability * following[rolls]
+        distributions[index] = distribution
+        expectations[index] = expected
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, 1, checkers, MAX_ROLLS))
+        for distribution in distributions:
+            file.write(_ENTRY.pack(*(round(probability * 65535) for probability in distribution)))
+
+
+class BearoffDatabase:
+    """
+    A class used to look up exact bear-off statistics in a memory-mapped one-sided database, see generate.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+        the database file
+    checkers : int
+        maximum number of pieces per position in the database
+
+    Methods
+    -------
+    covers(position):
+        Decides whether the position is in the database.
+    distribution(position):
+        Returns the probabilities of needing 0, 1, 2... rolls to bear the position off.
+    expected_rolls(position):
+        Returns the expected number of rolls needed to bear the position off.
+    win_probability(position, opponent_position):
+        Returns the probability that the player about to roll bears off first.
+    evaluate(state, player):
+        Returns the exact race equity of the position for the player, if both sides are bearing off.
+    close():
+        Unmaps and closes the file.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        """
+        Maps the database file into memory; only the header is read.
+
+        Parameters
+        ----------
+        path : str
+            the database file
+        """
+
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, checkers, max_rolls = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != 1 or max_rolls != MAX_ROLLS:
+            self.close()
+            raise ValueError(f"{path} is not a bear-off database")
+        self.checkers = checkers
+
+    def covers(self, position):
+        """
+        Decides whether the position is in the database.
+
+        Parameters
+        ----------
+        position : sequence[int]
+            number of pieces on the 1 to 6 points
+
+        Returns
+        -------
+        bool
+        """
+
+        return sum(position) <= self.checkers
+
+    def distribution(self, position):
+        """
+        Returns the probabilities of needing 0, 1, 2... rolls to bear the position off.
+
+        Parameters
+        ----------
+        position : sequence[int]
+            number of pieces on the 1 to 6 points
+
+        Returns
+        -------
+        list[float]
+        """
+
+        entry = _ENTRY.unpack_from(self._map, HEADER.size + _ENTRY.size * position_index(position))
+        return [probability / 65535 for probability in entry]
+
+    def expected_rolls(self, position):
+        """
+        Returns the expected number of rolls needed to bear the position off.
+
+        Parameters
+        ----------
+        position : sequence[int]
+            number of pieces on the 1 to 6 points
+
+        Returns
+        -------
+        float
+        """
+
+        return sum(rolls * probability for rolls, probability in enumerate(self.distribution(position)))
+
+    def win_probability(self, position, opponent_position):
+        """
+        Returns the probability that the player about to roll bears off first.
+
+        The player wins in n rolls if the opponent, who only gets n - 1 rolls by then, needs n or more.
+
+        Parameters
+        ----------
+        position : sequence[int]
+            pieces of the player about to roll, on their 1 to 6 points
+        opponent_position : sequence[int]
+            pieces of the opponent, on their 1 to 6 points
+
+        Returns
+        -------
+        float
+        """
+
+        own = self.distribution(position)
+        opponent = self.distribution(opponent_position)
+        probability = 0.0
+        opponent_left = 1.0
+        for rolls in range(MAX_ROLLS):
+            probability += own[rolls] * opponent_left
+            opponent_left -= opponent[rolls]
+        return probability
+
+    def evaluate(self, state, player):
+        """
+        Returns the exact race equity of the position for the player, if both sides are bearing off.
+
+        state.turn is taken as the player about to roll. Gammons are not counted.
+
+        Parameters
+        ----------
+        state : GameState
+            the position
+        player : int
+            index of the player the equity is computed for, 1 or 2
+
+        Returns
+        -------
+        float, optional
+            None if a piece is still outside its home board or a side has more pieces than the database holds
+        """
+
+        board = state.board
+        if board[24] or board[25]:
+            return None
+        for i in range(6, 18):
+            if board[i]:
+                return None
+        for i in range(6):
+            if board[i] > 0 or board[23 - i] < 0:
+                return None
+        light = [board[23 - i] for i in range(6)]
+        dark = [-board[i] for i in range(6)]
+        if not self.covers(light) or not self.covers(dark):
+            return None
+        if state.turn == 1:
+            win = self.win_probability(light, dark)
+        else:
+            win = 1 - self.win_probability(dark, light)
+        equity = 2 * win - 1
+        return equity if player == 1 else -equity
+
+    def close(self):
+        """
+        Unmaps and closes the file.
+
+        Returns
+        -------
+        None
+        """
+
+        self._map.close()
+        self._file.close()
+
+
+_default_database = None
+_default_checked = False
+
+
+def default_database():
+    """
+    Returns the database at DEFAULT_PATH, opening it on first use, or None if it was not generated.
+
+    Returns
+    -------
+    BearoffDatabase, optional
+    """
+
+    global _default_database, _default_checked
+    if not _default_checked:
+        _default_checked = True
+        if os.path.exists(DEFAULT_PATH):
+            _default_database = BearoffDatabase(DEFAULT_PATH)
+    return _default_database
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the one-sided bear-off database.")
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH, help="file to write")
+    parser.add_argument("--checkers", type=int, default=15, help="maximum number of pieces per position")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    generate(args.path, args.checkers)
+    print(f"{position_count(args.checkers)} positions written to {args.path} in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,335 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import profiling
+from agents import make_agent
+from game_state import GameState
+
+
+def sample_positions(count, seed=0):
+    """
+    Returns the starting position followed by positions from randomly played out games, all with the dice rolled.
+
+    Parameters
+    ----------
+    count : int
+        number of positions
+    seed : int
+        seed of the random games
+
+    Returns
+    -------
+    list[GameState]
+    """
+
+    rng = random.Random(seed)
+    start = GameState(1)
+    start.roll(rng)
+    positions = [start]
+    while len(positions) < count:
+        state = GameState(rng.choice((1, 2)))
+        while state.winner() is None and len(positions) < count:
+            state.roll(rng)
+            if rng.random() < 0.3:
+                positions.append(state.copy())
+            for step in rng.choice(state.legal_plays()):
+                state.apply_move(*step)
+            state.end_turn()
+    return positions
+
+
+def measure(function, min_time):
+    """
+    Calls function repeatedly for at least min_time seconds and returns the rate of operations.
+
+    Parameters
+    ----------
+    function : callable
+        runs a batch of operations and returns how many it ran
+    min_time : float
+        seconds to keep calling function for
+
+    Returns
+    -------
+    dict
+        operations, seconds, operations per second and mean microseconds per operation
+    """
+
+    operations = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        operations += function()
+        elapsed = time.perf_counter() - start
+    return {"operations": operations, "seconds": elapsed, "ops_per_second": operations / elapsed,
+            "mean_us": elapsed / operations * 1e6}
+
+
+def bench_valid_move(positions):
+    """Times GameState.valid_move over every source and target of each position, with the legal play cache dropped
+    before the first of them, as when a turn starts."""
+
+    def run():
+        calls = 0
+        for state in positions:
+            state.set_dice(state.dice[0], state.dice[1])
+            for selected_piece in range(25):
+                for clicked_column in range(24):
+                    state.valid_move(clicked_column, selected_piece)
+                state.valid_move(None, selected_piece)
+                calls += 25
+        return calls
+    return run
+
+
+def bench_valid_move_exists(positions):
+    """Times GameState.valid_move_exists, with the legal play cache dropped by setting the same dice again."""
+
+    def run():
+        for state in positions:
+            state.set_dice(state.dice[0], state.dice[1])
+            state.valid_move_exists()
+        return len(positions)
+    return run
+
+
+def bench_legal_plays(positions):
+    """Times full-turn play generation, with the legal play cache dropped by setting the same dice again."""
+
+    def run():
+        for state in positions:
+            state.set_dice(state.dice[0], state.dice[1])
+            state.legal_plays()
+        return len(positions)
+    return run
+
+
+def bench_evaluate_batch(positions):
+    """Times batch_evaluation.evaluate_batch on all the positions stacked, stacking included."""
+
+    # imported here so that the rest of the suite runs where NumPy is missing
+    from batch_evaluation import evaluate_batch, stack_positions
+
+    def run():
+        evaluate_batch(stack_positions(positions), 1)
+        return len(positions)
+    return run
+
+
+def bench_position_ids(positions, repeat=50):
+    """Times position_id.encode_batch and decode_batch together on the positions repeated, one key per operation."""
+
+    # imported here so that the rest of the suite runs where NumPy is missing
+    import numpy as np
+    from batch_evaluation import stack_positions
+    from position_id import decode_batch, encode_batch
+
+    boards = np.concatenate([stack_positions(positions)] * repeat)
+    turns = np.array([state.turn for state in positions] * repeat)
+
+    def run():
+        decode_batch(encode_batch(boards, turns), turns)
+        return len(boards)
+    return run
+
+
+def bench_agent(positions, agent):
+    """Times the agent's play choice, with the legal play cache dropped by setting the same dice again."""
+
+    def run():
+        for state in positions:
+            state.set_dice(state.dice[0], state.dice[1])
+            agent.choose_play(state)
+        return len(positions)
+    return run
+
+
+def bench_self_play(agent, seed=0):
+    """Times whole games of the agent against itself."""
+
+    rng = random.Random(seed)
+
+    def run():
+        state = GameState(rng.choice((1, 2)))
+        while state.winner() is None:
+            state.roll(rng)
+            for step in agent.choose_play(state):
+                state.apply_move(*step)
+            state.end_turn()
+        return 1
+    return run
+
+
+class StubCanvas:
+    """
+    A class used to stand in for tkinter.Canvas when timing the rendering without a display.
+
+    ...
+
+    Methods
+    -------
+    create_oval(*coordinates, **options):
+        Returns a new item id.
+    coords(item, *coordinates):
+        Does nothing, like every other canvas method.
+    """
+
+    def __init__(self):
+        self._items = 0
+
+    def create_oval(self, *coordinates, **options):
+        self._items += 1
+        return self._items
+
+    def coords(self, item, *coordinates):
+        pass
+
+    def itemconfig(self, item, **options):
+        pass
+
+    def tag_raise(self, item):
+        pass
+
+    def create_rectangle(self, *coordinates, **options):
+        pass
+
+    def create_polygon(self, *coordinates, **options):
+        pass
+
+
+def bench_redraw(positions):
+    """Times BackgammonBoard.redraw_board on a stub canvas, switching position before each redraw."""
+
+    # imported here so that the rest of the suite runs where tkinter is missing
+    from backgammon import BackgammonBoard
+    board = BackgammonBoard(StubCanvas(), None, 1, None, None, None)
+    board.draw_board()
+    board.place_pieces()
+
+    def run():
+        for state in positions:
+            board.state = state
+            board.redraw_board()
+        return len(positions)
+    return run
+
+
+def run_suite(quick=False, seed=0):
+    """
+    Runs every benchmark and returns the results.
+
+    Parameters
+    ----------
+    quick : bool
+        use fewer positions and shorter timings, for a smoke test
+    seed : int
+        seed of the sampled positions and games
+
+    Returns
+    -------
+    dict
+        maps benchmark names to the results of measure
+    """
+
+    positions = sample_positions(20 if quick else 200, seed)
+    min_time = 0.2 if quick else 2.0
+    benchmarks = {
+        "valid_move": bench_valid_move(positions),
+        "valid_move_exists": bench_valid_move_exists(positions),
+        "legal_plays": bench_legal_plays(positions),
+        "heuristic_move": bench_agent(positions, make_agent("heuristic")),
+        "search_move": bench_agent(positions[:5], make_agent("search", time_budget=0.2)),
+        "self_play_random": bench_self_play(make_agent("random", rng=random.Random(seed)), seed),
+        "self_play_heuristic": bench_self_play(make_agent("heuristic"), seed),
+    }
+    try:
+        benchmarks["evaluate_batch"] = bench_evaluate_batch(positions)
+        benchmarks["position_ids"] = bench_position_ids(positions)
+    except ImportError:
+        pass
+    try:
+        benchmarks["redraw_board"] = bench_redraw(positions)
+    except ImportError:
+        pass
+    return {name: measure(function, min_time) for name, function in benchmarks.items()}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Lists the benchmarks that got slower than the baseline by more than the tolerance.
+
+    Parameters
+    ----------
+    results : dict
+        results of run_suite
+    baseline : dict
+        saved results of run_suite
+    tolerance : float
+        allowed relative slowdown, 0.1 for 10%
+
+    Returns
+    -------
+    list[(str, float)]
+        names of the regressed benchmarks, with their speed relative to the baseline
+    """
+
+    regressions = []
+    for name, result in results.items():
+        if name in baseline:
+            ratio = result["ops_per_second"] / baseline[name]["ops_per_second"]
+            if ratio < 1 - tolerance:
+                regressions.append((name, ratio))
+    return regressions
+
+
+def main(argv=None):
+    """
+    Runs the suite from the command line, saving the results and comparing them against a baseline.
+
+    Parameters
+    ----------
+    argv : list[str], optional
+        command line arguments; sys.argv by default
+
+    Returns
+    -------
+    int
+        exit status: 1 if a benchmark regressed, 0 otherwise
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark the rules, AI and rendering hot paths.")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--baseline", help="JSON file of earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative slowdown")
+    parser.add_argument("--quick", action="store_true", help="fewer positions and shorter timings")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the sampled positions and games")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="write a profile of the suite: timings of the hot paths if PATH ends with .json, else a "
+                             "cProfile dump for pstats; profiling slows the benchmarks down")
+    args = parser.parse_args(argv)
+
+    def run():
+        return run_suite(args.quick, args.seed)
+
+    results = run() if args.profile is None else profiling.run(run, args.profile)
+    for name, result in results.items():
+        print(f"{name:22} {result['ops_per_second']:14.1f} ops/s {result['mean_us']:14.1f} us/op")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results},
+                      file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for name, ratio in regressions:
+            print(f"REGRESSION {name}: {ratio:.0%} of baseline speed")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import math
+from bearoff import default_database
+from game_state import LIGHT_BAR, DARK_BAR
+
+
+def game_points(state, winner):
+    """
+    Returns how many points the winner gets: 1 for a single game, 2 for a gammon, 3 for a backgammon.
+
+    The loser is gammoned if they bore off no pieces, backgammoned if they also have a piece on the bar or in the
+    winner's home.
+
+    Parameters
+    ----------
+    state : GameState
+        a finished game
+    winner : int
+        index of the winning player, 1 or 2
+
+    Returns
+    -------
+    int
+    """
+
+    board = state.board
+    if winner == 1:
+        if state.dark_count > 0:
+            return 1
+        if board[DARK_BAR] > 0:
+            return 3
+        for i in range(18, 24):
+            if board[i] < 0:
+                return 3
+        return 2
+    if state.light_count > 0:
+        return 1
+    if board[LIGHT_BAR] > 0:
+        return 3
+    for i in range(6):
+        if board[i] > 0:
+            return 3
+    return 2
+
+
+def pip_counts(state):
+    """
+    Returns the total distance each player's pieces still have to travel to be borne off.
+
+    Parameters
+    ----------
+    state : GameState
+        the position
+
+    Returns
+    -------
+    (int, int)
+        pip counts of player 1 and player 2
+    """
+
+    board = state.board
+    light_pips = 25 * board[LIGHT_BAR]
+    dark_pips = 25 * board[DARK_BAR]
+    for i in range(24):
+        pieces = board[i]
+        if pieces > 0:
+            light_pips += pieces * (24 - i)
+        elif pieces < 0:
+            dark_pips -= pieces * (i + 1)
+    return light_pips, dark_pips
+
+
+def evaluate(state, player):
+    """
+    Estimates the equity of the position for the given player, between -1 and 1 until the game is over.
+
+    Finished games are worth the points won or lost (see game_points). Once both players are bearing off, the
+    equity is looked up exactly in the bear-off database, if it was generated (see bearoff.py). Otherwise the
+    estimate weighs the race (pip counts) and, while the pieces can still hit each other, blots, pieces on the bar
+    and points made in the home board and in a row (primes).
+
+    state.turn is taken as the player about to roll.
+
+    Parameters
+    ----------
+    state : GameState
+        the position
+    player : int
+        index of the player the equity is computed for, 1 or 2
+
+    Returns
+    -------
+    float
+    """
+
+    winner = state.winner()
+    if winner is not None:
+        points = game_points(state, winner)
+        return points if winner == player else -points
+
+    board = state.board
+    light_pips = 25 * board[LIGHT_BAR]
+    dark_pips = 25 * board[DARK_BAR]
+    light_blots = 0
+    dark_blots = 0
+    light_home = 0
+    dark_home = 0
+    light_prime = 0
+    dark_prime = 0
+    light_run = 0
+    dark_run = 0
+    # the furthest back pieces of each side decide whether the game is still a contact game
+    light_back = 0 if board[LIGHT_BAR] > 0 else 24
+    dark_back = 23 if board[DARK_BAR] > 0 else -1
+    for i in range(24):
+        pieces = board[i]
+        if pieces > 0:
+            light_pips += pieces * (24 - i)
+            if i < light_back:
+                light_back = i
+            if pieces == 1:
+                light_blots += 1
+                light_run = 0
+            else:
+                if i >= 18:
+                    light_home += 1
+                light_run += 1
+                if light_run > light_prime:
+                    light_prime = light_run
+            dark_run = 0
+        elif pieces < 0:
+            dark_pips -= pieces * (i + 1)
+            if i > dark_back:
+                dark_back = i
+            if pieces == -1:
+                dark_blots += 1
+                dark_run = 0
+            else:
+                if i < 6:
+                    dark_home += 1
+                dark_run += 1
+                if dark_run > dark_prime:
+                    dark_prime = dark_run
+            light_run = 0
+        else:
+            light_run = 0
+            dark_run = 0
+
+    if light_back >= 18 and dark_back < 6:
+        database = default_database()
+        if database is not None:
+            equity = database.evaluate(state, player)
+            if equity is not None:
+                return equity
+
+    score = (dark_pips - light_pips) / 20
+    if light_back < dark_back:
+        # contact: blots and pieces on the bar matter, made points and primes block the opponent
+        score += (0.25 * (dark_blots - light_blots) + 0.4 * (board[DARK_BAR] - board[LIGHT_BAR]) +
+                  0.12 * (light_home - dark_home) + 0.1 * (light_prime - dark_prime))
+    if player == 2:
+        score = -score
+    return math.tanh(score)
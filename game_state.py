@@ -0,0 +1,726 @@
+from array import array
+import random
+import profiling
+
+
+def _zobrist_keys(rng, count):
+    """
+    Draws count random 64-bit keys.
+
+    Parameters
+    ----------
+    rng : random.Random
+        source of the keys
+    count : int
+        number of keys
+
+    Returns
+    -------
+    list[int]
+    """
+
+    return [rng.getrandbits(64) for _ in range(count)]
+
+
+BAR = 24
+LIGHT_BAR = 24
+DARK_BAR = 25
+START_LAYOUT = ((0, 2), (5, -5), (7, -3), (11, 5), (12, -5), (16, 3), (18, 5), (23, -2))
+# hypergammon: 3 pieces each, on the points furthest from home
+HYPERGAMMON_LAYOUT = ((0, 1), (1, 1), (2, 1), (21, -1), (22, -1), (23, -1))
+VARIANTS = {"standard": START_LAYOUT, "hypergammon": HYPERGAMMON_LAYOUT}
+
+# the 21 distinct rolls, with their probability
+ROLLS = tuple((dice_value_1, dice_value_2, (1 if dice_value_1 == dice_value_2 else 2) / 36)
+              for dice_value_1 in range(1, 7) for dice_value_2 in range(dice_value_1, 7))
+
+# Zobrist keys, fixed so that hashes are the same in every process. ZOBRIST[i][pieces] is indexed directly by the
+# signed piece count of board slot i: negative counts wrap to the end of the 31 keys.
+_zobrist_rng = random.Random(0x6A09E667)
+ZOBRIST = [_zobrist_keys(_zobrist_rng, 31) for _ in range(26)]
+ZOBRIST_LIGHT_COUNT = _zobrist_keys(_zobrist_rng, 16)
+ZOBRIST_DARK_COUNT = _zobrist_keys(_zobrist_rng, 16)
+ZOBRIST_TURN = _zobrist_rng.getrandbits(64)
+
+
+class GameState:
+    """
+    A class used to represent the rules and position of a backgammon game, without any visuals.
+
+    ...
+
+    Attributes
+    ----------
+    board : array.array
+        26 signed bytes: points 0 to 23 hold light (player 1) pieces as positive and dark (player 2) pieces as
+        negative values, 24 holds the light pieces on the bar, 25 the dark pieces on the bar
+    light_count : int
+        number of pieces borne off by player 1
+    dark_count : int
+        number of pieces borne off by player 2
+    turn : int
+        index of the player who / must make a move, 1 or 2
+    dice : list[int]
+        list of remaining move distances, based on rolled dice and moves already made
+    variant : str
+        the starting layout, a key of VARIANTS
+    pieces : int
+        number of pieces of each player, all of which must be borne off to win
+    hash : int
+        64-bit Zobrist hash of the position and turn, kept up to date by every move
+    cache_hits : int
+        number of legal play queries answered from the cache
+    cache_misses : int
+        number of legal play queries that had to generate the plays
+
+    Methods
+    -------
+    copy():
+        Creates an independent copy of the state.
+    compute_hash():
+        Computes the Zobrist hash of the position and turn from scratch.
+    count(column, player):
+        Returns the number of pieces the player has on the given column, 24 being the bar.
+    roll(rng):
+        Rolls two dice for the player whose turn it is.
+    set_dice(dice_value_1, dice_value_2):
+        Sets the remaining move distances from two dice values.
+    valid_move(clicked_column, selected_piece):
+        Decides whether moving selected_piece to clicked_column is a valid move.
+    valid_move_exists():
+        Decides if there are any possible valid moves left in the current game state.
+    single_moves(dice_value):
+        Lists the single piece moves the player whose turn it is can make with one dice move.
+    position_key():
+        Returns the pieces' positions as bytes, equal for equal positions.
+    legal_plays():
+        Lists every legal full-turn play for the remaining dice, one per resulting position.
+    legal_positions():
+        Lists the position keys reached by the legal full-turn plays, in the order of legal_plays.
+    legal_steps():
+        Lists the single piece moves that start a legal full-turn play.
+    legal_step(selected_piece, clicked_column):
+        Returns the dice move to use for moving selected_piece to clicked_column, if legal this turn.
+    apply_move(selected_piece, clicked_column, dice_value):
+        Moves one piece, hitting and bearing off as needed, and returns what is needed to undo it.
+    undo_move(record):
+        Reverts a move made by apply_move.
+    end_turn():
+        Drops the remaining dice and passes the turn to the other player.
+    winner():
+        Returns the index of the player who bore off all pieces, if any.
+    """
+
+    __slots__ = ("board", "light_count", "dark_count", "turn", "dice", "variant", "pieces", "hash", "cache_hits",
+                 "cache_misses", "_plays_key", "_plays")
+
+    def __init__(self, turn=1, board=None, light_count=0, dark_count=0, dice=None, variant="standard"):
+        """
+        Provides all the necessary attributes to simulate a backgammon game.
+
+        Parameters
+        ----------
+        turn : int
+            index of the player who / must make a move, 1 or 2
+        board : iterable[int], optional
+            26 signed piece counts, see the class attributes; defaults to the starting position
+        light_count : int
+            number of pieces already borne off by player 1
+        dark_count : int
+            number of pieces already borne off by player 2
+        dice : list[int], optional
+            remaining move distances
+        variant : str
+            the starting layout and number of pieces, a key of VARIANTS
+        """
+
+        layout = VARIANTS[variant]
+        if board is None:
+            self.board = array("b", bytes(26))
+            for column, pieces in layout:
+                self.board[column] = pieces
+        else:
+            self.board = array("b", board)
+        self.light_count = light_count
+        self.dark_count = dark_count
+        self.turn = turn
+        self.dice = [] if dice is None else list(dice)
+        self.variant = variant
+        self.pieces = sum(pieces for _, pieces in layout if pieces > 0)
+        self.hash = self.compute_hash()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._plays_key = None
+        self._plays = None
+
+    def copy(self):
+        """
+        Creates an independent copy of the state.
+
+        Returns
+        -------
+        GameState
+        """
+
+        return GameState(self.turn, self.board, self.light_count, self.dark_count, self.dice, self.variant)
+
+    def compute_hash(self):
+        """
+        Computes the Zobrist hash of the position and turn from scratch.
+
+        Returns
+        -------
+        int
+        """
+
+        position_hash = ZOBRIST_LIGHT_COUNT[self.light_count] ^ ZOBRIST_DARK_COUNT[self.dark_count]
+        for i, pieces in enumerate(self.board):
+            position_hash ^= ZOBRIST[i][pieces]
+        if self.turn == 2:
+            position_hash ^= ZOBRIST_TURN
+        return position_hash
+
+    def count(self, column, player):
+        """
+        Returns the number of pieces the player has on the given column, 24 being the bar.
+
+        Parameters
+        ----------
+        column : int
+            index of the column, 0 to 24
+        player : int
+            index of the player, 1 or 2
+
+        Returns
+        -------
+        int
+        """
+
+        if column == BAR:
+            return self.board[LIGHT_BAR] if player == 1 else self.board[DARK_BAR]
+        pieces = self.board[column]
+        if player == 1:
+            return pieces if pieces > 0 else 0
+        return -pieces if pieces < 0 else 0
+
+    def roll(self, rng=random):
+        """
+        Rolls two dice for the player whose turn it is.
+
+        Parameters
+        ----------
+        rng : random.Random
+            source of the dice values
+
+        Returns
+        -------
+        (int, int)
+        """
+
+        dice_value_1 = rng.randint(1, 6)
+        dice_value_2 = rng.randint(1, 6)
+        self.set_dice(dice_value_1, dice_value_2)
+        return dice_value_1, dice_value_2
+
+    def set_dice(self, dice_value_1, dice_value_2):
+        """
+        Sets the remaining move distances from two dice values, doubles counting four times.
+
+        Parameters
+        ----------
+        dice_value_1 : int
+            value of the first die
+        dice_value_2 : int
+            value of the second die
+
+        Returns
+        -------
+        None
+        """
+
+        self._plays = None
+        if dice_value_1 == dice_value_2:
+            self.dice = [dice_value_1] * 4
+        else:
+            self.dice = [dice_value_1, dice_value_2]
+
+    def valid_move(self, clicked_column, selected_piece):
+        """
+        Decides whether moving selected_piece to clicked_column is a valid move.
+
+        It respects all the original rules of the game. It also returns which dice move was used, so that it can be
+        removed from the list.
+
+        Parameters
+        ----------
+        clicked_column : int, optional
+            index of the clicked column, 0 to 24, or None if outside the board
+        selected_piece : int
+            the index of the column from which a piece was selected
+
+        Returns
+        -------
+        (bool, int)
+        """
+
+        board = self.board
+        if clicked_column is None:
+            if self.turn == 1:
+                for i in range(18):
+                    if board[i] > 0:
+                        return False, None
+            else:
+                for i in range(18):
+                    if board[i+6] < 0:
+                        return False, None
+        if clicked_column == 24:
+            return False, None
+        if self.turn == 1:
+            if clicked_column is not None and board[clicked_column] < -1:
+                return False, None
+            if clicked_column is None:
+                if 24 - selected_piece in self.dice:
+                    return True, 24 - selected_piece
+                for i in range(24 - selected_piece, 6):
+                    if board[23-i] > 0:
+                        return False, None
+                max_dice = max(self.dice)
+                if max_dice > 24 - selected_piece:
+                    return True, max_dice
+                return False, None
+            move = clicked_column - selected_piece % 24 + selected_piece // 24
+            if move in self.dice:
+                return True, move
+            return False, None
+        else:
+            if clicked_column is not None and board[clicked_column] > 1:
+                return False, None
+            if clicked_column is None:
+                if selected_piece+1 in self.dice:
+                    return True, selected_piece+1
+                for i in range(selected_piece+1, 6):
+                    if board[i] < 0:
+                        return False, None
+                max_dice = max(self.dice)
+                if max_dice > selected_piece+1:
+                    return True, max_dice
+                return False, None
+            else:
+                move = selected_piece - clicked_column
+                if move in self.dice:
+                    return True, move
+            return False, None
+
+    def valid_move_exists(self):
+        """
+        Decides if there are any possible valid moves left in the current game state.
+
+        Picks a random legal full-turn play and returns bool, clicked_column and selected_piece of its first move, in
+        that order.
+
+        Returns
+        -------
+        (bool, int, int)
+        """
+
+        plays = self.legal_plays()
+        if len(plays) == 0 or len(plays[0]) == 0:
+            return False, None, None
+        move = random.choice(plays)[0]
+        return True, move[1], move[0]
+
+    def single_moves(self, dice_value):
+        """
+        Lists the single piece moves the player whose turn it is can make with one dice move.
+
+        Pieces on the bar must enter first and pieces can only be borne off once all of them are home, using the exact
+        dice move or a higher one if no piece is further from home.
+
+        Parameters
+        ----------
+        dice_value : int
+            the dice move to use, 1 to 6
+
+        Returns
+        -------
+        list[(int, int)]
+            selected_piece and clicked_column pairs, clicked_column being None for bearing off
+        """
+
+        board = self.board
+        moves = []
+        if self.turn == 1:
+            if board[LIGHT_BAR] > 0:
+                if board[dice_value - 1] >= -1:
+                    moves.append((BAR, dice_value - 1))
+                return moves
+            all_home = True
+            for i in range(18):
+                if board[i] > 0:
+                    all_home = False
+                    break
+            for i in range(24):
+                if board[i] > 0:
+                    target = i + dice_value
+                    if target < 24:
+                        if board[target] >= -1:
+                            moves.append((i, target))
+                    elif all_home:
+                        if target == 24:
+                            moves.append((i, None))
+                        else:
+                            for j in range(18, i):
+                                if board[j] > 0:
+                                    break
+                            else:
+                                moves.append((i, None))
+        else:
+            if board[DARK_BAR] > 0:
+                if board[24 - dice_value] <= 1:
+                    moves.append((BAR, 24 - dice_value))
+                return moves
+            all_home = True
+            for i in range(6, 24):
+                if board[i] < 0:
+                    all_home = False
+                    break
+            for i in range(24):
+                if board[i] < 0:
+                    target = i - dice_value
+                    if target >= 0:
+                        if board[target] <= 1:
+                            moves.append((i, target))
+                    elif all_home:
+                        if target == -1:
+                            moves.append((i, None))
+                        else:
+                            for j in range(i + 1, 6):
+                                if board[j] < 0:
+                                    break
+                            else:
+                                moves.append((i, None))
+        return moves
+
+    def position_key(self):
+        """
+        Returns the pieces' positions as bytes, equal for equal positions.
+
+        Returns
+        -------
+        bytes
+        """
+
+        return self.board.tobytes() + bytes((self.light_count, self.dark_count))
+
+    def _search_plays(self, steps, plays, depths):
+        """
+        Walks every sequence of single piece moves for the remaining dice, depth first.
+
+        Each reached final position is stored once in plays, with the longest sequence leading to it. Nodes already
+        walked, identified by position and remaining dice, are not walked again.
+
+        Parameters
+        ----------
+        steps : list[(int, int, int)]
+            the moves made so far in this turn
+        plays : dict
+            maps final position keys to plays
+        depths : dict
+            maps walked nodes to the most dice moves usable from them
+
+        Returns
+        -------
+        int
+            the most dice moves usable from the current node
+        """
+
+        best = 0
+        for dice_value in sorted(set(self.dice), reverse=True):
+            for selected_piece, clicked_column in self.single_moves(dice_value):
+                record = self.apply_move(selected_piece, clicked_column, dice_value)
+                node = self.position_key() + bytes(sorted(self.dice))
+                depth = depths.get(node)
+                if depth is None:
+                    steps.append((selected_piece, clicked_column, dice_value))
+                    depth = self._search_plays(steps, plays, depths)
+                    steps.pop()
+                    depths[node] = depth
+                self.undo_move(record)
+                if depth + 1 > best:
+                    best = depth + 1
+        if best == 0:
+            key = self.position_key()
+            if key not in plays or len(plays[key]) < len(steps):
+                plays[key] = tuple(steps)
+        return best
+
+    def _generate_plays(self):
+        """
+        Generates the legal full-turn plays and the single piece moves that start them.
+
+        Plays must use as many dice moves as possible; if only one of two different dice can be used, the higher one
+        must be used when possible.
+
+        Returns
+        -------
+        (list[tuple[(int, int, int)]], set[(int, int, int)], list[bytes])
+            the plays, the first moves and the position keys the plays lead to
+        """
+
+        dice = list(self.dice)
+        plays = {}
+        depths = {}
+        max_depth = self._search_plays([], plays, depths)
+        legal = [(key, play) for key, play in plays.items() if len(play) == max_depth]
+        if max_depth == 1 and len(self.dice) == 2 and self.dice[0] != self.dice[1]:
+            high = max(self.dice)
+            if any(play[0][2] == high for _, play in legal):
+                legal = [(key, play) for key, play in legal if play[0][2] == high]
+        if max_depth == 0:
+            return [()], set(), [self.position_key()]
+        steps = set()
+        for dice_value in set(self.dice):
+            for selected_piece, clicked_column in self.single_moves(dice_value):
+                record = self.apply_move(selected_piece, clicked_column, dice_value)
+                node = self.position_key() + bytes(sorted(self.dice))
+                self.undo_move(record)
+                if depths[node] + 1 == max_depth:
+                    steps.add((selected_piece, clicked_column, dice_value))
+        if max_depth == 1:
+            steps = {play[0] for _, play in legal}
+        self.dice = dice
+        return [play for _, play in legal], steps, [key for key, _ in legal]
+
+    def _cached_plays(self):
+        """
+        Returns the legal plays, first moves and reached positions, generating them only if the position, dice or turn
+        changed.
+
+        The cache is keyed on position, remaining dice and turn, and dropped by every move, roll and turn change.
+
+        Returns
+        -------
+        (list[tuple[(int, int, int)]], set[(int, int, int)], list[bytes])
+        """
+
+        key = (self.position_key(), tuple(sorted(self.dice)), self.turn)
+        if self._plays is not None and self._plays_key == key:
+            self.cache_hits += 1
+            return self._plays
+        self.cache_misses += 1
+        plays = self._generate_plays()
+        self._plays_key = key
+        self._plays = plays
+        return plays
+
+    def legal_plays(self):
+        """
+        Lists every legal full-turn play for the remaining dice, one per resulting position.
+
+        A play is a tuple of (selected_piece, clicked_column, dice_value) moves, to be made in order. If no move can
+        be made, the only play is the empty one. The result is cached until the state changes and must not be
+        modified.
+
+        Returns
+        -------
+        list[tuple[(int, int, int)]]
+        """
+
+        return self._cached_plays()[0]
+
+    def legal_positions(self):
+        """
+        Lists the position keys reached by the legal full-turn plays, in the order of legal_plays.
+
+        The keys come from the play generation, so no play has to be made again to know where it leads. The result
+        is cached until the state changes and must not be modified.
+
+        Returns
+        -------
+        list[bytes]
+            see position_key
+        """
+
+        return self._cached_plays()[2]
+
+    def legal_steps(self):
+        """
+        Lists the single piece moves that start a legal full-turn play.
+
+        The result is cached until the state changes and must not be modified.
+
+        Returns
+        -------
+        set[(int, int, int)]
+            selected_piece, clicked_column and dice_value of each move
+        """
+
+        return self._cached_plays()[1]
+
+    def legal_step(self, selected_piece, clicked_column):
+        """
+        Returns the dice move to use for moving selected_piece to clicked_column, if legal this turn.
+
+        When bearing off, the exact dice move is preferred, then the highest one.
+
+        Parameters
+        ----------
+        selected_piece : int
+            the index of the column from which a piece was selected
+        clicked_column : int, optional
+            index of the clicked column, 0 to 24, or None if outside the board
+
+        Returns
+        -------
+        int, optional
+        """
+
+        dice_values = [step[2] for step in self.legal_steps()
+                       if step[0] == selected_piece and step[1] == clicked_column]
+        if len(dice_values) == 0:
+            return None
+        if clicked_column is None:
+            exact = 24 - selected_piece if self.turn == 1 else selected_piece + 1
+            if exact in dice_values:
+                return exact
+        return max(dice_values)
+
+    def apply_move(self, selected_piece, clicked_column, dice_value):
+        """
+        Moves one piece, hitting and bearing off as needed, and returns what is needed to undo it.
+
+        The move is not validated; use valid_move first.
+
+        Parameters
+        ----------
+        selected_piece : int
+            the index of the column from which the piece is moved, 24 for the bar
+        clicked_column : int, optional
+            index of the destination column, 0 to 23, or None to bear the piece off
+        dice_value : int
+            the dice move used, removed from the remaining dice
+
+        Returns
+        -------
+        (int, int, int, bool)
+            selected_piece, clicked_column (None for a piece borne off), dice_value and whether an opponent piece was
+            hit; undo_move reverts the move from it in constant time
+        """
+
+        board = self.board
+        zobrist = ZOBRIST
+        self._plays = None
+        self.dice.remove(dice_value)
+        hit = False
+        if self.turn == 1:
+            source = LIGHT_BAR if selected_piece == BAR else selected_piece
+            opponent_bar = DARK_BAR
+            step = 1
+        else:
+            source = DARK_BAR if selected_piece == BAR else selected_piece
+            opponent_bar = LIGHT_BAR
+            step = -1
+        position_hash = self.hash ^ zobrist[source][board[source]]
+        board[source] += -1 if source >= LIGHT_BAR else -step
+        position_hash ^= zobrist[source][board[source]]
+        if clicked_column is None:
+            if step == 1:
+                position_hash ^= ZOBRIST_LIGHT_COUNT[self.light_count] ^ ZOBRIST_LIGHT_COUNT[self.light_count + 1]
+                self.light_count += 1
+            else:
+                position_hash ^= ZOBRIST_DARK_COUNT[self.dark_count] ^ ZOBRIST_DARK_COUNT[self.dark_count + 1]
+                self.dark_count += 1
+        else:
+            pieces = board[clicked_column]
+            if pieces == -step:
+                position_hash ^= zobrist[opponent_bar][board[opponent_bar]]
+                board[opponent_bar] += 1
+                position_hash ^= zobrist[opponent_bar][board[opponent_bar]]
+                pieces = 0
+                hit = True
+            position_hash ^= zobrist[clicked_column][board[clicked_column]] ^ zobrist[clicked_column][pieces + step]
+            board[clicked_column] = pieces + step
+        self.hash = position_hash
+        return selected_piece, clicked_column, dice_value, hit
+
+    def undo_move(self, record):
+        """
+        Reverts a move made by apply_move, giving the dice move back.
+
+        Parameters
+        ----------
+        record : (int, int, int, bool)
+            the value returned by apply_move
+
+        Returns
+        -------
+        None
+        """
+
+        selected_piece, clicked_column, dice_value, hit = record
+        board = self.board
+        zobrist = ZOBRIST
+        self._plays = None
+        if self.turn == 1:
+            source = LIGHT_BAR if selected_piece == BAR else selected_piece
+            opponent_bar = DARK_BAR
+            step = 1
+        else:
+            source = DARK_BAR if selected_piece == BAR else selected_piece
+            opponent_bar = LIGHT_BAR
+            step = -1
+        position_hash = self.hash
+        if clicked_column is None:
+            if step == 1:
+                position_hash ^= ZOBRIST_LIGHT_COUNT[self.light_count] ^ ZOBRIST_LIGHT_COUNT[self.light_count - 1]
+                self.light_count -= 1
+            else:
+                position_hash ^= ZOBRIST_DARK_COUNT[self.dark_count] ^ ZOBRIST_DARK_COUNT[self.dark_count - 1]
+                self.dark_count -= 1
+        else:
+            pieces = -step if hit else board[clicked_column] - step
+            position_hash ^= zobrist[clicked_column][board[clicked_column]] ^ zobrist[clicked_column][pieces]
+            board[clicked_column] = pieces
+            if hit:
+                position_hash ^= zobrist[opponent_bar][board[opponent_bar]]
+                board[opponent_bar] -= 1
+                position_hash ^= zobrist[opponent_bar][board[opponent_bar]]
+        position_hash ^= zobrist[source][board[source]]
+        board[source] += 1 if source >= LIGHT_BAR else step
+        self.hash = position_hash ^ zobrist[source][board[source]]
+        self.dice.append(dice_value)
+
+    def end_turn(self):
+        """
+        Drops the remaining dice and passes the turn to the other player.
+
+        Returns
+        -------
+        None
+        """
+
+        self._plays = None
+        self.dice = []
+        self.turn = self.turn % 2 + 1
+        self.hash ^= ZOBRIST_TURN
+
+    def winner(self):
+        """
+        Returns the index of the player who bore off all pieces, if any.
+
+        Returns
+        -------
+        int, optional
+        """
+
+        if self.light_count == self.pieces:
+            return 1
+        if self.dark_count == self.pieces:
+            return 2
+        return None
+
+
+# timed while profiling is enabled, see profiling.py; legal plays of all kinds are answered by _cached_plays
+profiling.register(GameState, "valid_move")
+profiling.register(GameState, "valid_move_exists")
+profiling.register(GameState, "_cached_plays", "GameState.legal_plays", cache_counter="cache_hits")
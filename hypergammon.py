@@ -0,0 +1,644 @@
+import argparse
+import os
+import shutil
+import struct
+import tempfile
+import time
+from itertools import combinations_with_replacement
+from math import comb
+import numpy as np
+from evaluation import game_points
+from game_state import DARK_BAR, LIGHT_BAR, ROLLS
+
+
+MAGIC = b"BGHG"
+HEADER = struct.Struct("<4sHH")
+VERSION = 1
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hypergammon.bin")
+
+# the place of a piece, counted from its owner's side: 0 once borne off, 1 to 24 the dice moves left to bear it off
+# from a point, 25 on the bar. A piece at place d and an opponent piece at place 25 - d share a point.
+_PLACES = 26
+_BAR = 25
+# successor codes below _OFFSET are not positions: 0 stands for no value, 1 to 3 for a win of that many points
+_OFFSET = 4
+_NONE = np.iinfo(np.int32).max
+_PROBABILITIES = np.array([probability for _, _, probability in ROLLS], dtype=np.float32)
+
+
+def side_count(checkers=3):
+    """
+    Returns the number of ways to place one player's pieces.
+
+    Parameters
+    ----------
+    checkers : int
+        number of pieces per player
+
+    Returns
+    -------
+    int
+    """
+
+    return comb(_PLACES + checkers - 1, checkers)
+
+
+def position_count(checkers=3):
+    """
+    Returns the number of entries of the table: every placement of the pieces of the player to move, times every
+    placement of the opponent's, including the impossible ones where both share a point.
+
+    Parameters
+    ----------
+    checkers : int
+        number of pieces per player
+
+    Returns
+    -------
+    int
+    """
+
+    return side_count(checkers) ** 2
+
+
+def _sides(checkers):
+    """
+    Lists the placements of one player's pieces, and the rank of each.
+
+    Parameters
+    ----------
+    checkers : int
+        number of pieces per player
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray)
+        the (side_count, checkers) int8 sorted places of each placement, by rank, and the rank of every sorted
+        placement indexed by _flat
+    """
+
+    sides = np.array(list(combinations_with_replacement(range(_PLACES), checkers)), dtype=np.int8)
+    ranks = np.full(_PLACES ** checkers, -1, dtype=np.int32)
+    ranks[_flat(sides)] = np.arange(len(sides), dtype=np.int32)
+    return sides, ranks
+
+
+def _flat(places):
+    """
+    Returns the index of sorted placements in the rank array of _sides.
+
+    Parameters
+    ----------
+    places : numpy.ndarray
+        (n, checkers) sorted places
+
+    Returns
+    -------
+    numpy.ndarray
+        n int32 indices
+    """
+
+    index = np.zeros(len(places), dtype=np.int32)
+    for column in range(places.shape[1]):
+        index = index * _PLACES + places[:, column]
+    return index
+
+
+def _places(state):
+    """
+    Returns the places of the pieces of the player to move and of the opponent, see _PLACES.
+
+    Parameters
+    ----------
+    state : GameState
+        the position
+
+    Returns
+    -------
+    (list[int], list[int])
+        sorted places of the player to move's pieces and of the opponent's pieces
+    """
+
+    board = state.board
+    light = [0] * state.light_count + [_BAR] * board[LIGHT_BAR]
+    dark = [0] * state.dark_count + [_BAR] * board[DARK_BAR]
+    for column in range(24):
+        if board[column] > 0:
+            light += [24 - column] * board[column]
+        elif board[column] < 0:
+            dark += [column + 1] * -board[column]
+    light.sort()
+    dark.sort()
+    return (light, dark) if state.turn == 1 else (dark, light)
+
+
+def _valid(mover, opponent):
+    """
+    Decides which positions can occur with the player to move: no point holds pieces of both players and neither
+    player has borne off all pieces yet.
+
+    Parameters
+    ----------
+    mover : numpy.ndarray
+        (n, checkers) sorted places of the pieces of the player to move
+    opponent : numpy.ndarray
+        (n, checkers) sorted places of the opponent's pieces
+
+    Returns
+    -------
+    numpy.ndarray
+        n bools
+    """
+
+    on_points = (mover > 0) & (mover < _BAR)
+    shared = on_points[:, :, None] & (mover[:, :, None] + opponent[:, None, :] == _BAR)
+    return ~shared.any(axis=(1, 2)) & (mover[:, -1] > 0) & (opponent[:, -1] > 0)
+
+
+def _step(mover, opponent, slot, dice_value):
+    """
+    Moves one piece by one dice move in many positions at once, following GameState.single_moves.
+
+    Parameters
+    ----------
+    mover : numpy.ndarray
+        (n, checkers) sorted places of the pieces of the player to move
+    opponent : numpy.ndarray
+        (n, checkers) sorted places of the opponent's pieces
+    slot : int
+        the piece to move, by rank of its place
+    dice_value : int
+        the dice move
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        places of both players' pieces after the move, and whether the move is legal
+    """
+
+    source = mover[:, slot]
+    target = source - np.int8(dice_value)
+    furthest = mover[:, -1]
+    on_board = target > 0
+    target_pieces = opponent == (_BAR - target)[:, None]
+    blockers = target_pieces.sum(axis=1)
+    # pieces on the bar enter first; bearing off needs every piece home, and the furthest one for a higher dice move
+    legal = (source > 0) & ((furthest < _BAR) | (source == _BAR))
+    legal &= np.where(on_board, blockers < 2, (furthest <= 6) & ((target == 0) | (source == furthest)))
+    moved = mover.copy()
+    moved[:, slot] = np.maximum(target, 0)
+    moved.sort(axis=1)
+    hit = target_pieces & (on_board & (blockers == 1))[:, None]
+    opponent = np.where(hit, np.int8(_BAR), opponent)
+    opponent.sort(axis=1)
+    return moved, opponent, legal
+
+
+def _codes(mover, opponent, ranks, sides):
+    """
+    Returns the successor codes of positions right after a play: the points won if the player who moved bore off
+    the last piece, else the index of the position with the opponent to move, plus _OFFSET.
+
+    Parameters
+    ----------
+    mover : numpy.ndarray
+        (n, checkers) sorted places of the pieces of the player who moved
+    opponent : numpy.ndarray
+        (n, checkers) sorted places of the opponent's pieces
+    ranks : numpy.ndarray
+        ranks of the placements, see _sides
+    sides : int
+        number of placements of one player's pieces
+
+    Returns
+    -------
+    numpy.ndarray
+        n int32 codes
+    """
+
+    gammon = opponent[:, 0] > 0
+    # backgammon: a piece still on the bar or in the winner's home
+    points = 1 + gammon + (gammon & (opponent[:, -1] >= 19))
+    successors = ranks[_flat(opponent)] * sides + ranks[_flat(mover)] + _OFFSET
+    return np.where(mover[:, -1] == 0, points, successors).astype(np.int32)
+
+
+def _roll_codes(mover, opponent, dice_value_1, dice_value_2, ranks, sides):
+    """
+    Lists the distinct successor codes of the legal plays of one roll in many positions at once.
+
+    Every sequence of pieces to move is tried, as in GameState.legal_plays: plays must use as many dice moves as
+    possible, and the higher die when only one of two different dice can be used. Without a legal move, the position
+    passes to the opponent unchanged.
+
+    Parameters
+    ----------
+    mover : numpy.ndarray
+        (n, checkers) sorted places of the pieces of the player to move
+    opponent : numpy.ndarray
+        (n, checkers) sorted places of the opponent's pieces
+    dice_value_1 : int
+        value of the first die
+    dice_value_2 : int
+        value of the second die
+    ranks : numpy.ndarray
+        ranks of the placements, see _sides
+    sides : int
+        number of placements of one player's pieces
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray)
+        (n, width) int32 codes, each row sorted with _NONE after its distinct codes, and the number of codes per row
+    """
+
+    count, checkers = mover.shape
+    if dice_value_1 == dice_value_2:
+        orders = ((dice_value_1,) * 4,)
+    else:
+        orders = ((dice_value_1, dice_value_2), (dice_value_2, dice_value_1))
+    high = max(dice_value_1, dice_value_2)
+    # the nodes of every depth: places after the moves, legality of all moves so far and whether the first used high
+    levels = [[(mover, opponent, np.ones(count, dtype=bool), True)]]
+    for order in orders:
+        nodes = [(mover, opponent, np.ones(count, dtype=bool), order[0] == high)]
+        for depth, dice_value in enumerate(order, 1):
+            following = []
+            for node_mover, node_opponent, legal, first_high in nodes:
+                for slot in range(checkers):
+                    moved, hit, step_legal = _step(node_mover, node_opponent, slot, dice_value)
+                    following.append((moved, hit, legal & step_legal, first_high))
+            if len(levels) == depth:
+                levels.append([])
+            levels[depth] += following
+            nodes = following
+
+    deepest = np.zeros(count, dtype=np.int8)
+    for depth in range(1, len(levels)):
+        legal = np.zeros(count, dtype=bool)
+        for _, _, node_legal, _ in levels[depth]:
+            legal |= node_legal
+        deepest[legal] = depth
+    high_possible = np.zeros(count, dtype=bool)
+    for _, _, node_legal, first_high in levels[1]:
+        high_possible |= node_legal & first_high
+
+    width = max(len(nodes) for nodes in levels)
+    codes = np.full((count, width), _NONE, dtype=np.int32)
+    # the pass keeps the position, now with the opponent to move
+    codes[:, 0] = np.where(deepest == 0, _codes(*levels[0][0][:2], ranks, sides), _NONE)
+    for depth in range(1, len(levels)):
+        chosen = deepest == depth
+        if depth == 1 and dice_value_1 != dice_value_2:
+            chosen = chosen & (~high_possible | np.array([node[3] for node in levels[1]])[:, None])
+        else:
+            chosen = np.broadcast_to(chosen, (len(levels[depth]), count))
+        for column, (node_mover, node_opponent, legal, _) in enumerate(levels[depth]):
+            use = chosen[column] & legal
+            if use.any():
+                codes[use, column] = _codes(node_mover[use], node_opponent[use], ranks, sides)
+    codes.sort(axis=1)
+    codes[:, 1:][codes[:, 1:] == codes[:, :-1]] = _NONE
+    codes.sort(axis=1)
+    return codes, (codes != _NONE).sum(axis=1)
+
+
+def build_successors(directory, checkers=3, chunk_size=1 << 14, report=None):
+    """
+    Computes the successor codes of every position and roll and writes them to files in a directory.
+
+    Positions are handled chunk_size at a time, vectorized. Per chunk, the codes are stored roll by roll, position by
+    position within a roll, in successors.i32; counts.u8 holds how many codes each position has per roll.
+
+    Parameters
+    ----------
+    directory : str
+        existing directory for the files
+    checkers : int
+        number of pieces per player
+    chunk_size : int
+        number of positions per chunk
+    report : callable, optional
+        called with the number of positions done and the number of positions, after each chunk
+
+    Returns
+    -------
+    numpy.ndarray
+        offset of each chunk's codes in successors.i32, and the total number of codes last
+    """
+
+    sides, ranks = _sides(checkers)
+    side_total = len(sides)
+    total = side_total ** 2
+    offsets = [0]
+    with open(os.path.join(directory, "successors.i32"), "wb") as successors, \
+            open(os.path.join(directory, "counts.u8"), "wb") as counts:
+        for start in range(0, total, chunk_size):
+            indices = np.arange(start, min(start + chunk_size, total))
+            mover = sides[indices // side_total]
+            opponent = sides[indices % side_total]
+            valid = _valid(mover, opponent)
+            valid_mover, valid_opponent = mover[valid], opponent[valid]
+            written = 0
+            for dice_value_1, dice_value_2, _ in ROLLS:
+                codes, code_counts = _roll_codes(valid_mover, valid_opponent, dice_value_1, dice_value_2, ranks,
+                                                 side_total)
+                # impossible positions get the single code 0, worth nothing
+                chunk_codes = np.zeros((len(indices), codes.shape[1]), dtype=np.int32)
+                chunk_codes[:, 1:] = _NONE
+                chunk_codes[valid] = codes
+                chunk_counts = np.ones(len(indices), dtype=np.uint8)
+                chunk_counts[valid] = code_counts
+                chunk_codes = chunk_codes[chunk_codes != _NONE]
+                chunk_codes.tofile(successors)
+                chunk_counts.tofile(counts)
+                written += len(chunk_codes)
+            offsets.append(offsets[-1] + written)
+            if report is not None:
+                report(indices[-1] + 1, total)
+    return np.array(offsets, dtype=np.int64)
+
+
+def solve(directory, offsets, checkers=3, chunk_size=1 << 14, tolerance=1e-4, max_sweeps=1000, report=None):
+    """
+    Computes the equity of every position by value iteration over the successors written by build_successors.
+
+    The equity of a position is the average over the rolls of the best play's value, which is the points won or the
+    opposite of the equity of the position reached. Each sweep updates the positions chunk by chunk in place, so
+    later chunks already use the new values; sweeps stop once no equity changes by more than tolerance.
+
+    Parameters
+    ----------
+    directory : str
+        directory holding the files of build_successors
+    offsets : numpy.ndarray
+        chunk offsets returned by build_successors
+    checkers : int
+        number of pieces per player
+    chunk_size : int
+        number of positions per chunk, as in build_successors
+    tolerance : float
+        largest change of an equity in the last sweep
+    max_sweeps : int
+        maximum number of sweeps
+    report : callable, optional
+        called with the sweep number and the largest change of an equity, after each sweep
+
+    Returns
+    -------
+    numpy.ndarray
+        the float32 equity of every position, in cubeless points for the player to move, 0 for impossible positions
+    """
+
+    total = position_count(checkers)
+    successors = np.memmap(os.path.join(directory, "successors.i32"), dtype=np.int32, mode="r")
+    counts = np.memmap(os.path.join(directory, "counts.u8"), dtype=np.uint8, mode="r")
+    # the value of a successor code is minus its entry: positions are worth the opposite to the player who moved
+    values = np.zeros(_OFFSET + total, dtype=np.float32)
+    values[1:_OFFSET] = -np.arange(1, _OFFSET)
+    equities = values[_OFFSET:]
+    rolls = len(ROLLS)
+    for sweep in range(1, max_sweeps + 1):
+        change = 0.0
+        for chunk, start in enumerate(range(0, total, chunk_size)):
+            stop = min(start + chunk_size, total)
+            codes = successors[offsets[chunk]:offsets[chunk + 1]]
+            chunk_counts = counts[rolls * start:rolls * stop]
+            starts = np.zeros(len(chunk_counts), dtype=np.int64)
+            np.cumsum(chunk_counts[:-1], out=starts[1:])
+            best = np.maximum.reduceat(-values[codes], starts).reshape(rolls, stop - start)
+            updated = _PROBABILITIES @ best
+            change = max(change, float(np.abs(updated - equities[start:stop]).max()))
+            equities[start:stop] = updated
+        if report is not None:
+            report(sweep, change)
+        if change < tolerance:
+            break
+    return equities
+
+
+def generate(path=DEFAULT_PATH, checkers=3, work_dir=None, chunk_size=1 << 14, tolerance=1e-4, max_sweeps=1000,
+             report=None):
+    """
+    Solves hypergammon exactly and writes the equity of every position to a table file.
+
+    The successors of all positions are written to work_dir first, a few GB for 3 pieces, then value iteration runs
+    over them; the table holds one float16 per position.
+
+    Parameters
+    ----------
+    path : str
+        file to write
+    checkers : int
+        number of pieces per player; 1 and 2 solve in seconds, for testing
+    work_dir : str, optional
+        directory for the successor files, kept afterwards; a temporary directory by default
+    chunk_size : int
+        number of positions handled at once
+    tolerance : float
+        largest change of an equity in the last sweep of value iteration
+    max_sweeps : int
+        maximum number of sweeps of value iteration
+    report : callable, optional
+        called with a progress message
+
+    Returns
+    -------
+    int
+        number of positions written
+    """
+
+    directory = tempfile.mkdtemp() if work_dir is None else work_dir
+    os.makedirs(directory, exist_ok=True)
+    try:
+        offsets = build_successors(directory, checkers, chunk_size,
+                                   None if report is None else lambda done, total: report(f"{done}/{total} positions"))
+        equities = solve(directory, offsets, checkers, chunk_size, tolerance, max_sweeps,
+                         None if report is None else lambda sweep, change: report(f"sweep {sweep}: {change:.2e}"))
+    finally:
+        if work_dir is None:
+            shutil.rmtree(directory)
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, checkers))
+        equities.astype(np.float16).tofile(file)
+    return len(equities)
+
+
+class HypergammonTable:
+    """
+    A class used to look up the exact equities written by generate, memory-mapped.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+        the table file
+    checkers : int
+        number of pieces per player
+
+    Methods
+    -------
+    covers(state):
+        Decides whether the table holds the position.
+    equity(state):
+        Returns the cubeless equity of the player to move, before rolling.
+    close():
+        Releases the memory map.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        """
+        Parameters
+        ----------
+        path : str
+            the table file
+        """
+
+        self.path = path
+        with open(path, "rb") as file:
+            magic, version, self.checkers = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a hypergammon table")
+        self._equities = np.memmap(path, dtype=np.float16, mode="r", offset=HEADER.size)
+        if len(self._equities) != position_count(self.checkers):
+            raise ValueError(f"{path} is truncated")
+        self._sides = side_count(self.checkers)
+        _, self._ranks = _sides(self.checkers)
+
+    def covers(self, state):
+        """
+        Decides whether the table holds the position: both players have the table's number of pieces.
+
+        Parameters
+        ----------
+        state : GameState
+            the position
+
+        Returns
+        -------
+        bool
+        """
+
+        mover, opponent = _places(state)
+        return len(mover) == len(opponent) == self.checkers
+
+    def equity(self, state):
+        """
+        Returns the cubeless equity of the player to move, before rolling: the points they win on average with
+        perfect play on both sides, negative when losing.
+
+        Parameters
+        ----------
+        state : GameState
+            a position covered by the table, the game not over
+
+        Returns
+        -------
+        float
+        """
+
+        mover, opponent = (np.array([places], dtype=np.int8) for places in _places(state))
+        index = int(self._ranks[_flat(mover)[0]]) * self._sides + int(self._ranks[_flat(opponent)[0]])
+        return float(self._equities[index])
+
+    def close(self):
+        """
+        Releases the memory map.
+
+        Returns
+        -------
+        None
+        """
+
+        self._equities = None
+
+
+class HypergammonAgent:
+    """
+    A class used to represent an agent playing hypergammon perfectly from a HypergammonTable.
+
+    ...
+
+    Positions with another number of pieces, like those of standard games, are left to the fallback agent.
+
+    Attributes
+    ----------
+    table : HypergammonTable
+        the exact equities
+    fallback : object
+        agent choosing the play outside the table
+
+    Methods
+    -------
+    choose_play(state):
+        Returns the legal play with the best exact equity, or the fallback agent's play.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, fallback="heuristic"):
+        """
+        Parameters
+        ----------
+        path : str
+            the table file
+        fallback : str
+            name of the agent used for positions outside the table, see agents.AGENTS
+        """
+
+        # imported here, as agents imports this module
+        from agents import make_agent
+        self.table = HypergammonTable(path)
+        self.fallback = make_agent(fallback)
+
+    def choose_play(self, state):
+        """
+        Returns the legal play with the best exact equity, or the fallback agent's play.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, with the dice rolled
+
+        Returns
+        -------
+        tuple[(int, int, int)]
+        """
+
+        plays = state.legal_plays()
+        if len(plays) == 1:
+            return plays[0]
+        if not self.table.covers(state):
+            return self.fallback.choose_play(state)
+        best_play, best_value = None, None
+        for play in plays:
+            after = state.copy()
+            for step in play:
+                after.apply_move(*step)
+            winner = after.winner()
+            if winner is not None:
+                value = game_points(after, winner)
+            else:
+                after.end_turn()
+                value = -self.table.equity(after)
+            if best_value is None or value > best_value:
+                best_play, best_value = play, value
+        return best_play
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve hypergammon by value iteration and write the equity table.")
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH, help="file to write")
+    parser.add_argument("--checkers", type=int, default=3, help="number of pieces per player")
+    parser.add_argument("--work-dir", help="directory for the successor files, kept afterwards")
+    parser.add_argument("--chunk-size", type=int, default=1 << 14, help="number of positions handled at once")
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="largest equity change of the last sweep")
+    parser.add_argument("--max-sweeps", type=int, default=1000, help="maximum number of value iteration sweeps")
+    args = parser.parse_args()
+    start = time.perf_counter()
+
+    def report(message):
+        print(f"{time.perf_counter() - start:8.1f}s  {message}", flush=True)
+
+    count = generate(args.path, args.checkers, args.work_dir, args.chunk_size, args.tolerance, args.max_sweeps,
+                     report)
+    print(f"{count} positions written to {args.path} in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,387 @@
+import argparse
+import os
+import random
+import time
+import numpy as np
+from batch_evaluation import BAR_SLOT, OFF_SLOT, stack_keys, stack_positions
+from evaluation import game_points
+from game_state import GameState
+
+
+INPUTS = 198
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "neural.npz")
+
+
+def encode(boards, turns):
+    """
+    Encodes stacked positions with the 198 inputs of TD-Gammon.
+
+    For each player and each of the 24 points, in the player's direction of travel, 4 units tell whether the player
+    has at least 1, 2 and 3 pieces there and, with (n - 3) / 2, how many more. Then come, for each player, the pieces
+    on the bar over 2 and the pieces borne off over 15, and last two units for the player about to roll.
+
+    Parameters
+    ----------
+    boards : numpy.ndarray
+        array of shape (N, 26, 2), see batch_evaluation.stack_positions
+    turns : numpy.ndarray
+        index of the player about to roll in each position, 1 or 2
+
+    Returns
+    -------
+    numpy.ndarray
+        float array of shape (N, 198)
+    """
+
+    count = len(boards)
+    points = np.stack((boards[:, :24, 0], boards[:, 23::-1, 1]), axis=1).astype(np.float64)
+    units = np.empty((count, 2, 24, 4))
+    units[..., 0] = points >= 1
+    units[..., 1] = points >= 2
+    units[..., 2] = points >= 3
+    units[..., 3] = np.maximum(points - 3, 0) / 2
+    inputs = np.empty((count, INPUTS))
+    inputs[:, :192] = units.reshape(count, 192)
+    inputs[:, 192:194] = boards[:, BAR_SLOT] / 2
+    inputs[:, 194:196] = boards[:, OFF_SLOT] / 15
+    inputs[:, 196] = turns == 1
+    inputs[:, 197] = turns == 2
+    return inputs
+
+
+def _sigmoid(x):
+    """Returns the logistic function of x, element-wise."""
+
+    return 1 / (1 + np.exp(-x))
+
+
+class NeuralNetwork:
+    """
+    A class used to estimate the outcome of positions with a one hidden layer network, see encode.
+
+    ...
+
+    The 3 sigmoid outputs are, for player 1, the probability of winning, of winning a gammon and of losing a gammon.
+    They are trained by temporal difference learning, TD(lambda), on games the network plays against itself.
+
+    Attributes
+    ----------
+    hidden_weights : numpy.ndarray
+        weights of shape (198, hidden) from the inputs to the hidden units
+    hidden_biases : numpy.ndarray
+        biases of the hidden units
+    output_weights : numpy.ndarray
+        weights of shape (hidden, 3) from the hidden units to the outputs
+    output_biases : numpy.ndarray
+        biases of the outputs
+
+    Methods
+    -------
+    forward(inputs):
+        Returns the outputs for a batch of encoded positions.
+    equities(boards, turns, player):
+        Returns the equity of stacked positions for the given player.
+    gradient(inputs):
+        Returns the outputs for one encoded position and their gradients with respect to the weights.
+    parameters():
+        Lists the weight arrays, in the order of gradient.
+    save(path):
+        Writes the weights to a compressed .npz file.
+    load(path):
+        Reads a network saved by save.
+    """
+
+    def __init__(self, hidden=40, rng=None):
+        """
+        Creates a network with small random weights.
+
+        Parameters
+        ----------
+        hidden : int
+            number of hidden units
+        rng : numpy.random.Generator, optional
+            source of the initial weights
+        """
+
+        rng = np.random.default_rng() if rng is None else rng
+        self.hidden_weights = rng.uniform(-0.1, 0.1, (INPUTS, hidden))
+        self.hidden_biases = np.zeros(hidden)
+        self.output_weights = rng.uniform(-0.1, 0.1, (hidden, 3))
+        self.output_biases = np.zeros(3)
+
+    def forward(self, inputs):
+        """
+        Returns the outputs for a batch of encoded positions.
+
+        Parameters
+        ----------
+        inputs : numpy.ndarray
+            array of shape (N, 198), see encode
+
+        Returns
+        -------
+        numpy.ndarray
+            array of shape (N, 3): player 1's probabilities of winning, winning a gammon and losing a gammon
+        """
+
+        hidden = _sigmoid(inputs @ self.hidden_weights + self.hidden_biases)
+        return _sigmoid(hidden @ self.output_weights + self.output_biases)
+
+    def equities(self, boards, turns, player):
+        """
+        Returns the equity of stacked positions for the given player, counting gammons double.
+
+        Parameters
+        ----------
+        boards : numpy.ndarray
+            array of shape (N, 26, 2), see batch_evaluation.stack_positions
+        turns : numpy.ndarray
+            index of the player about to roll in each position
+        player : int
+            index of the player the equity is computed for, 1 or 2
+
+        Returns
+        -------
+        numpy.ndarray
+            float array of shape (N,)
+        """
+
+        outputs = self.forward(encode(boards, turns))
+        equities = 2 * outputs[:, 0] - 1 + outputs[:, 1] - outputs[:, 2]
+        return equities if player == 1 else -equities
+
+    def gradient(self, inputs):
+        """
+        Returns the outputs for one encoded position and their gradients with respect to the weights.
+
+        Parameters
+        ----------
+        inputs : numpy.ndarray
+            array of shape (198,)
+
+        Returns
+        -------
+        (numpy.ndarray, list[numpy.ndarray])
+            the 3 outputs, then for each of hidden_weights, hidden_biases, output_weights and output_biases an array
+            of its shape with a leading axis of 3, the gradient of each output
+        """
+
+        hidden = _sigmoid(inputs @ self.hidden_weights + self.hidden_biases)
+        outputs = _sigmoid(hidden @ self.output_weights + self.output_biases)
+        output_slopes = outputs * (1 - outputs)
+        # (3, hidden): how each output moves with the net input of each hidden unit
+        hidden_slopes = (self.output_weights * output_slopes).T * (hidden * (1 - hidden))
+        gradients = [
+            inputs[None, :, None] * hidden_slopes[:, None, :],
+            hidden_slopes,
+            np.eye(3)[:, None, :] * (hidden[:, None] * output_slopes)[None],
+            np.diag(output_slopes),
+        ]
+        return outputs, gradients
+
+    def parameters(self):
+        """
+        Lists the weight arrays, in the order of gradient.
+
+        Returns
+        -------
+        list[numpy.ndarray]
+        """
+
+        return [self.hidden_weights, self.hidden_biases, self.output_weights, self.output_biases]
+
+    def save(self, path=DEFAULT_PATH):
+        """
+        Writes the weights to a compressed .npz file, as 32-bit floats.
+
+        Parameters
+        ----------
+        path : str
+            file to write
+
+        Returns
+        -------
+        None
+        """
+
+        np.savez_compressed(path, **{name: weights.astype(np.float32) for name, weights in
+                                     zip(("hidden_weights", "hidden_biases", "output_weights", "output_biases"),
+                                         self.parameters())})
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        """
+        Reads a network saved by save.
+
+        Parameters
+        ----------
+        path : str
+            the .npz file
+
+        Returns
+        -------
+        NeuralNetwork
+        """
+
+        with np.load(path) as weights:
+            network = cls(weights["hidden_biases"].shape[0])
+            network.hidden_weights = weights["hidden_weights"].astype(np.float64)
+            network.hidden_biases = weights["hidden_biases"].astype(np.float64)
+            network.output_weights = weights["output_weights"].astype(np.float64)
+            network.output_biases = weights["output_biases"].astype(np.float64)
+        return network
+
+
+def _outcome(state, winner):
+    """
+    Returns the target outputs of a finished game, see NeuralNetwork.forward.
+
+    Parameters
+    ----------
+    state : GameState
+        the finished game
+    winner : int
+        index of the winning player
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    gammon = game_points(state, winner) >= 2
+    return np.array([winner == 1, winner == 1 and gammon, winner == 2 and gammon], dtype=np.float64)
+
+
+def train(network, games, alpha=0.1, trace_decay=0.7, rng=None, report=None):
+    """
+    Trains the network by TD(lambda) on games it plays against itself, always choosing its best play.
+
+    After each play, the outputs for the position before it are moved towards the outputs for the position after it,
+    or towards the result once the game is over, along eligibility traces of the earlier positions of the game.
+
+    Parameters
+    ----------
+    network : NeuralNetwork
+        the network, updated in place
+    games : int
+        number of games to play
+    alpha : float
+        learning rate
+    trace_decay : float
+        lambda, the decay of the eligibility traces
+    rng : random.Random, optional
+        source of the dice values
+    report : callable, optional
+        called with the number of games played after each game
+
+    Returns
+    -------
+    None
+    """
+
+    rng = random.Random() if rng is None else rng
+    parameters = network.parameters()
+    for game in range(games):
+        state = GameState(rng.choice((1, 2)))
+        traces = [np.zeros((3,) + weights.shape) for weights in parameters]
+        outputs, gradients = network.gradient(encode(stack_positions([state]), np.array([state.turn]))[0])
+        while True:
+            mover = state.turn
+            state.roll(rng)
+            plays = state.legal_plays()
+            inputs = encode(stack_keys(state.legal_positions()), np.full(len(plays), 3 - mover))
+            candidates = network.forward(inputs)
+            equities = 2 * candidates[:, 0] - 1 + candidates[:, 1] - candidates[:, 2]
+            best = int(np.argmax(equities) if mover == 1 else np.argmin(equities))
+            for step in plays[best]:
+                state.apply_move(*step)
+            state.end_turn()
+            winner = state.winner()
+            target = _outcome(state, winner) if winner is not None else candidates[best]
+            errors = target - outputs
+            for weights, trace, gradient in zip(parameters, traces, gradients):
+                trace *= trace_decay
+                trace += gradient
+                weights += alpha * np.tensordot(errors, trace, axes=1)
+            if winner is not None:
+                break
+            outputs, gradients = network.gradient(inputs[best])
+        if report is not None:
+            report(game + 1)
+
+
+class NeuralAgent:
+    """
+    A class used to represent an agent playing the legal play with the best equity according to a NeuralNetwork.
+
+    ...
+
+    Attributes
+    ----------
+    network : NeuralNetwork
+        the trained network
+
+    Methods
+    -------
+    choose_play(state):
+        Returns the legal play leading to the best position according to the network.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, network=None):
+        """
+        Parameters
+        ----------
+        path : str
+            .npz file of the weights, see train
+        network : NeuralNetwork, optional
+            network to use instead of reading one from path
+        """
+
+        self.network = NeuralNetwork.load(path) if network is None else network
+
+    def choose_play(self, state):
+        """
+        Returns the legal play leading to the best position according to the network.
+
+        Every candidate play is evaluated in one batched forward pass.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, with the dice rolled
+
+        Returns
+        -------
+        tuple[(int, int, int)]
+        """
+
+        plays = state.legal_plays()
+        if len(plays) == 1:
+            return plays[0]
+        boards = stack_keys(state.legal_positions())
+        equities = self.network.equities(boards, np.full(len(plays), 3 - state.turn), state.turn)
+        return plays[int(np.argmax(equities))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the neural network evaluator by self-play.")
+    parser.add_argument("games", type=int, help="number of training games")
+    parser.add_argument("--path", default=DEFAULT_PATH, help=".npz file of the weights")
+    parser.add_argument("--resume", action="store_true", help="continue training the weights in path")
+    parser.add_argument("--hidden", type=int, default=40, help="number of hidden units of a new network")
+    parser.add_argument("--alpha", type=float, default=0.1, help="learning rate")
+    parser.add_argument("--trace-decay", type=float, default=0.7, help="lambda of TD(lambda)")
+    parser.add_argument("--seed", type=int, help="seed of the initial weights and of the dice")
+    parser.add_argument("--save-every", type=int, default=1000, help="games between two saves of the weights")
+    args = parser.parse_args()
+
+    network = (NeuralNetwork.load(args.path) if args.resume else
+               NeuralNetwork(args.hidden, np.random.default_rng(args.seed)))
+    start = time.perf_counter()
+
+    def report(played):
+        if played % args.save_every == 0 or played == args.games:
+            network.save(args.path)
+            print(f"{played} games, {played / (time.perf_counter() - start):.1f} games/s, saved to {args.path}")
+
+    train(network, args.games, args.alpha, args.trace_decay, random.Random(args.seed), report)
@@ -0,0 +1,307 @@
+import argparse
+import os
+import struct
+import time
+from evaluation import evaluate
+from game_state import LIGHT_BAR, DARK_BAR, ROLLS, GameState
+from rollout import RolloutEvaluator
+
+
+MAGIC = b"BGOB"
+HEADER = struct.Struct("<4sHH")
+VERSION = 1
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+
+# position key, player to move, higher and lower dice value, number of moves
+_ENTRY = struct.Struct("<28sBBBB")
+_MOVE = struct.Struct("<BBB")
+_OFF = 255
+
+
+def _key(state):
+    """
+    Returns the book key of a position with the dice rolled.
+
+    Parameters
+    ----------
+    state : GameState
+        the position
+
+    Returns
+    -------
+    bytes
+    """
+
+    dice = sorted(set(state.dice), reverse=True)
+    return state.position_key() + bytes((state.turn, dice[0], dice[-1]))
+
+
+def mirror(state):
+    """
+    Returns the same position seen from the other side: the players swap colours and board halves.
+
+    Parameters
+    ----------
+    state : GameState
+        the position
+
+    Returns
+    -------
+    GameState
+    """
+
+    board = [-state.board[23 - point] for point in range(24)] + [state.board[DARK_BAR], state.board[LIGHT_BAR]]
+    return GameState(3 - state.turn, board, state.dark_count, state.light_count, state.dice)
+
+
+def mirror_play(state, play):
+    """
+    Returns the play of the mirrored position reaching the mirror image of the play's position, see mirror.
+
+    The legal play is returned rather than the mirrored moves themselves, as plays of doubles are listed in a
+    canonical move order.
+
+    Parameters
+    ----------
+    state : GameState
+        the position, with the dice rolled
+    play : tuple[(int, int, int)]
+        the play
+
+    Returns
+    -------
+    tuple[(int, int, int)]
+    """
+
+    after = state.copy()
+    for step in play:
+        after.apply_move(*step)
+    mirrored = mirror(state)
+    return mirrored.legal_plays()[mirrored.legal_positions().index(mirror(after).position_key())]
+
+
+def candidate_plays(state, count=None):
+    """
+    Returns the legal plays with the best static evaluation, best first.
+
+    Parameters
+    ----------
+    state : GameState
+        the position, with the dice rolled
+    count : int, optional
+        number of plays to return; all the legal plays by default
+
+    Returns
+    -------
+    list[tuple[(int, int, int)]]
+    """
+
+    mover = state.turn
+    values = []
+    for play in state.legal_plays():
+        after = state.copy()
+        for step in play:
+            after.apply_move(*step)
+        after.end_turn()
+        values.append((evaluate(after, mover), play))
+    values.sort(key=lambda value: value[0], reverse=True)
+    return [play for _, play in values[:count]]
+
+
+def generate(path=DEFAULT_PATH, trials=3888, reply_trials=648, candidates=None, reply_candidates=6, replies=True,
+             policy="heuristic", workers=None, seed=None, report=None):
+    """
+    Rolls out the candidate plays of the 15 opening rolls and writes the best ones to a book file.
+
+    Doubles cannot be rolled first, as each player rolls one die to decide who starts. With replies, the 21 rolls
+    of the second player after each of the book's opening plays are rolled out too. Every legal opening play is
+    rolled out by default, but only the replies with the best static evaluation, which keeps the book to a few
+    hours of rollouts. Plays are rolled out for the light player and stored for both, the dark player's position
+    being the mirror image.
+
+    The rollouts need thousands of games per play to tell close plays apart: two plays' results differ by about 1.7
+    points per game, the dice being shared, so a 0.05 difference in equity takes some 4000 games to be significant.
+    With the heuristic policy, the best plays of most opening rolls are closer than that (8/5 6/5 and 24/21 24/23
+    for 3-1 are within 0.05 of each other), so a sound book needs a stronger policy or many more trials.
+
+    Parameters
+    ----------
+    path : str
+        file to write
+    trials : int
+        maximum number of rollout games per play of the opening rolls, see rollout.RolloutEvaluator
+    reply_trials : int, optional
+        maximum number of rollout games per play of the replies; trials if None
+    candidates : int, optional
+        number of plays rolled out per opening roll; all the legal plays if None
+    reply_candidates : int, optional
+        number of plays rolled out per reply; all the legal plays if None
+    replies : bool
+        also book the second player's first play
+    policy : str
+        key of the agent playing the rollouts in agents.AGENTS
+    workers : int, optional
+        number of rollout processes; the number of CPUs by default
+    seed : int, optional
+        seed of the rollout dice, for repeatable books
+    report : callable, optional
+        called with each booked position and its play
+
+    Returns
+    -------
+    int
+        number of entries written
+    """
+
+    book = {}
+
+    def add(state, position_trials, position_candidates):
+        evaluator.trials = position_trials
+        play = evaluator.evaluate(state, candidate_plays(state, position_candidates))[0].play
+        for position, position_play in ((state, play), (mirror(state), mirror_play(state, play))):
+            book[_key(position)] = position_play
+        if report is not None:
+            report(state, play)
+        return play
+
+    with RolloutEvaluator(trials, workers, policy=policy, seed=seed) as evaluator:
+        for dice_value_1, dice_value_2, _ in ROLLS:
+            if dice_value_1 == dice_value_2:
+                continue
+            state = GameState(1)
+            state.set_dice(dice_value_2, dice_value_1)
+            play = add(state, trials, candidates)
+            if not replies:
+                continue
+            for step in play:
+                state.apply_move(*step)
+            state.end_turn()
+            for reply_1, reply_2, _ in ROLLS:
+                reply = state.copy()
+                reply.set_dice(reply_2, reply_1)
+                add(reply, reply_trials or trials, reply_candidates)
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(book)))
+        for key, play in book.items():
+            file.write(_ENTRY.pack(key[:28], key[28], key[29], key[30], len(play)))
+            for selected_piece, clicked_column, dice_value in play:
+                file.write(_MOVE.pack(selected_piece, _OFF if clicked_column is None else clicked_column, dice_value))
+    return len(book)
+
+
+class OpeningBook:
+    """
+    A class used to look up precomputed plays for the first turns of a game, see generate.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+        the book file
+
+    Methods
+    -------
+    play(state):
+        Returns the book play of the position, if any.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        """
+        Reads the whole book, a few kilobytes, into memory.
+
+        Parameters
+        ----------
+        path : str
+            the book file
+        """
+
+        self.path = path
+        with open(path, "rb") as file:
+            data = file.read()
+        magic, version, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not an opening book")
+        self._plays = {}
+        offset = HEADER.size
+        for _ in range(count):
+            key, turn, dice_value_1, dice_value_2, moves = _ENTRY.unpack_from(data, offset)
+            offset += _ENTRY.size
+            play = []
+            for _ in range(moves):
+                selected_piece, clicked_column, dice_value = _MOVE.unpack_from(data, offset)
+                offset += _MOVE.size
+                play.append((selected_piece, None if clicked_column == _OFF else clicked_column, dice_value))
+            self._plays[key + bytes((turn, dice_value_1, dice_value_2))] = tuple(play)
+
+    def __len__(self):
+        return len(self._plays)
+
+    def play(self, state):
+        """
+        Returns the book play of the position, if any.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, with the dice rolled
+
+        Returns
+        -------
+        tuple[(int, int, int)], optional
+            the play, None if the position is not in the book
+        """
+
+        if not state.dice:
+            return None
+        play = self._plays.get(_key(state))
+        # a book written for other rules must not make illegal plays
+        return play if play is not None and play in state.legal_plays() else None
+
+
+_default_book = None
+_default_checked = False
+
+
+def default_book():
+    """
+    Returns the book at DEFAULT_PATH, reading it on first use, or None if it is missing.
+
+    Returns
+    -------
+    OpeningBook, optional
+    """
+
+    global _default_book, _default_checked
+    if not _default_checked:
+        _default_checked = True
+        if os.path.exists(DEFAULT_PATH):
+            _default_book = OpeningBook(DEFAULT_PATH)
+    return _default_book
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the opening book by rollouts.")
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH, help="file to write")
+    parser.add_argument("--trials", type=int, default=3888, help="maximum number of rollout games per play")
+    parser.add_argument("--reply-trials", type=int, default=648,
+                        help="maximum number of rollout games per play of the replies")
+    parser.add_argument("--candidates", type=int, default=0,
+                        help="number of plays rolled out per opening roll, 0 for all of them")
+    parser.add_argument("--reply-candidates", type=int, default=6,
+                        help="number of plays rolled out per reply, 0 for all of them")
+    parser.add_argument("--no-replies", dest="replies", action="store_false",
+                        help="only book the opening rolls, not the second player's replies")
+    parser.add_argument("--policy", default="heuristic", help="agent playing the rollouts")
+    parser.add_argument("--workers", type=int, help="number of rollout processes")
+    parser.add_argument("--seed", type=int, help="seed of the rollout dice")
+    args = parser.parse_args()
+    start = time.perf_counter()
+
+    def report(state, play):
+        print(f"{time.perf_counter() - start:7.1f}s  player {state.turn} rolls {state.dice[:2]}: {play}")
+
+    count = generate(args.path, args.trials, args.reply_trials, args.candidates or None, args.reply_candidates or None,
+                     args.replies, args.policy, args.workers, args.seed, report)
+    print(f"{count} positions written to {args.path} in {time.perf_counter() - start:.1f}s")
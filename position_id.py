@@ -0,0 +1,263 @@
+import base64
+import numpy as np
+from batch_evaluation import BAR_SLOT, OFF_SLOT
+from game_state import LIGHT_BAR, DARK_BAR, VARIANTS, GameState
+
+
+KEY_SIZE = 10
+TEXT_SIZE = 14
+
+# column of GameState.board holding each of a player's 25 slots, in the order of the key: their 1 point (the last
+# one they move through) to their 24 point, then their bar
+_COLUMNS = {1: list(range(23, -1, -1)) + [LIGHT_BAR], 2: list(range(24)) + [DARK_BAR]}
+
+
+def _slot_counts(state, player):
+    """
+    Returns the player's piece counts on their 25 slots, in the order of the key.
+
+    Parameters
+    ----------
+    state : GameState
+        the position
+    player : int
+        index of the player, 1 or 2
+
+    Returns
+    -------
+    list[int]
+    """
+
+    board = state.board
+    if player == 1:
+        return [max(board[column], 0) for column in _COLUMNS[1][:24]] + [board[LIGHT_BAR]]
+    return [max(-board[column], 0) for column in _COLUMNS[2][:24]] + [board[DARK_BAR]]
+
+
+def encode(state):
+    """
+    Returns the 10-byte position key of the position, seen by the player to move.
+
+    The key is the 80-bit position ID of GNU Backgammon: for the opponent, then for the player to move, and for
+    each of their 25 slots (their 1 to 24 points, then the bar), as many 1 bits as pieces followed by a 0 bit.
+    Borne off pieces are the ones missing. Bits are stored from the lowest bit of the first byte up, the rest being
+    0. The key of the starting position is 4HPwATDgc/ABMA in text form, see to_text.
+
+    Parameters
+    ----------
+    state : GameState
+        the position; state.turn is the player to move
+
+    Returns
+    -------
+    bytes
+    """
+
+    value = 0
+    bit = 0
+    for player in (3 - state.turn, state.turn):
+        for pieces in _slot_counts(state, player):
+            value |= ((1 << pieces) - 1) << bit
+            bit += pieces + 1
+    return value.to_bytes(KEY_SIZE, "little")
+
+
+def decode(key, turn=1, variant="standard"):
+    """
+    Returns the position of a 10-byte position key, see encode.
+
+    Parameters
+    ----------
+    key : bytes
+        the position key
+    turn : int
+        index of the player to move, whose pieces come second in the key
+    variant : str
+        the variant of the game, a key of game_state.VARIANTS; it gives the number of pieces, the missing ones
+        being borne off
+
+    Returns
+    -------
+    GameState
+    """
+
+    pieces_per_player = sum(pieces for _, pieces in VARIANTS[variant] if pieces > 0)
+    value = int.from_bytes(key, "little")
+    board = [0] * 26
+    counts = {}
+    for player in (3 - turn, turn):
+        sign = 1 if player == 1 else -1
+        on_board = 0
+        for column in _COLUMNS[player]:
+            pieces = 0
+            while value & 1:
+                pieces += 1
+                value >>= 1
+            value >>= 1
+            if pieces:
+                board[column] = pieces if column >= 24 else sign * pieces
+                on_board += pieces
+        counts[player] = pieces_per_player - on_board
+    return GameState(turn, board, counts[1], counts[2], variant=variant)
+
+
+def to_text(key, urlsafe=False):
+    """
+    Returns the printable form of a position key: 14 base64 characters.
+
+    Parameters
+    ----------
+    key : bytes
+        the position key
+    urlsafe : bool
+        use - and _ instead of + and /, for URLs and file names
+
+    Returns
+    -------
+    str
+    """
+
+    encoded = base64.urlsafe_b64encode(key) if urlsafe else base64.b64encode(key)
+    return encoded[:TEXT_SIZE].decode("ascii")
+
+
+def from_text(text):
+    """
+    Returns the position key of its printable form, in either base64 alphabet, see to_text.
+
+    Parameters
+    ----------
+    text : str
+        the 14 characters
+
+    Returns
+    -------
+    bytes
+    """
+
+    if len(text) != TEXT_SIZE:
+        raise ValueError(f"a position ID has {TEXT_SIZE} characters, not {len(text)}")
+    return base64.b64decode(text.replace("-", "+").replace("_", "/") + "==", validate=True)
+
+
+# rows of the transposed (N, 52) boards holding each player's 25 slots, in the order of the key
+_LIGHT_ROWS = np.array([2 * point for point in range(23, -1, -1)] + [2 * BAR_SLOT])
+_DARK_ROWS = np.array([2 * point + 1 for point in range(24)] + [2 * BAR_SLOT + 1])
+
+
+def _ordered_counts(boards, turns):
+    """
+    Returns the slot counts of stacked positions in the order of the key: the opponent's 25, then the mover's.
+
+    Parameters
+    ----------
+    boards : numpy.ndarray
+        array of shape (N, 26, 2), see batch_evaluation.stack_positions
+    turns : numpy.ndarray
+        index of the player to move in each position
+
+    Returns
+    -------
+    numpy.ndarray
+        uint8 array of shape (50, N), one row per slot so that the loops over the slots work on contiguous rows
+    """
+
+    columns = np.ascontiguousarray(boards.reshape(len(boards), 52).T, dtype=np.uint8)
+    light = columns[_LIGHT_ROWS]
+    dark = columns[_DARK_ROWS]
+    # blending by multiplication is much faster than a broadcast numpy.where
+    light_moves = (np.asarray(turns) == 1).astype(np.uint8)
+    dark_moves = 1 - light_moves
+    counts = np.empty((50, len(boards)), dtype=np.uint8)
+    counts[:25] = light * dark_moves + dark * light_moves
+    counts[25:] = light * light_moves + dark * dark_moves
+    return counts
+
+
+# the run of 1 bits of each possible piece count
+_ONES = np.array([(1 << pieces) - 1 for pieces in range(16)], dtype=np.uint64)
+
+
+def encode_batch(boards, turns):
+    """
+    Returns the position keys of stacked positions, see encode.
+
+    Each player's half of a key is at most 40 bits long, so it is built in a 64-bit integer per position, one slot
+    at a time for all the positions at once; the halves are then joined into 10 bytes.
+
+    Parameters
+    ----------
+    boards : numpy.ndarray
+        array of shape (N, 26, 2), see batch_evaluation.stack_positions
+    turns : numpy.ndarray
+        index of the player to move in each position
+
+    Returns
+    -------
+    numpy.ndarray
+        uint8 array of shape (N, 10)
+    """
+
+    count = len(boards)
+    counts = _ordered_counts(boards, turns)
+    halves = []
+    for player_counts in (counts[:25], counts[25:]):
+        half = np.zeros(count, dtype=np.uint64)
+        length = np.zeros(count, dtype=np.uint64)
+        for pieces in player_counts:
+            half |= _ONES[pieces] << length
+            length += pieces
+            length += 1
+        halves.append((half, length))
+    (first, first_length), (second, _) = halves
+    keys = np.empty((count, KEY_SIZE), dtype=np.uint8)
+    keys[:, :8] = (first | (second << first_length)).astype("<u8").view(np.uint8).reshape(count, 8)
+    keys[:, 8:] = (second >> (64 - first_length)).astype("<u2").view(np.uint8).reshape(count, 2)
+    return keys
+
+
+def decode_batch(keys, turns, pieces=15):
+    """
+    Returns the stacked positions of position keys, see encode and batch_evaluation.stack_positions.
+
+    Keys are read as a 64-bit and a 16-bit integer per position; for each slot in turn, the run of 1 bits at the
+    bottom is counted for all the positions at once and shifted out.
+
+    Parameters
+    ----------
+    keys : numpy.ndarray
+        uint8 array of shape (N, 10)
+    turns : numpy.ndarray
+        index of the player to move in each position
+    pieces : int
+        number of pieces of each player, see GameState.pieces; the missing ones are borne off
+
+    Returns
+    -------
+    numpy.ndarray
+        int8 array of shape (N, 26, 2)
+    """
+
+    keys = np.ascontiguousarray(keys, dtype=np.uint8)
+    count = len(keys)
+    low = keys[:, :8].copy().view("<u8").reshape(count).astype(np.uint64)
+    high = keys[:, 8:].copy().view("<u2").reshape(count).astype(np.uint64)
+    counts = np.empty((50, count), dtype=np.uint8)
+    for slot in range(50):
+        run = np.bitwise_count(low & ~(low + 1))
+        counts[slot] = run
+        shift = run.astype(np.uint64) + 1
+        low = (low >> shift) | (high << (64 - shift))
+        high >>= shift
+    light_moves = (np.asarray(turns) == 1).astype(np.uint8)
+    dark_moves = 1 - light_moves
+    light = (counts[:25] * dark_moves + counts[25:] * light_moves).T.astype(np.int8)
+    dark = (counts[:25] * light_moves + counts[25:] * dark_moves).T.astype(np.int8)
+    boards = np.empty((count, 26, 2), dtype=np.int8)
+    boards[:, 23::-1, 0] = light[:, :24]
+    boards[:, :24, 1] = dark[:, :24]
+    boards[:, BAR_SLOT, 0] = light[:, 24]
+    boards[:, BAR_SLOT, 1] = dark[:, 24]
+    boards[:, OFF_SLOT, 0] = pieces - light.sum(axis=1, dtype=np.int8)
+    boards[:, OFF_SLOT, 1] = pieces - dark.sum(axis=1, dtype=np.int8)
+    return boards
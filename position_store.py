@@ -0,0 +1,476 @@
+import argparse
+import os
+import shutil
+import struct
+import sys
+import time
+import numpy as np
+from batch_evaluation import stack_keys
+from position_id import KEY_SIZE, encode_batch, from_text
+from records import read_games, replay
+
+
+MAGIC = b"BGPS"
+HEADER = struct.Struct("<4sHQ")
+VERSION = 1
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "positions")
+
+# per position: visits, then wins, gammons won and gammons lost by the player to move
+STATISTICS = 4
+_KEY = np.dtype(f"V{KEY_SIZE}")
+
+
+def _sort_keys(keys):
+    """
+    Returns the order that sorts position keys bytewise.
+
+    Sorting the first 8 bytes and the last 2 as big-endian integers gives the same order as comparing the bytes,
+    faster than sorting the keys themselves.
+
+    Parameters
+    ----------
+    keys : numpy.ndarray
+        array of position keys, see position_id
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    raw = keys.view(np.uint8).reshape(len(keys), KEY_SIZE)
+    high = raw[:, :8].copy().view(">u8").reshape(len(keys))
+    low = raw[:, 8:].copy().view(">u2").reshape(len(keys))
+    return np.lexsort((low, high))
+
+
+def _aggregate(keys, statistics):
+    """
+    Sorts position keys and sums the statistics of equal keys.
+
+    Parameters
+    ----------
+    keys : numpy.ndarray
+        array of position keys
+    statistics : numpy.ndarray
+        uint32 array of shape (len(keys), STATISTICS)
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray)
+        the distinct keys, sorted, and their summed statistics
+    """
+
+    if len(keys) == 0:
+        return keys, statistics
+    order = _sort_keys(keys)
+    keys = keys[order]
+    statistics = statistics[order]
+    starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+    return keys[starts], np.add.reduceat(statistics, starts, axis=0, dtype=np.uint32)
+
+
+class _Run:
+    """
+    A class used to read one sorted run file of a PositionStore through memory maps.
+
+    The file holds a header (magic, version, number of positions), the sorted position keys, then the statistics of
+    each position as little-endian 32-bit integers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            magic, version, count = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a position store run")
+        self.count = count
+        if count == 0:
+            self.keys = np.empty(0, dtype=_KEY)
+            self.statistics = np.empty((0, STATISTICS), dtype="<u4")
+        else:
+            self.keys = np.memmap(path, dtype=_KEY, mode="r", offset=HEADER.size, shape=(count,))
+            self.statistics = np.memmap(path, dtype="<u4", mode="r", offset=HEADER.size + KEY_SIZE * count,
+                                        shape=(count, STATISTICS))
+
+    @staticmethod
+    def write(path, keys, statistics):
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, len(keys)))
+            file.write(keys.tobytes())
+            file.write(statistics.astype("<u4").tobytes())
+
+
+class PositionStore:
+    """
+    A class used to accumulate and look up game outcome statistics by position, on disk.
+
+    ...
+
+    Positions are identified by their 10-byte position keys (see position_id), seen by the player to move, and get
+    the number of visits and the wins, gammons won and gammons lost of the player to move. Added positions are kept
+    in memory up to buffer_size, then sorted, summed and written as a run file; lookups binary search the memory
+    mapped runs, so only the pages touched are read. compact merges the runs into one, a chunk at a time, so
+    neither adding nor merging needs the whole store in memory.
+
+    Attributes
+    ----------
+    path : str
+        directory of the run files
+    buffer_size : int
+        number of positions kept in memory before a run is written
+
+    Methods
+    -------
+    add(keys, wins, gammons_won, gammons_lost):
+        Adds one visit of each position, with its outcome for the player to move.
+    add_game(record):
+        Adds the positions before every roll of a logged game.
+    flush():
+        Writes the buffered positions as a new run.
+    compact(chunk_size):
+        Merges all runs into one.
+    lookup(keys):
+        Returns the statistics of each position.
+    get(key):
+        Returns the statistics of one position.
+    close():
+        Flushes the buffer and releases the runs.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, buffer_size=1 << 21):
+        """
+        Opens the store, without reading the runs.
+
+        Parameters
+        ----------
+        path : str
+            directory of the run files, created on the first write
+        buffer_size : int
+            number of positions kept in memory before a run is written
+        """
+
+        self.path = path
+        self.buffer_size = buffer_size
+        self._keys = []
+        self._statistics = []
+        self._buffered = 0
+        names = sorted(os.listdir(path)) if os.path.isdir(path) else []
+        self._runs = [_Run(os.path.join(path, name)) for name in names if name.endswith(".run")]
+        self._next_run = max((int(name[:-4]) for name in names if name.endswith(".run")), default=-1) + 1
+
+    def __len__(self):
+        return sum(run.count for run in self._runs)
+
+    def add(self, keys, wins, gammons_won, gammons_lost):
+        """
+        Adds one visit of each position, with its outcome for the player to move.
+
+        Parameters
+        ----------
+        keys : numpy.ndarray
+            uint8 array of shape (N, 10), see position_id.encode_batch
+        wins : numpy.ndarray
+            1 where the player to move won, 0 otherwise
+        gammons_won : numpy.ndarray
+            1 where the player to move won a gammon or backgammon
+        gammons_lost : numpy.ndarray
+            1 where the player to move lost a gammon or backgammon
+
+        Returns
+        -------
+        None
+        """
+
+        keys = np.ascontiguousarray(keys, dtype=np.uint8).view(_KEY).reshape(len(keys))
+        statistics = np.empty((len(keys), STATISTICS), dtype=np.uint32)
+        statistics[:, 0] = 1
+        statistics[:, 1] = wins
+        statistics[:, 2] = gammons_won
+        statistics[:, 3] = gammons_lost
+        self._keys.append(keys)
+        self._statistics.append(statistics)
+        self._buffered += len(keys)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def add_game(self, record):
+        """
+        Adds the positions before every roll of a logged game, if it was finished.
+
+        Parameters
+        ----------
+        record : records.GameRecord
+            the game
+
+        Returns
+        -------
+        None
+        """
+
+        if record.winner is None:
+            return
+        positions = []
+        turns = []
+        for state, _ in replay(record):
+            positions.append(state.position_key())
+            turns.append(state.turn)
+        turns = np.array(turns)
+        won = turns == record.winner
+        gammon = record.points >= 2
+        self.add(encode_batch(stack_keys(positions), turns), won, won & gammon, ~won & gammon)
+
+    def flush(self):
+        """
+        Writes the buffered positions as a new run, sorted and with equal positions summed.
+
+        Returns
+        -------
+        None
+        """
+
+        if self._buffered == 0:
+            return
+        keys, statistics = _aggregate(np.concatenate(self._keys), np.concatenate(self._statistics))
+        self._keys = []
+        self._statistics = []
+        self._buffered = 0
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, f"{self._next_run:06d}.run")
+        self._next_run += 1
+        _Run.write(path, keys, statistics)
+        self._runs.append(_Run(path))
+
+    def compact(self, chunk_size=1 << 20):
+        """
+        Merges all runs into one, reading at most chunk_size positions of each run at a time.
+
+        Each step takes, from every run, the positions up to the smallest last key among the chunks read, so equal
+        positions of different runs are always merged in the same step.
+
+        Parameters
+        ----------
+        chunk_size : int
+            number of positions read from each run per step
+
+        Returns
+        -------
+        None
+        """
+
+        self.flush()
+        if len(self._runs) <= 1:
+            return
+        path = os.path.join(self.path, f"{self._next_run:06d}.run")
+        self._next_run += 1
+        keys_path = path + ".keys"
+        statistics_path = path + ".statistics"
+        count = 0
+        cursors = [0] * len(self._runs)
+        with open(keys_path, "wb") as keys_file, open(statistics_path, "wb") as statistics_file:
+            while any(cursor < run.count for cursor, run in zip(cursors, self._runs)):
+                ends = [min(cursor + chunk_size, run.count) for cursor, run in zip(cursors, self._runs)]
+                bounds = [run.keys[end - 1].tobytes() for end, run in zip(ends, self._runs) if end < run.count]
+                bound = np.frombuffer(min(bounds), dtype=_KEY) if bounds else None
+                keys = []
+                statistics = []
+                for index, run in enumerate(self._runs):
+                    chunk = run.keys[cursors[index]:ends[index]]
+                    taken = len(chunk) if bound is None else int(np.searchsorted(chunk, bound, side="right")[0])
+                    keys.append(np.asarray(chunk[:taken]))
+                    statistics.append(np.asarray(run.statistics[cursors[index]:cursors[index] + taken]))
+                    cursors[index] += taken
+                keys, statistics = _aggregate(np.concatenate(keys), np.concatenate(statistics))
+                keys_file.write(keys.tobytes())
+                statistics_file.write(statistics.astype("<u4").tobytes())
+                count += len(keys)
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, count))
+            for part in (keys_path, statistics_path):
+                with open(part, "rb") as source:
+                    shutil.copyfileobj(source, file)
+                os.remove(part)
+        old_runs = self._runs
+        self._runs = [_Run(path)]
+        for run in old_runs:
+            del run.keys, run.statistics
+            os.remove(run.path)
+
+    def lookup(self, keys):
+        """
+        Returns the statistics of each position, summed over the runs; buffered positions are not included.
+
+        Parameters
+        ----------
+        keys : numpy.ndarray
+            uint8 array of shape (N, 10), see position_id.encode_batch
+
+        Returns
+        -------
+        numpy.ndarray
+            int64 array of shape (N, 4): visits, wins, gammons won and gammons lost of the player to move
+        """
+
+        keys = np.ascontiguousarray(keys, dtype=np.uint8).view(_KEY).reshape(len(keys))
+        totals = np.zeros((len(keys), STATISTICS), dtype=np.int64)
+        for run in self._runs:
+            if run.count == 0:
+                continue
+            indices = np.minimum(np.searchsorted(run.keys, keys), run.count - 1)
+            found = run.keys[indices] == keys
+            totals[found] += run.statistics[indices[found]]
+        return totals
+
+    def get(self, key):
+        """
+        Returns the statistics of one position.
+
+        Parameters
+        ----------
+        key : bytes
+            the position key, see position_id.encode
+
+        Returns
+        -------
+        (int, int, int, int)
+            visits, wins, gammons won and gammons lost of the player to move
+        """
+
+        return tuple(int(value) for value in self.lookup(np.frombuffer(key, dtype=np.uint8).reshape(1, KEY_SIZE))[0])
+
+    def close(self):
+        """
+        Flushes the buffer and releases the runs.
+
+        Returns
+        -------
+        None
+        """
+
+        self.flush()
+        self._runs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BookAgent:
+    """
+    A class used to represent an agent playing from the outcomes stored in a PositionStore, like an opening book.
+
+    ...
+
+    Each legal play leads to a position with the opponent to move; the play whose position was seen at least
+    min_visits times and gave the opponent the lowest average points is chosen. Without such a play, the fallback
+    agent chooses.
+
+    Attributes
+    ----------
+    store : PositionStore
+        the outcome statistics
+    min_visits : int
+        number of visits a position needs for its statistics to be trusted
+    fallback : object
+        agent choosing the play when no position is known well enough
+
+    Methods
+    -------
+    choose_play(state):
+        Returns the legal play with the best known outcome, or the fallback agent's play.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, min_visits=30, fallback="heuristic"):
+        """
+        Parameters
+        ----------
+        path : str
+            directory of the PositionStore
+        min_visits : int
+            number of visits a position needs for its statistics to be trusted
+        fallback : str
+            name of the agent used for unknown positions, see agents.AGENTS
+        """
+
+        # imported here, as agents imports this module
+        from agents import make_agent
+        self.store = PositionStore(path)
+        self.min_visits = min_visits
+        self.fallback = make_agent(fallback)
+
+    def choose_play(self, state):
+        """
+        Returns the legal play with the best known outcome, or the fallback agent's play.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, with the dice rolled
+
+        Returns
+        -------
+        tuple[(int, int, int)]
+        """
+
+        plays = state.legal_plays()
+        if len(plays) == 1:
+            return plays[0]
+        keys = encode_batch(stack_keys(state.legal_positions()), np.full(len(plays), 3 - state.turn))
+        visits, wins, gammons_won, gammons_lost = self.store.lookup(keys).T
+        known = visits >= self.min_visits
+        if not known.any():
+            return self.fallback.choose_play(state)
+        # average points of the opponent, who is to move in the reached positions
+        opponent_points = (2 * wins - visits + gammons_won - gammons_lost) / np.maximum(visits, 1)
+        return plays[int(np.argmin(np.where(known, opponent_points, np.inf)))]
+
+
+def main(argv=None):
+    """
+    Adds logged games to a store, compacts it or looks positions up, from the command line.
+
+    Parameters
+    ----------
+    argv : list[str], optional
+        command line arguments; sys.argv by default
+
+    Returns
+    -------
+    int
+        exit status
+    """
+
+    parser = argparse.ArgumentParser(description="Build and query the on-disk position outcome store.")
+    parser.add_argument("--store", default=DEFAULT_PATH, help="directory of the store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    adder = commands.add_parser("add", help="add the positions of game record files")
+    adder.add_argument("records", nargs="+", help="game record files, see records.py")
+    commands.add_parser("compact", help="merge the runs of the store into one")
+    finder = commands.add_parser("lookup", help="print the statistics of positions")
+    finder.add_argument("ids", nargs="+", help="position IDs, in their 14 character form")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    with PositionStore(args.store) as store:
+        if args.command == "add":
+            games = 0
+            for path in args.records:
+                for record in read_games(path):
+                    store.add_game(record)
+                    games += 1
+            store.flush()
+            print(f"{games} games added in {time.perf_counter() - start:.1f}s, {len(store)} stored positions")
+        elif args.command == "compact":
+            store.compact()
+            print(f"compacted to {len(store)} positions in {time.perf_counter() - start:.1f}s")
+        else:
+            statistics = store.lookup(np.frombuffer(b"".join(from_text(text) for text in args.ids),
+                                                    dtype=np.uint8).reshape(len(args.ids), KEY_SIZE))
+            for text, (visits, wins, gammons_won, gammons_lost) in zip(args.ids, statistics):
+                print(f"{text}: {visits} visits, {wins} wins, {gammons_won} gammons won, {gammons_lost} lost")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
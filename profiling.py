@@ -0,0 +1,313 @@
+import cProfile
+import functools
+import json
+import threading
+import time
+from collections import deque
+
+
+class LatencyStats:
+    """
+    A class used to collect latencies by kind of operation.
+
+    ...
+
+    Only the latest samples of each kind are kept for the percentiles; counts and totals cover all of them.
+
+    Attributes
+    ----------
+    samples : int
+        number of latest samples kept per kind
+
+    Methods
+    -------
+    record(kind, seconds):
+        Adds a latency.
+    summary():
+        Returns count, total, mean, percentiles and maximum of each kind, in milliseconds.
+    clear():
+        Forgets all latencies.
+    """
+
+    def __init__(self, samples=10000):
+        """
+        Parameters
+        ----------
+        samples : int
+            number of latest samples kept per kind
+        """
+
+        self.samples = samples
+        self.clear()
+
+    def record(self, kind, seconds):
+        """
+        Adds a latency.
+
+        Parameters
+        ----------
+        kind : str
+            the kind of operation
+        seconds : float
+            its latency
+
+        Returns
+        -------
+        None
+        """
+
+        if kind not in self._latencies:
+            self._latencies[kind] = deque(maxlen=self.samples)
+            self._counts[kind] = 0
+            self._totals[kind] = 0.0
+            self._maxima[kind] = 0.0
+        self._latencies[kind].append(seconds)
+        self._counts[kind] += 1
+        self._totals[kind] += seconds
+        self._maxima[kind] = max(self._maxima[kind], seconds)
+
+    def summary(self):
+        """
+        Returns count, total, mean, percentiles and maximum of each kind, in milliseconds.
+
+        Returns
+        -------
+        dict[str, dict]
+        """
+
+        summary = {}
+        for kind, latencies in list(self._latencies.items()):
+            ordered = sorted(latencies)
+            summary[kind] = {
+                "count": self._counts[kind],
+                "total_ms": 1000 * self._totals[kind],
+                "mean_ms": 1000 * self._totals[kind] / self._counts[kind],
+                **{f"p{percent}_ms": 1000 * ordered[min(len(ordered) - 1, len(ordered) * percent // 100)]
+                   for percent in (50, 95, 99)},
+                "max_ms": 1000 * self._maxima[kind],
+            }
+        return summary
+
+    def clear(self):
+        """
+        Forgets all latencies.
+
+        Returns
+        -------
+        None
+        """
+
+        self._latencies = {}
+        self._counts = {}
+        self._totals = {}
+        self._maxima = {}
+
+
+# latencies of the instrumented methods, and the hits and misses of the instrumented caches, while enabled
+STATS = LatencyStats()
+CACHES = {}
+
+_lock = threading.Lock()
+_targets = []
+_originals = {}
+
+
+def _instrumented(function, kind, cache_counter):
+    """
+    Returns a wrapper of function recording its latency, and whether it hit the cache if cache_counter is given.
+
+    Parameters
+    ----------
+    function : callable
+        a method
+    kind : str
+        name of its latencies in STATS
+    cache_counter : str, optional
+        attribute of the instance counting the cache hits, which a hit increases
+
+    Returns
+    -------
+    callable
+    """
+
+    clock = time.perf_counter
+
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        hits = getattr(self, cache_counter) if cache_counter is not None else 0
+        start = clock()
+        try:
+            return function(self, *args, **kwargs)
+        finally:
+            seconds = clock() - start
+            with _lock:
+                STATS.record(kind, seconds)
+                if cache_counter is not None:
+                    CACHES.setdefault(kind, [0, 0])[0 if getattr(self, cache_counter) > hits else 1] += 1
+
+    return wrapper
+
+
+def register(cls, name, kind=None, cache_counter=None):
+    """
+    Registers a method for instrumentation; it is only replaced by a timing wrapper while profiling is enabled, so
+    that it costs nothing otherwise.
+
+    Parameters
+    ----------
+    cls : type
+        the class
+    name : str
+        name of the method
+    kind : str, optional
+        name of its latencies; ClassName.method by default
+    cache_counter : str, optional
+        attribute of the instance counting the hits of a cache the method uses, to also report hit rates
+
+    Returns
+    -------
+    None
+    """
+
+    target = (cls, name, kind or f"{cls.__name__}.{name}", cache_counter)
+    _targets.append(target)
+    if _originals:
+        _enable_target(target)
+
+
+def _enable_target(target):
+    """Replaces one registered method by its timing wrapper."""
+
+    cls, name, kind, cache_counter = target
+    if (cls, name) not in _originals:
+        # None for an inherited method, which only needs the wrapper removed again
+        _originals[(cls, name)] = cls.__dict__.get(name)
+        setattr(cls, name, _instrumented(getattr(cls, name), kind, cache_counter))
+
+
+def enabled():
+    """
+    Tells whether profiling is enabled.
+
+    Returns
+    -------
+    bool
+    """
+
+    return bool(_originals)
+
+
+def enable():
+    """
+    Starts instrumenting the registered methods, keeping the statistics gathered so far.
+
+    Returns
+    -------
+    None
+    """
+
+    for target in _targets:
+        _enable_target(target)
+
+
+def disable():
+    """
+    Restores the registered methods, keeping the statistics gathered so far.
+
+    Returns
+    -------
+    None
+    """
+
+    for (cls, name), function in _originals.items():
+        if function is None:
+            delattr(cls, name)
+        else:
+            setattr(cls, name, function)
+    _originals.clear()
+
+
+def record(kind, seconds):
+    """
+    Adds a latency measured by the caller, if profiling is enabled.
+
+    Parameters
+    ----------
+    kind : str
+        name of the latencies
+    seconds : float
+        the latency
+
+    Returns
+    -------
+    None
+    """
+
+    if _originals:
+        with _lock:
+            STATS.record(kind, seconds)
+
+
+def reset():
+    """
+    Forgets all statistics.
+
+    Returns
+    -------
+    None
+    """
+
+    with _lock:
+        STATS.clear()
+        CACHES.clear()
+
+
+def snapshot():
+    """
+    Returns the statistics gathered so far.
+
+    Returns
+    -------
+    dict
+        "latencies": per kind, see LatencyStats.summary; "caches": per kind, hits, misses and hit rate
+    """
+
+    with _lock:
+        caches = {kind: {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+                  for kind, (hits, misses) in CACHES.items()}
+        return {"latencies": STATS.summary(), "caches": caches}
+
+
+def run(function, path):
+    """
+    Calls function while profiling and writes the profile: the instrumentation statistics as JSON if path ends with
+    .json, else a cProfile dump, to be read with pstats.
+
+    Parameters
+    ----------
+    function : callable
+        called without arguments
+    path : str
+        file to write
+
+    Returns
+    -------
+    object
+        what function returned
+    """
+
+    if path.endswith(".json"):
+        reset()
+        enable()
+        try:
+            result = function()
+        finally:
+            disable()
+        with open(path, "w") as file:
+            json.dump(snapshot(), file, indent=2)
+        return result
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(function)
+    finally:
+        profile.dump_stats(path)
@@ -0,0 +1,614 @@
+import argparse
+import os
+import re
+import struct
+import sys
+import time
+from game_state import BAR, GameState
+
+
+MAGIC = b"BGGR"
+HEADER = struct.Struct("<4sH")
+VERSION = 1
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "games.bgr")
+
+# a turn byte below GAME_START holds the roll and how many moves follow: 36 * moves + 6 * (die 1 - 1) + die 2 - 1
+GAME_START = 0xF0
+GAME_END = 0xF1
+
+
+class GameRecord:
+    """
+    A class used to represent one logged game.
+
+    ...
+
+    Attributes
+    ----------
+    starting_player : int
+        index of the player who moved first, 1 or 2
+    turns : list[((int, int), tuple[(int, int, int)])]
+        the roll of each turn and the play made with it, as (selected_piece, clicked_column, dice_value) moves; the
+        players take turns, starting with starting_player
+    winner : int, optional
+        index of the winning player, None if the game was not finished
+    points : int
+        points won by the winner, 0 if the game was not finished
+    """
+
+    __slots__ = ("starting_player", "turns", "winner", "points")
+
+    def __init__(self, starting_player, turns=None, winner=None, points=0):
+        """
+        Parameters
+        ----------
+        starting_player : int
+            index of the player who moved first
+        turns : list, optional
+            rolls and plays, see the class attributes
+        winner : int, optional
+            index of the winning player
+        points : int
+            points won by the winner
+        """
+
+        self.starting_player = starting_player
+        self.turns = [] if turns is None else turns
+        self.winner = winner
+        self.points = points
+
+
+def _encode_turn(roll, play):
+    """
+    Encodes one turn as a turn byte followed by one byte per move: 6 * source + dice_value - 1.
+
+    The target of a move follows from its source, dice value and player, so it is not stored.
+
+    Parameters
+    ----------
+    roll : (int, int)
+        the dice values
+    play : sequence[(int, int, int)]
+        the moves made
+
+    Returns
+    -------
+    bytes
+    """
+
+    encoded = bytearray((36 * len(play) + 6 * (roll[0] - 1) + roll[1] - 1,))
+    for selected_piece, _, dice_value in play:
+        encoded.append(6 * selected_piece + dice_value - 1)
+    return bytes(encoded)
+
+
+def _targets(player):
+    """
+    Returns the table of move targets by source and dice value for the player, None being bear off.
+
+    Parameters
+    ----------
+    player : int
+        index of the player, 1 or 2
+
+    Returns
+    -------
+    list[int]
+        indexed by 6 * source + dice_value - 1, like the move bytes
+    """
+
+    targets = []
+    for source in range(25):
+        for dice_value in range(1, 7):
+            if player == 1:
+                target = dice_value - 1 if source == BAR else source + dice_value
+                targets.append(target if target < 24 else None)
+            else:
+                target = 24 - dice_value if source == BAR else source - dice_value
+                targets.append(target if target >= 0 else None)
+    return targets
+
+
+# the decoded (selected_piece, clicked_column, dice_value) move of each move byte, per player
+_MOVES = {player: [(index // 6, target, index % 6 + 1) for index, target in enumerate(_targets(player))]
+          for player in (1, 2)}
+
+
+class GameRecordWriter:
+    """
+    A class used to append games to a binary game record file, through a write buffer.
+
+    ...
+
+    The file starts with a header (magic and version). Each game is a GAME_START byte and the starting player, then
+    one turn byte per turn (see _encode_turn) followed by its moves, one byte each, and, once the game is over, a
+    GAME_END byte with the winner and the points won. A turn typically takes 3 to 5 bytes.
+
+    Attributes
+    ----------
+    path : str
+        the record file, created with its header if missing
+    buffer_size : int
+        number of bytes kept in memory before they are written to the file
+
+    Methods
+    -------
+    start_game(starting_player):
+        Starts a new game.
+    write_turn(roll, play):
+        Appends a turn of the current game.
+    end_game(winner, points):
+        Appends the result of the current game.
+    write_game(record):
+        Appends a whole GameRecord.
+    flush():
+        Writes the buffered bytes to the file.
+    close():
+        Flushes the buffer and closes the file.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, buffer_size=1 << 16):
+        """
+        Opens the record file for appending.
+
+        Parameters
+        ----------
+        path : str
+            the record file
+        buffer_size : int
+            number of bytes kept in memory before they are written to the file
+        """
+
+        self.path = path
+        self.buffer_size = buffer_size
+        self._file = open(path, "ab")
+        self._buffer = bytearray()
+        if self._file.tell() == 0:
+            self._buffer += HEADER.pack(MAGIC, VERSION)
+        self._player = 1
+
+    def start_game(self, starting_player):
+        """
+        Starts a new game.
+
+        Parameters
+        ----------
+        starting_player : int
+            index of the player who moves first
+
+        Returns
+        -------
+        None
+        """
+
+        self._buffer += bytes((GAME_START, starting_player))
+        self._player = starting_player
+
+    def write_turn(self, roll, play):
+        """
+        Appends a turn of the current game; the players take turns, starting with the starting player.
+
+        Parameters
+        ----------
+        roll : (int, int)
+            the dice values
+        play : sequence[(int, int, int)]
+            the (selected_piece, clicked_column, dice_value) moves made, possibly none
+
+        Returns
+        -------
+        None
+        """
+
+        self._buffer += _encode_turn(roll, play)
+        self._player = 3 - self._player
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def end_game(self, winner, points):
+        """
+        Appends the result of the current game.
+
+        Parameters
+        ----------
+        winner : int
+            index of the winning player
+        points : int
+            points won
+
+        Returns
+        -------
+        None
+        """
+
+        self._buffer += bytes((GAME_END, winner, points))
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def write_game(self, record):
+        """
+        Appends a whole GameRecord.
+
+        Parameters
+        ----------
+        record : GameRecord
+            the game
+
+        Returns
+        -------
+        None
+        """
+
+        self.start_game(record.starting_player)
+        for roll, play in record.turns:
+            self.write_turn(roll, play)
+        if record.winner is not None:
+            self.end_game(record.winner, record.points)
+
+    def flush(self):
+        """
+        Writes the buffered bytes to the file.
+
+        Returns
+        -------
+        None
+        """
+
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._buffer.clear()
+
+    def close(self):
+        """
+        Flushes the buffer and closes the file.
+
+        Returns
+        -------
+        None
+        """
+
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_games(path=DEFAULT_PATH, chunk_size=1 << 16):
+    """
+    Reads the games of a record file, one at a time, a chunk of the file at a time.
+
+    Parameters
+    ----------
+    path : str
+        the record file, see GameRecordWriter
+    chunk_size : int
+        number of bytes read from the file at once
+
+    Returns
+    -------
+    iterator[GameRecord]
+    """
+
+    rolls = [(roll // 6 + 1, roll % 6 + 1) for roll in range(36)]
+    moves = _MOVES
+    record = None
+    player = 1
+    with open(path, "rb") as file:
+        header = file.read(HEADER.size)
+        if len(header) < HEADER.size or HEADER.unpack(header) != (MAGIC, VERSION):
+            raise ValueError(f"{path} is not a game record file")
+        # offset in the file of the start of data, which holds the end of the previous chunk not read yet
+        offset = HEADER.size
+        data = b""
+        position = 0
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            offset += position
+            data = data[position:] + chunk
+            position = 0
+            end = len(data)
+            while position < end:
+                byte = data[position]
+                if byte < GAME_START:
+                    count, roll = divmod(byte, 36)
+                    if position + 1 + count > end:
+                        break
+                    player_moves = moves[player]
+                    record.turns.append((rolls[roll], tuple(player_moves[move] for move in
+                                                            data[position + 1:position + 1 + count])))
+                    player = 3 - player
+                    position += 1 + count
+                elif byte == GAME_START:
+                    if position + 2 > end:
+                        break
+                    if record is not None:
+                        yield record
+                    player = data[position + 1]
+                    record = GameRecord(player)
+                    position += 2
+                elif byte == GAME_END:
+                    if position + 3 > end:
+                        break
+                    record.winner = data[position + 1]
+                    record.points = data[position + 2]
+                    position += 3
+                else:
+                    raise ValueError(f"{path}: unexpected byte {byte:#x} at offset {offset + position}")
+    if position < len(data):
+        raise ValueError(f"{path}: truncated at offset {offset + position}")
+    if record is not None:
+        yield record
+
+
+def replay(record, validate=False):
+    """
+    Plays a logged game through the rules, yielding the position before each turn's play.
+
+    The same GameState is yielded every time, with the turn's dice set, and changed once the caller resumes; copy it
+    to keep it. Moves are applied without checking them unless validate is set.
+
+    Parameters
+    ----------
+    record : GameRecord
+        the game
+    validate : bool
+        check that every play is legal, raising ValueError otherwise
+
+    Returns
+    -------
+    iterator[(GameState, tuple[(int, int, int)])]
+        the position and the play made from it
+    """
+
+    state = GameState(record.starting_player)
+    for number, (roll, play) in enumerate(record.turns):
+        state.set_dice(*roll)
+        if validate and _position_after(state, play) not in state.legal_positions():
+            raise ValueError(f"illegal play {play} with {roll} on turn {number + 1}")
+        yield state, play
+        for step in play:
+            state.apply_move(*step)
+        state.end_turn()
+
+
+def _position_after(state, play):
+    """
+    Returns the position key reached by a play, restoring the state afterwards.
+
+    Parameters
+    ----------
+    state : GameState
+        the position, with the dice set
+    play : sequence[(int, int, int)]
+        the moves
+
+    Returns
+    -------
+    bytes
+    """
+
+    records = [state.apply_move(*step) for step in play]
+    key = state.position_key()
+    for record in reversed(records):
+        state.undo_move(record)
+    return key
+
+
+_POINT = re.compile(r"bar|off|\d+", re.IGNORECASE)
+_MOVE = re.compile(r"^((?:bar|\d+)\*?(?:/(?:off|\d+)\*?)+)(?:\((\d)\))?$", re.IGNORECASE)
+_ROLL = re.compile(r"^([1-6])([1-6]):$")
+_GAME = re.compile(r"^\s*Game \d+\s*$", re.IGNORECASE)
+_HEADER = re.compile(r"^\s*(\S.*?\s:\s*\d+)\s+(\S.*?\s:\s*\d+)\s*$")
+_NUMBER = re.compile(r"^\s*\d+\)")
+
+
+def _board_index(point, player):
+    """
+    Converts a point of a match file, numbered 1 to 24 from the player's own home with 25 for the bar and 0 for off,
+    to a column of GameState.
+
+    Parameters
+    ----------
+    point : str
+        the point, "bar", "off" or a number
+    player : int
+        index of the player moving
+
+    Returns
+    -------
+    int, optional
+        None for off
+    """
+
+    point = point.lower()
+    if point == "bar" or point == "25":
+        return BAR
+    if point == "off" or point == "0":
+        return None
+    return 24 - int(point) if player == 1 else int(point) - 1
+
+
+def _import_play(state, notation, line_number):
+    """
+    Finds the legal play of the rolled state matching the moves written in a match file.
+
+    Moves such as "24/18*/13(2)" are made on a copy of the board piece by piece; the legal play leading to the same
+    position is returned, so the dice each move used need not be written.
+
+    Parameters
+    ----------
+    state : GameState
+        the position, with the dice rolled
+    notation : list[str]
+        the move tokens
+    line_number : int
+        for error messages
+
+    Returns
+    -------
+    tuple[(int, int, int)]
+    """
+
+    player = state.turn
+    sign = 1 if player == 1 else -1
+    board = list(state.board)
+    borne_off = 0
+    own_bar = 24 if player == 1 else 25
+    other_bar = 25 if player == 1 else 24
+    for token in notation:
+        match = _MOVE.match(token)
+        if match is None:
+            raise ValueError(f"line {line_number}: cannot read move {token!r}")
+        points = [_board_index(point, player) for point in _POINT.findall(match.group(1))]
+        for _ in range(int(match.group(2) or 1)):
+            for source, target in zip(points, points[1:]):
+                if source == BAR:
+                    board[own_bar] -= 1
+                else:
+                    board[source] -= sign
+                if target is None:
+                    borne_off += 1
+                else:
+                    if board[target] == -sign:
+                        board[target] = 0
+                        board[other_bar] += 1
+                    board[target] += sign
+    key = bytes(value & 0xFF for value in board)
+    if player == 1:
+        key += bytes((state.light_count + borne_off, state.dark_count))
+    else:
+        key += bytes((state.light_count, state.dark_count + borne_off))
+    positions = state.legal_positions()
+    if key not in positions:
+        raise ValueError(f"line {line_number}: {' '.join(notation)} is not a legal play")
+    return state.legal_plays()[positions.index(key)]
+
+
+def import_match(path):
+    """
+    Reads the games of a text match file, in the usual export format of backgammon programs.
+
+    Games start with a "Game n" line, followed by a "name : score   name : score" header. Each numbered line then
+    holds a roll ("31:") and the moves made with it (such as "8/5 6/5"), in the left column for player 1 and in the
+    right column, aligned with the second name of the header, for player 2. Cube actions are skipped, as this game
+    has no doubling cube; the winner and points come from the "Wins n point(s)" entries.
+
+    Parameters
+    ----------
+    path : str
+        the match file
+
+    Returns
+    -------
+    list[GameRecord]
+    """
+
+    games = []
+    record = None
+    state = None
+    # where the right column starts
+    split = 33
+    with open(path) as file:
+        lines = file.read().splitlines()
+    for line_number, line in enumerate(lines, 1):
+        if _GAME.match(line):
+            record = None
+            state = None
+            continue
+        header = _HEADER.match(line)
+        if header is not None:
+            split = header.start(2)
+            continue
+        number = _NUMBER.match(line)
+        tokens = list(re.finditer(r"\S+", line[number.end():] if number else line))
+        offset = number.end() if number else 0
+        entries = {1: [], 2: []}
+        for token in tokens:
+            entries[1 if token.start() + offset < split - 2 else 2].append(token.group())
+        for player in (1, 2):
+            entry = entries[player]
+            if not entry:
+                continue
+            if entry[0].lower() == "wins" and len(entry) > 1 and entry[1].isdigit():
+                if record is not None:
+                    record.winner = player
+                    record.points = int(entry[1])
+                    games.append(record)
+                    record = None
+                continue
+            roll = _ROLL.match(entry[0])
+            if number is None or roll is None:
+                # cube actions, names and comments
+                continue
+            if record is None:
+                record = GameRecord(player)
+                state = GameState(player)
+            if state.turn != player:
+                raise ValueError(f"line {line_number}: player {player} moved out of turn")
+            dice = (int(roll.group(1)), int(roll.group(2)))
+            state.set_dice(*dice)
+            play = _import_play(state, entry[1:], line_number)
+            record.turns.append((dice, play))
+            for step in play:
+                state.apply_move(*step)
+            state.end_turn()
+    if record is not None:
+        games.append(record)
+    return games
+
+
+def main(argv=None):
+    """
+    Imports match files into a record file, or replays a record file through the rules.
+
+    Parameters
+    ----------
+    argv : list[str], optional
+        command line arguments; sys.argv by default
+
+    Returns
+    -------
+    int
+        exit status
+    """
+
+    parser = argparse.ArgumentParser(description="Import or replay binary game records.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="append the games of text match files to a record file")
+    importer.add_argument("matches", nargs="+", help="text match files")
+    importer.add_argument("--output", default=DEFAULT_PATH, help="record file to append to")
+    replayer = commands.add_parser("replay", help="replay every game of a record file")
+    replayer.add_argument("path", nargs="?", default=DEFAULT_PATH, help="record file")
+    replayer.add_argument("--validate", action="store_true", help="check that every play is legal")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        with GameRecordWriter(args.output) as writer:
+            for path in args.matches:
+                games = import_match(path)
+                for record in games:
+                    writer.write_game(record)
+                print(f"{path}: {len(games)} games")
+        return 0
+
+    start = time.perf_counter()
+    games = 0
+    turns = 0
+    for record in read_games(args.path):
+        for _ in replay(record, args.validate):
+            turns += 1
+        games += 1
+    elapsed = time.perf_counter() - start
+    print(f"{games} games, {turns} turns replayed in {elapsed:.2f}s ({games / max(elapsed, 1e-9):.0f} games/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
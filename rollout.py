@@ -0,0 +1,320 @@
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from evaluation import game_points
+
+
+_policies = {}
+
+
+def _policy(name):
+    """
+    Returns the agent playing the rollouts in this process, creating it on first use.
+
+    Parameters
+    ----------
+    name : str
+        key of the agent in agents.AGENTS
+
+    Returns
+    -------
+    object
+    """
+
+    if name not in _policies:
+        # imported here, as agents registers the rollout agent itself
+        from agents import make_agent
+        _policies[name] = make_agent(name)
+    return _policies[name]
+
+
+def play_out(state, policy, rng):
+    """
+    Plays the game to the end, both players following the policy, and returns the winner and the points won.
+
+    Parameters
+    ----------
+    state : GameState
+        the position, before the roll of the player to move; it is played out in place
+    policy : object
+        agent choosing the plays of both players
+    rng : random.Random
+        source of the dice values
+
+    Returns
+    -------
+    (int, int)
+    """
+
+    while state.winner() is None:
+        state.roll(rng)
+        for step in policy.choose_play(state):
+            state.apply_move(*step)
+        state.end_turn()
+    winner = state.winner()
+    return winner, game_points(state, winner)
+
+
+def _rollout_batch(state, plays, trials, seed, policy_name):
+    """
+    Plays each play forward to the end of the game trials times, in a worker process.
+
+    Every play sees the same dice for the same trial, which makes the comparison between plays less noisy. A policy
+    choosing at random (with an rng attribute, like agents.RandomAgent) also gets the same choices for the same
+    trial, drawn from the batch's seed: forked workers would otherwise share the state of the random module and play
+    the same games.
+
+    Parameters
+    ----------
+    state : GameState
+        the position, with the dice rolled
+    plays : list[tuple]
+        the plays to roll out
+    trials : int
+        number of games per play
+    seed : int
+        seed of this batch's dice stream
+    policy_name : str
+        key of the agent playing the rollouts in agents.AGENTS
+
+    Returns
+    -------
+    list[(float, float)]
+        sum and sum of squares of the points won by the player to move, per play
+    """
+
+    policy = _policy(policy_name)
+    rng = random.Random(seed)
+    policy_rng = random.Random() if hasattr(policy, "rng") else None
+    if policy_rng is not None:
+        policy.rng = policy_rng
+    mover = state.turn
+    sums = [[0.0, 0.0] for _ in plays]
+    for _ in range(trials):
+        trial_seed = rng.getrandbits(64)
+        policy_seed = rng.getrandbits(64) if policy_rng is not None else None
+        for sum_pair, play in zip(sums, plays):
+            if policy_rng is not None:
+                policy_rng.seed(policy_seed)
+            trial = state.copy()
+            for step in play:
+                trial.apply_move(*step)
+            trial.end_turn()
+            winner, points = play_out(trial, policy, random.Random(trial_seed))
+            equity = points if winner == mover else -points
+            sum_pair[0] += equity
+            sum_pair[1] += equity * equity
+    return sums
+
+
+class PlayStatistics:
+    """
+    A class used to accumulate the rollout results of one play.
+
+    ...
+
+    Attributes
+    ----------
+    play : tuple[(int, int, int)]
+        the play rolled out
+    trials : int
+        number of games played out
+    total : float
+        sum of the points won by the player to move
+    total_squares : float
+        sum of the squares of the points won
+
+    Methods
+    -------
+    mean():
+        Returns the mean equity of the play.
+    interval(z):
+        Returns the half-width of the confidence interval of the mean.
+    """
+
+    def __init__(self, play):
+        """
+        Parameters
+        ----------
+        play : tuple[(int, int, int)]
+            the play rolled out
+        """
+
+        self.play = play
+        self.trials = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+
+    def mean(self):
+        """
+        Returns the mean equity of the play.
+
+        Returns
+        -------
+        float
+        """
+
+        return self.total / self.trials if self.trials else 0.0
+
+    def interval(self, z=1.96):
+        """
+        Returns the half-width of the confidence interval of the mean.
+
+        Parameters
+        ----------
+        z : float
+            number of standard errors, 1.96 for 95%
+
+        Returns
+        -------
+        float
+        """
+
+        if self.trials < 2:
+            return math.inf
+        variance = max(self.total_squares - self.total * self.total / self.trials, 0.0) / (self.trials - 1)
+        return z * math.sqrt(variance / self.trials)
+
+
+class RolloutEvaluator:
+    """
+    A class used to rank plays by playing each one forward to the end of the game many times, on a process pool.
+
+    ...
+
+    Trials are run in rounds, one batch per worker, each batch with its own seeded dice stream. After each round
+    plays whose confidence interval lies entirely below the best play's are dropped, and the rollout stops once a
+    single play is left.
+
+    Attributes
+    ----------
+    trials : int
+        maximum number of games per play
+    workers : int
+        number of worker processes
+    batch_trials : int
+        number of games per play in one batch
+    policy : str
+        key of the agent playing the rollouts in agents.AGENTS
+    z : float
+        number of standard errors of the confidence intervals
+    seed : int, optional
+        seed of the dice streams, for repeatable rollouts
+
+    Methods
+    -------
+    evaluate(state, plays):
+        Rolls out every legal play, or the given candidates, and returns their statistics, best first.
+    choose_play(state):
+        Returns the play with the best rollout equity.
+    close():
+        Shuts the process pool down.
+    """
+
+    def __init__(self, trials=1296, workers=None, batch_trials=36, policy="heuristic", z=1.96, seed=None):
+        """
+        Provides all the necessary attributes to roll out plays.
+
+        Parameters
+        ----------
+        trials : int
+            maximum number of games per play
+        workers : int, optional
+            number of worker processes; the number of CPUs by default
+        batch_trials : int
+            number of games per play in one batch
+        policy : str
+            key of the agent playing the rollouts in agents.AGENTS
+        z : float
+            number of standard errors of the confidence intervals
+        seed : int, optional
+            seed of the dice streams
+        """
+
+        self.trials = trials
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_trials = batch_trials
+        self.policy = policy
+        self.z = z
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._executor = None
+
+    def evaluate(self, state, plays=None):
+        """
+        Rolls out every legal play, or the given candidates, and returns their statistics, best first.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, with the dice rolled
+        plays : list[tuple], optional
+            the plays to roll out; all the legal plays by default
+
+        Returns
+        -------
+        list[PlayStatistics]
+        """
+
+        statistics = [PlayStatistics(play) for play in (state.legal_plays() if plays is None else plays)]
+        if len(statistics) == 1:
+            return statistics
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers)
+        state = state.copy()
+        candidates = statistics
+        done = 0
+        while done < self.trials and len(candidates) > 1:
+            plays = [candidate.play for candidate in candidates]
+            batch = min(self.batch_trials, -(-(self.trials - done) // self.workers))
+            futures = [self._executor.submit(_rollout_batch, state, plays, batch, self._rng.getrandbits(64),
+                                             self.policy)
+                       for _ in range(self.workers)]
+            for future in futures:
+                for candidate, (total, total_squares) in zip(candidates, future.result()):
+                    candidate.trials += batch
+                    candidate.total += total
+                    candidate.total_squares += total_squares
+            done += batch * self.workers
+            best = max(candidates, key=PlayStatistics.mean)
+            lower = best.mean() - best.interval(self.z)
+            candidates = [candidate for candidate in candidates
+                          if candidate is best or candidate.mean() + candidate.interval(self.z) >= lower]
+        statistics.sort(key=lambda candidate: (candidate in candidates, candidate.mean()), reverse=True)
+        return statistics
+
+    def choose_play(self, state):
+        """
+        Returns the play with the best rollout equity.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, with the dice rolled
+
+        Returns
+        -------
+        tuple[(int, int, int)]
+        """
+
+        return self.evaluate(state)[0].play
+
+    def close(self):
+        """
+        Shuts the process pool down.
+
+        Returns
+        -------
+        None
+        """
+
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,330 @@
+import random
+import time
+from evaluation import evaluate, game_points
+from game_state import ROLLS
+from transposition import TranspositionTable
+
+
+# bounds of any equity, used by the chance node pruning: a backgammon is the most a game can be worth
+MIN_EQUITY = -3.0
+MAX_EQUITY = 3.0
+
+# keys mixed into the position hash of a decision node, one per roll, so that its best play is stored apart from the
+# value of the chance node of the same position
+_roll_rng = random.Random(0xBB67AE85)
+ROLL_KEYS = {(dice_value_1, dice_value_2): _roll_rng.getrandbits(64) for dice_value_1, dice_value_2, _ in ROLLS}
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time budget of the move is spent."""
+
+
+class ExpectiminimaxSearch:
+    """
+    A class used to choose plays by expectiminimax search, within a time budget.
+
+    ...
+
+    Decision nodes pick the play that is best for the player to move; chance nodes average over the 21 distinct
+    rolls, weighted by their probability. Chance nodes are pruned with Star1: a roll whose value can no longer bring
+    the average inside the (alpha, beta) window cuts the node off. The search deepens one play at a time and returns
+    the best play of the deepest search completed within the budget. Decision nodes store their best play in the
+    transposition table, and the next, deeper iteration tries it first.
+
+    The first iteration, one play deep, ignores the time budget and always runs to completion, so that a play is
+    always chosen from a full evaluation; with many legal plays it may take longer than the budget.
+
+    Attributes
+    ----------
+    time_budget : float
+        seconds allowed per move; the one play deep search always completes
+    max_depth : int
+        maximum number of plays searched ahead, the root play included
+    evaluator : callable
+        static evaluation, taking a GameState whose turn is the player about to roll and a player index, and
+        returning the equity for that player
+    table : TranspositionTable
+        values of chance nodes already searched, keyed by Zobrist hash, and best plays of decision nodes, keyed by
+        the hash mixed with ROLL_KEYS
+    batch_evaluator : callable, optional
+        vectorized static evaluation, taking stacked positions, a player index, the players about to roll and the
+        number of pieces per player (see batch_evaluation.evaluate_batch); when given, the last chance nodes of the
+        search evaluate the positions after every play of every roll in one call, instead of one position at a time
+    nodes : int
+        number of chance nodes visited by the last search
+    depth_reached : int
+        depth of the last completed iteration of the last search
+
+    Methods
+    -------
+    choose_play(state):
+        Returns the best legal play for the player to move, with the dice already rolled.
+    """
+
+    def __init__(self, time_budget=1.0, max_depth=3, evaluator=evaluate, table=None, batch_evaluator=None):
+        """
+        Provides all the necessary attributes to search.
+
+        Parameters
+        ----------
+        time_budget : float
+            seconds allowed per move
+        max_depth : int
+            maximum number of plays searched ahead, the root play included
+        evaluator : callable
+            static evaluation, taking a GameState and a player index
+        table : TranspositionTable, optional
+            table to share between searches; a new one is made by default
+        batch_evaluator : callable, optional
+            vectorized static evaluation of the last chance nodes, see batch_evaluation.evaluate_batch
+        """
+
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.evaluator = evaluator
+        self.table = TranspositionTable(1 << 18) if table is None else table
+        self.batch_evaluator = batch_evaluator
+        self.nodes = 0
+        self.depth_reached = 0
+        self._deadline = None
+
+    def choose_play(self, state):
+        """
+        Returns the best legal play for the player to move, with the dice already rolled.
+
+        The given state is not changed; the search runs on a copy. The one play deep search is completed whatever
+        the time budget.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, with the dice rolled
+
+        Returns
+        -------
+        tuple[(int, int, int)]
+        """
+
+        plays = state.legal_plays()
+        if len(plays) == 1:
+            return plays[0]
+        deadline = time.perf_counter() + self.time_budget
+        state = state.copy()
+        self.table.new_search()
+        self.nodes = 0
+        self.depth_reached = 0
+        self._deadline = None
+        ordered = list(plays)
+        for depth in range(1, self.max_depth + 1):
+            try:
+                values = self._root_values(state, ordered, depth)
+            except SearchTimeout:
+                break
+            ordered.sort(key=values.get, reverse=True)
+            self.depth_reached = depth
+            if time.perf_counter() >= deadline:
+                break
+            self._deadline = deadline
+        self._deadline = None
+        return ordered[0]
+
+    def _root_values(self, state, plays, depth):
+        """
+        Searches every root play, best candidates first, and returns their values.
+
+        Plays that cannot beat the best one found so far only get an upper bound.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, with the dice rolled
+        plays : list[tuple]
+            the legal plays, in the order to try them
+        depth : int
+            number of plays to search ahead
+
+        Returns
+        -------
+        dict
+            maps plays to their values
+        """
+
+        values = {}
+        best = MIN_EQUITY
+        for play in plays:
+            value = self._play_value(state, play, depth, best, MAX_EQUITY)
+            values[play] = value
+            if value > best:
+                best = value
+        return values
+
+    def _play_value(self, state, play, depth, alpha, beta):
+        """
+        Returns the value of making a play for the player to move, restoring the state afterwards.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, with the dice rolled
+        play : tuple[(int, int, int)]
+            a legal play
+        depth : int
+            number of plays to search ahead, this one included
+        alpha : float
+            value the player to move is already sure of
+        beta : float
+            value above which the opponent will avoid this position
+
+        Returns
+        -------
+        float
+        """
+
+        mover = state.turn
+        records = [state.apply_move(*step) for step in play]
+        winner = state.winner()
+        if winner is not None:
+            value = game_points(state, winner)
+        else:
+            dice = state.dice
+            state.end_turn()
+            if depth <= 1:
+                value = self.evaluator(state, mover)
+            else:
+                value = -self._chance(state, depth - 1, -beta, -alpha)
+            state.end_turn()
+            state.dice = dice
+        for record in reversed(records):
+            state.undo_move(record)
+        return value
+
+    def _chance(self, state, depth, alpha, beta):
+        """
+        Returns the value of the position for the player about to roll, averaged over the 21 rolls.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, before the roll
+        depth : int
+            number of plays to search ahead
+        alpha : float
+            lower bound of the window of interest
+        beta : float
+            upper bound of the window of interest
+
+        Returns
+        -------
+        float
+            the exact value if it lies within the window, otherwise a bound outside it
+        """
+
+        self.nodes += 1
+        entry = self.table.lookup(state.hash, depth)
+        if entry is not None:
+            return entry[0]
+        if depth == 1 and self.batch_evaluator is not None:
+            total = self._batch_chance(state)
+            self.table.store(state.hash, depth, total)
+            return total
+        remaining = 1.0
+        total = 0.0
+        for dice_value_1, dice_value_2, probability in ROLLS:
+            remaining -= probability
+            child_alpha = (alpha - total - remaining * MAX_EQUITY) / probability
+            child_beta = (beta - total - remaining * MIN_EQUITY) / probability
+            value = self._decision(state, dice_value_1, dice_value_2, depth, max(MIN_EQUITY, child_alpha),
+                                   min(MAX_EQUITY, child_beta))
+            total += probability * value
+            if value <= child_alpha:
+                return total + remaining * MAX_EQUITY
+            if value >= child_beta:
+                return total + remaining * MIN_EQUITY
+        self.table.store(state.hash, depth, total)
+        return total
+
+    def _batch_chance(self, state):
+        """
+        Returns the exact value of the position for the player about to roll, when each play is only evaluated.
+
+        The positions after every play of the 21 rolls are stacked and evaluated in one call of the batch evaluator.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, before the roll
+
+        Returns
+        -------
+        float
+        """
+
+        # imported here so that the search runs without NumPy when no batch evaluator is used
+        import numpy as np
+        from batch_evaluation import stack_keys
+
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise SearchTimeout
+        mover = state.turn
+        keys = []
+        sizes = []
+        for dice_value_1, dice_value_2, _ in ROLLS:
+            state.set_dice(dice_value_1, dice_value_2)
+            positions = state.legal_positions()
+            keys.extend(positions)
+            sizes.append(len(positions))
+        state.dice = []
+        boards = stack_keys(keys)
+        # the positions are evaluated with the opponent about to roll, as in _play_value
+        values = self.batch_evaluator(boards, mover, np.full(len(boards), 3 - mover), pieces=state.pieces)
+        best = np.maximum.reduceat(values, np.cumsum([0] + sizes[:-1]))
+        return float(sum(probability * value for (_, _, probability), value in zip(ROLLS, best)))
+
+    def _decision(self, state, dice_value_1, dice_value_2, depth, alpha, beta):
+        """
+        Returns the value of the best play for the player to move, after the given roll.
+
+        The best play stored by a shallower search of the same node is tried first, and the best play found is
+        stored for the next one.
+
+        Parameters
+        ----------
+        state : GameState
+            the position, before the roll
+        dice_value_1 : int
+            value of the first die
+        dice_value_2 : int
+            value of the second die
+        depth : int
+            number of plays to search ahead
+        alpha : float
+            value the player to move is already sure of
+        beta : float
+            value above which the search can stop
+
+        Returns
+        -------
+        float
+        """
+
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise SearchTimeout
+        state.set_dice(dice_value_1, dice_value_2)
+        node_hash = state.hash ^ ROLL_KEYS[dice_value_1, dice_value_2]
+        plays = state.legal_plays()
+        previous = self.table.best_play(node_hash)
+        if previous is not None and previous in plays:
+            plays = [previous] + [play for play in plays if play != previous]
+        best = MIN_EQUITY
+        best_play = None
+        for play in plays:
+            value = self._play_value(state, play, depth, max(alpha, best), beta)
+            if value > best:
+                best = value
+                best_play = play
+                if best >= beta:
+                    break
+        state.dice = []
+        if best_play is not None:
+            self.table.store(node_hash, depth, best, best_play)
+        return best
@@ -0,0 +1,850 @@
+import argparse
+import asyncio
+import functools
+import itertools
+import json
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from agents import DIFFICULTIES, agent_from_spec
+from evaluation import game_points
+from game_state import GameState
+import profiling
+from profiling import LatencyStats
+
+
+_agents = {}
+
+
+def _ai_play(spec, state):
+    """
+    Returns the play of an AI seat, in an executor worker; agents are created once per worker and spec.
+
+    Parameters
+    ----------
+    spec : str
+        the agent, see agents.agent_from_spec
+    state : GameState
+        the position, with the dice rolled
+
+    Returns
+    -------
+    tuple[(int, int, int)]
+    """
+
+    if spec not in _agents:
+        _agents[spec] = agent_from_spec(spec)
+    return _agents[spec].choose_play(state)
+
+
+def _legal(state, play):
+    """
+    Decides whether a play is one of the legal plays, in any move order, in an executor worker.
+
+    Parameters
+    ----------
+    state : GameState
+        the position, with the dice rolled
+    play : tuple[(int, int, int)]
+        the play
+
+    Returns
+    -------
+    bool
+    """
+
+    trial = state.copy()
+    try:
+        for step in play:
+            trial.apply_move(*step)
+    except (ValueError, IndexError, KeyError, OverflowError):
+        return False
+    return trial.position_key() in state.legal_positions()
+
+
+class Game:
+    """
+    A class used to represent one hosted game: its headless state and who sits in each seat.
+
+    ...
+
+    Attributes
+    ----------
+    game_id : int
+        number of the game on the server
+    state : GameState
+        the position
+    seats : dict[int, object]
+        per player, the connection of a client, the agent spec of an AI seat, or None while free
+    points : int
+        points won by the winner, 0 until the game is over
+    aborted : str, optional
+        why the game was stopped before its end, None otherwise
+    """
+
+    def __init__(self, game_id):
+        """
+        Parameters
+        ----------
+        game_id : int
+            number of the game on the server
+        """
+
+        self.game_id = game_id
+        self.state = None
+        self.seats = {1: None, 2: None}
+        self.points = 0
+        self.aborted = None
+
+    def started(self):
+        """Decides whether both seats were taken, which starts the game."""
+
+        return self.state is not None
+
+    def snapshot(self):
+        """
+        Returns the JSON form of the game, sent by the state command and with every update.
+
+        Returns
+        -------
+        dict
+        """
+
+        state = self.state
+        if state is None:
+            return {"game": self.game_id, "started": False}
+        return {"game": self.game_id, "started": True, "turn": state.turn, "dice": state.dice,
+                "board": list(state.board), "borne_off": [state.light_count, state.dark_count],
+                "winner": state.winner(), "points": self.points, "aborted": self.aborted}
+
+
+class GameServer:
+    """
+    A class used to host many concurrent games over a JSON lines protocol, on TCP or Unix sockets.
+
+    ...
+
+    Every request is one JSON object per line, with an "op" and an optional "id" echoed in the reply:
+    {"op": "join"} opens a game, {"op": "join", "game": n} takes the free seat of game n, and
+    {"op": "join", "opponent": "heuristic"} opens a game against an AI seat, one of agents.DIFFICULTIES. Then
+    {"op": "roll"}, {"op": "move", "play": [[selected_piece, clicked_column, dice_value], ...]} with a whole legal play
+    (possibly empty when nothing can be moved), {"op": "state"} and {"op": "stats"}. Replies carry "ok" and either
+    the result or an "error". After each change of a game, the other client of the game is sent
+    {"event": "state", ...}.
+
+    AI seats choose their plays and the plays of clients are checked on a shared executor, a process pool by default,
+    so that the event loop only ever applies plays. A game whose AI seat fails is aborted: its clients are sent its
+    state with the reason in "aborted".
+
+    Attributes
+    ----------
+    executor : concurrent.futures.Executor
+        where the AI seats choose their plays
+    games : dict[int, Game]
+        the games being played
+    latencies : LatencyStats
+        time to handle each kind of request, and the AI play time
+
+    Methods
+    -------
+    handle(reader, writer):
+        Serves one client connection.
+    start(host, port, path):
+        Starts listening on a TCP port or a Unix socket.
+    close():
+        Stops listening, cancels the AI turns and shuts the executor down.
+    """
+
+    def __init__(self, executor=None, rng=None):
+        """
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor, optional
+            where the AI seats choose their plays; a process pool with one worker per CPU by default
+        rng : random.Random, optional
+            source of the dice values and starting players
+        """
+
+        self.executor = ProcessPoolExecutor() if executor is None else executor
+        self.rng = random.Random() if rng is None else rng
+        self.games = {}
+        self.latencies = LatencyStats()
+        self._game_ids = itertools.count(1)
+        self._server = None
+        # the running AI turns, kept so that they are not garbage collected before they finish
+        self._ai_tasks = set()
+
+    async def handle(self, reader, writer):
+        """
+        Serves one client connection: reads requests until it closes and replies to each.
+
+        Parameters
+        ----------
+        reader : asyncio.StreamReader
+            the incoming requests
+        writer : asyncio.StreamWriter
+            where replies and updates go
+
+        Returns
+        -------
+        None
+        """
+
+        seat = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                start = time.perf_counter()
+                request = {}
+                try:
+                    request = json.loads(line)
+                    op = request.get("op")
+                    reply, seat = await self._dispatch(request, seat, writer)
+                except (ValueError, TypeError, AttributeError) as error:
+                    op = "invalid"
+                    reply = {"ok": False, "error": str(error)}
+                # the id of a rejected request too, so that the client can match the error to it
+                if isinstance(request, dict) and "id" in request:
+                    reply["id"] = request["id"]
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+                self.latencies.record(op if op in self._OPS else "invalid", time.perf_counter() - start)
+        except (ConnectionError, asyncio.CancelledError):
+            # a closing server cancels the connections still open
+            pass
+        finally:
+            if seat is not None:
+                self._leave(*seat)
+            writer.close()
+
+    _OPS = ("join", "roll", "move", "state", "stats")
+
+    async def _dispatch(self, request, seat, writer):
+        """
+        Carries out one request.
+
+        Parameters
+        ----------
+        request : dict
+            the decoded request
+        seat : (Game, int), optional
+            the game and player of the connection, once joined
+        writer : asyncio.StreamWriter
+            the connection
+
+        Returns
+        -------
+        (dict, (Game, int))
+            the reply and the seat of the connection afterwards
+        """
+
+        op = request.get("op")
+        if op == "stats":
+            return {"ok": True, "games": len(self.games), "latencies": self.latencies.summary()}, seat
+        if op == "join":
+            if seat is not None:
+                return {"ok": False, "error": "already seated"}, seat
+            seat = self._join(request.get("game"), request.get("opponent"), writer)
+            if seat is None:
+                return {"ok": False, "error": "no free seat in this game"}, None
+            return {"ok": True, "game": seat[0].game_id, "seat": seat[1]}, seat
+        if op not in self._OPS:
+            return {"ok": False, "error": f"unknown op {op!r}"}, seat
+        if seat is None:
+            return {"ok": False, "error": "join a game first"}, seat
+        game, player = seat
+        if op == "state":
+            return {"ok": True, **game.snapshot()}, seat
+        state = game.state
+        if state is None or state.winner() is not None or game.aborted is not None:
+            return {"ok": False, "error": "the game is not in progress"}, seat
+        if state.turn != player:
+            return {"ok": False, "error": "not your turn"}, seat
+        if op == "roll":
+            if state.dice:
+                return {"ok": False, "error": "already rolled"}, seat
+            state.roll(self.rng)
+            self._broadcast(game, writer)
+            return {"ok": True, "dice": state.dice}, seat
+        if not state.dice:
+            return {"ok": False, "error": "roll first"}, seat
+        play = tuple((int(source), None if target is None else int(target), int(dice_value))
+                     for source, target, dice_value in request.get("play", ()))
+        if not await asyncio.get_running_loop().run_in_executor(self.executor, _legal, state.copy(), play):
+            return {"ok": False, "error": "illegal play"}, seat
+        if game.aborted is not None:
+            return {"ok": False, "error": "the game is not in progress"}, seat
+        self._apply(game, play)
+        self._broadcast(game, writer)
+        return {"ok": True, **game.snapshot()}, seat
+
+    def _join(self, game_id, opponent, writer):
+        """
+        Seats a connection in a new game or in the free seat of an open one, starting the game once full.
+
+        Parameters
+        ----------
+        game_id : int, optional
+            the game to join; a new one by default
+        opponent : str, optional
+            agent taking the other seat of a new game, one of agents.DIFFICULTIES with its default options
+        writer : asyncio.StreamWriter
+            the connection
+
+        Returns
+        -------
+        (Game, int), optional
+            the game and player, None if the game has no free seat
+        """
+
+        if game_id is None:
+            # only the agents fast enough to play against, so that clients cannot ask for costly options
+            if opponent is not None and opponent not in DIFFICULTIES:
+                raise ValueError(f"unknown opponent {opponent!r}, expected one of {', '.join(DIFFICULTIES)}")
+            game = Game(next(self._game_ids))
+            self.games[game.game_id] = game
+            game.seats[2] = opponent
+        else:
+            game = self.games.get(int(game_id))
+            if game is None or game.started():
+                return None
+        player = 1 if game.seats[1] is None else 2
+        game.seats[player] = writer
+        if game.seats[3 - player] is not None:
+            game.state = GameState(self.rng.choice((1, 2)))
+            self._broadcast(game, writer)
+            self._schedule_ai(game)
+        return game, player
+
+    def _leave(self, game, player):
+        """
+        Frees a seat when its connection closes; a game nobody plays in any more is dropped.
+
+        Parameters
+        ----------
+        game : Game
+            the game
+        player : int
+            the seat
+
+        Returns
+        -------
+        None
+        """
+
+        game.seats[player] = None
+        if not any(isinstance(seat, asyncio.StreamWriter) for seat in game.seats.values()):
+            self.games.pop(game.game_id, None)
+
+    def _apply(self, game, play):
+        """
+        Plays a legal play and passes the turn, or ends the game.
+
+        Parameters
+        ----------
+        game : Game
+            the game
+        play : tuple[(int, int, int)]
+            the play
+
+        Returns
+        -------
+        None
+        """
+
+        state = game.state
+        for step in play:
+            state.apply_move(*step)
+        winner = state.winner()
+        if winner is not None:
+            game.points = game_points(state, winner)
+            self.games.pop(game.game_id, None)
+        else:
+            state.end_turn()
+            self._schedule_ai(game)
+
+    def _schedule_ai(self, game):
+        """
+        Starts the AI seat's turn, if it is to move.
+
+        Parameters
+        ----------
+        game : Game
+            the game
+
+        Returns
+        -------
+        None
+        """
+
+        if game.state.winner() is None and isinstance(game.seats[game.state.turn], str):
+            task = asyncio.get_running_loop().create_task(self._ai_turn(game))
+            self._ai_tasks.add(task)
+            task.add_done_callback(functools.partial(self._ai_done, game))
+
+    def _ai_done(self, game, task):
+        """
+        Forgets a finished AI turn; if it failed, logs the error and aborts the game for its clients.
+
+        Parameters
+        ----------
+        game : Game
+            the game
+        task : asyncio.Task
+            the AI turn
+
+        Returns
+        -------
+        None
+        """
+
+        self._ai_tasks.discard(task)
+        if task.cancelled() or task.exception() is None:
+            return
+        asyncio.get_running_loop().call_exception_handler(
+            {"message": f"AI turn of game {game.game_id} failed", "exception": task.exception(), "task": task})
+        game.aborted = f"the AI player failed: {task.exception()!r}"
+        self.games.pop(game.game_id, None)
+        self._broadcast(game, None)
+
+    async def _ai_turn(self, game):
+        """
+        Rolls for an AI seat and plays its choice, made on the executor.
+
+        Parameters
+        ----------
+        game : Game
+            the game
+
+        Returns
+        -------
+        None
+        """
+
+        state = game.state
+        state.roll(self.rng)
+        start = time.perf_counter()
+        play = await asyncio.get_running_loop().run_in_executor(self.executor, _ai_play, game.seats[state.turn],
+                                                                state.copy())
+        self.latencies.record("ai", time.perf_counter() - start)
+        self._apply(game, play)
+        self._broadcast(game, None)
+
+    def _broadcast(self, game, sender):
+        """
+        Sends the game's state to its clients, except the one whose request changed it, which gets a reply.
+
+        Parameters
+        ----------
+        game : Game
+            the game
+        sender : asyncio.StreamWriter, optional
+            the connection not to notify
+
+        Returns
+        -------
+        None
+        """
+
+        message = None
+        for seat in game.seats.values():
+            if isinstance(seat, asyncio.StreamWriter) and seat is not sender and not seat.is_closing():
+                if message is None:
+                    message = json.dumps({"event": "state", **game.snapshot()}).encode() + b"\n"
+                seat.write(message)
+
+    async def start(self, host="127.0.0.1", port=8765, path=None):
+        """
+        Starts listening on a TCP port, or on a Unix socket if path is given.
+
+        Parameters
+        ----------
+        host : str
+            interface to listen on
+        port : int
+            TCP port; 0 picks a free one
+        path : str, optional
+            file of the Unix socket
+
+        Returns
+        -------
+        asyncio.Server
+        """
+
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            self._server = await asyncio.start_server(self.handle, host, port)
+        return self._server
+
+    async def close(self):
+        """
+        Stops listening, cancels the AI turns and shuts the executor down.
+
+        Returns
+        -------
+        None
+        """
+
+        for task in list(self._ai_tasks):
+            task.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self.executor.shutdown(cancel_futures=True)
+
+
+class Client:
+    """
+    A class used to talk to a GameServer, as a stand-in for real clients in tests and load tests.
+
+    ...
+
+    Updates pushed by the server are kept as the latest state; replies are matched to requests by id.
+
+    Attributes
+    ----------
+    latest : dict, optional
+        the latest game state received, in a reply or an update
+    latencies : LatencyStats, optional
+        round trip time of each kind of request
+
+    Methods
+    -------
+    connect(host, port, path):
+        Opens a connection to the server.
+    request(op, **fields):
+        Sends a request and returns the reply.
+    wait_update(seen):
+        Waits until a state newer than the one seen arrives.
+    close():
+        Closes the connection.
+    """
+
+    def __init__(self, latencies=None):
+        """
+        Parameters
+        ----------
+        latencies : LatencyStats, optional
+            where the round trip times are recorded
+        """
+
+        self.latest = None
+        self.latencies = latencies
+        self._reader = None
+        self._writer = None
+        self._ids = itertools.count()
+        self._replies = {}
+        self._updated = None
+        self._listener = None
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=8765, path=None, latencies=None):
+        """
+        Opens a connection to the server, on a TCP port or on a Unix socket if path is given.
+
+        Parameters
+        ----------
+        host : str
+            the server's address
+        port : int
+            the server's TCP port
+        path : str, optional
+            file of the server's Unix socket
+        latencies : LatencyStats, optional
+            where the round trip times are recorded
+
+        Returns
+        -------
+        Client
+        """
+
+        client = cls(latencies)
+        if path is not None:
+            client._reader, client._writer = await asyncio.open_unix_connection(path)
+        else:
+            client._reader, client._writer = await asyncio.open_connection(host, port)
+        client._updated = asyncio.Event()
+        client._listener = asyncio.get_running_loop().create_task(client._listen())
+        return client
+
+    async def _listen(self):
+        """Reads the server's messages, resolving replies and keeping the latest state."""
+
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            if "started" in message:
+                self.latest = message
+                self._updated.set()
+            future = self._replies.pop(message.get("id"), None)
+            if future is not None:
+                future.set_result(message)
+        for future in self._replies.values():
+            future.set_exception(ConnectionError("the server closed the connection"))
+
+    async def request(self, op, **fields):
+        """
+        Sends a request and returns the reply.
+
+        Parameters
+        ----------
+        op : str
+            the request, see GameServer
+        **fields
+            its other fields
+
+        Returns
+        -------
+        dict
+        """
+
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._replies[request_id] = future
+        start = time.perf_counter()
+        self._writer.write(json.dumps({"op": op, "id": request_id, **fields}).encode() + b"\n")
+        await self._writer.drain()
+        reply = await future
+        if self.latencies is not None:
+            self.latencies.record(op, time.perf_counter() - start)
+        return reply
+
+    async def wait_update(self, seen):
+        """
+        Waits until a state newer than the one seen arrives.
+
+        Parameters
+        ----------
+        seen : dict
+            the latest state the caller knows of
+
+        Returns
+        -------
+        dict
+            the latest state
+        """
+
+        while self.latest is seen:
+            self._updated.clear()
+            await self._updated.wait()
+        return self.latest
+
+    async def close(self):
+        """
+        Closes the connection.
+
+        Returns
+        -------
+        None
+        """
+
+        self._writer.close()
+        await self._writer.wait_closed()
+        self._listener.cancel()
+
+
+async def play_client(client, rng, seat):
+    """
+    Plays a joined game with random legal plays, until it ends.
+
+    Parameters
+    ----------
+    client : Client
+        the connection, seated in a game
+    rng : random.Random
+        source of the play choices
+    seat : int
+        the client's player
+
+    Returns
+    -------
+    dict
+        the final state of the game
+    """
+
+    state = (await client.request("state"))
+    while True:
+        while not state["started"] or (state["winner"] is None and state["aborted"] is None and state["turn"] != seat):
+            state = await client.wait_update(state)
+        if state["aborted"] is not None:
+            raise RuntimeError(state["aborted"])
+        if state["winner"] is not None:
+            return state
+        if not state["dice"]:
+            await client.request("roll")
+            state = await client.request("state")
+        position = GameState(state["turn"], state["board"], *state["borne_off"], state["dice"])
+        state = await client.request("move", play=rng.choice(position.legal_plays()))
+        if not state["ok"]:
+            raise RuntimeError(state["error"])
+
+
+async def load_test(games, concurrency=100, opponent="random", host="127.0.0.1", port=0, path=None, seed=None,
+                    executor=None):
+    """
+    Starts a server and plays games against it from local clients, many at once.
+
+    Parameters
+    ----------
+    games : int
+        number of games to play
+    concurrency : int
+        number of games played at the same time
+    opponent : str, optional
+        agent spec of the AI seat of each game; None for two clients per game
+    host : str
+        interface of the server
+    port : int
+        TCP port of the server; 0 picks a free one
+    path : str, optional
+        file of a Unix socket to use instead
+    seed : int, optional
+        seed of the dice and plays
+    executor : concurrent.futures.Executor, optional
+        executor of the AI seats
+
+    Returns
+    -------
+    dict
+        games played, elapsed seconds, and the latencies seen by the server and by the clients
+    """
+
+    rng = random.Random(seed)
+    server = GameServer(executor, random.Random(rng.getrandbits(64)))
+    listener = await server.start(host, port, path)
+    if path is None:
+        host, port = listener.sockets[0].getsockname()[:2]
+    client_latencies = LatencyStats()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one_game(game_rng):
+        async with slots:
+            clients = [await Client.connect(host, port, path, client_latencies)]
+            try:
+                joined = await clients[0].request("join", **({} if opponent is None else {"opponent": opponent}))
+                players = [play_client(clients[0], game_rng, joined["seat"])]
+                if opponent is None:
+                    clients.append(await Client.connect(host, port, path, client_latencies))
+                    second = await clients[1].request("join", game=joined["game"])
+                    players.append(play_client(clients[1], game_rng, second["seat"]))
+                await asyncio.gather(*players)
+            finally:
+                for client in clients:
+                    await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_game(random.Random(rng.getrandbits(64))) for _ in range(games)))
+    elapsed = time.perf_counter() - start
+    await server.close()
+    return {"games": games, "seconds": elapsed, "server": server.latencies.summary(),
+            "client": client_latencies.summary()}
+
+
+def _print_latencies(title, latencies):
+    """Prints a LatencyStats summary as a table."""
+
+    print(title)
+    for kind, values in latencies.items():
+        print(f"  {kind:8} {values['count']:9} requests  mean {values['mean_ms']:8.3f} ms  "
+              f"p50 {values['p50_ms']:8.3f}  p95 {values['p95_ms']:8.3f}  p99 {values['p99_ms']:8.3f}  "
+              f"max {values['max_ms']:8.3f}")
+
+
+async def serve(host, port, path, executor):
+    """
+    Runs a server until interrupted.
+
+    Parameters
+    ----------
+    host : str
+        interface to listen on
+    port : int
+        TCP port
+    path : str, optional
+        file of a Unix socket to listen on instead
+    executor : concurrent.futures.Executor
+        where the AI seats choose their plays
+
+    Returns
+    -------
+    None
+    """
+
+    server = GameServer(executor)
+    listener = await server.start(host, port, path)
+    print(f"serving on {path or listener.sockets[0].getsockname()}")
+    try:
+        await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    """
+    Runs a game server, or a load test against a local one, from the command line.
+
+    Parameters
+    ----------
+    argv : list[str], optional
+        command line arguments; sys.argv by default
+
+    Returns
+    -------
+    int
+        exit status
+    """
+
+    parser = argparse.ArgumentParser(description="Host many concurrent games over a JSON lines socket protocol.")
+    parser.add_argument("--host", default="127.0.0.1", help="interface to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, help="number of processes choosing the AI seats' plays")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="choose the AI seats' plays on threads of this process and write a profile: timings of "
+                             "the hot paths if PATH ends with .json, else a cProfile dump for pstats, which only "
+                             "covers the event loop")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("serve", help="serve games until interrupted")
+    loader = commands.add_parser("load", help="play games from local clients against a local server")
+    loader.add_argument("games", type=int, help="number of games to play")
+    loader.add_argument("--concurrency", type=int, default=100, help="number of games played at the same time")
+    loader.add_argument("--opponent", default="random",
+                        help="agent of the AI seat of each game, or 'none' for two clients per game")
+    loader.add_argument("--seed", type=int, help="seed of the dice and plays")
+    args = parser.parse_args(argv)
+
+    # the AI work stays in this process when profiling, where the instrumentation can see it
+    executor = ProcessPoolExecutor(args.workers) if args.profile is None else ThreadPoolExecutor(args.workers)
+    if args.command == "serve":
+        def run():
+            try:
+                asyncio.run(serve(args.host, args.port, args.unix, executor))
+            except KeyboardInterrupt:
+                pass
+
+        if args.profile is None:
+            run()
+        else:
+            profiling.run(run, args.profile)
+        return 0
+    opponent = None if args.opponent == "none" else args.opponent
+
+    def run():
+        return asyncio.run(load_test(args.games, args.concurrency, opponent, args.host, 0, args.unix, args.seed,
+                                     executor))
+
+    result = run() if args.profile is None else profiling.run(run, args.profile)
+    print(f"{result['games']} games in {result['seconds']:.1f}s, {result['games'] / result['seconds']:.1f} games/s")
+    _print_latencies("server handling time:", result["server"])
+    _print_latencies("client round trip time:", result["client"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
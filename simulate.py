@@ -0,0 +1,258 @@
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import profiling
+from agents import agent_from_spec
+from evaluation import game_points
+from game_state import GameState
+from records import GameRecord, GameRecordWriter
+
+
+def play_game(agents, rng, starting_player=None, record=None):
+    """
+    Plays one game between two agents, without any visuals.
+
+    Parameters
+    ----------
+    agents : dict[int, object]
+        the agent of each player, 1 and 2
+    rng : random.Random
+        source of the dice values
+    starting_player : int, optional
+        index of the player who goes first; chosen at random by default
+    record : GameRecord, optional
+        record the rolls, plays and result are appended to; its starting_player is set
+
+    Returns
+    -------
+    (int, int, int)
+        the winner, the points won and the number of turns played
+    """
+
+    state = GameState(starting_player or rng.choice((1, 2)))
+    if record is not None:
+        record.starting_player = state.turn
+    turns = 0
+    while state.winner() is None:
+        roll = state.roll(rng)
+        play = agents[state.turn].choose_play(state)
+        for step in play:
+            state.apply_move(*step)
+        state.end_turn()
+        if record is not None:
+            record.turns.append((roll, play))
+        turns += 1
+    winner = state.winner()
+    points = game_points(state, winner)
+    if record is not None:
+        record.winner, record.points = winner, points
+    return winner, points, turns
+
+
+def _empty_totals():
+    """
+    Returns the totals of zero games, see _simulate_batch.
+
+    Returns
+    -------
+    dict
+    """
+
+    return {"games": 0, "wins": [0, 0], "gammons": [0, 0], "backgammons": [0, 0], "turns": 0, "points": 0,
+            "points_squared": 0}
+
+
+def _simulate_batch(spec_1, spec_2, games, seed, record=False):
+    """
+    Plays a batch of games in a worker process and returns their totals.
+
+    Parameters
+    ----------
+    spec_1 : str
+        agent of player 1, see agents.agent_from_spec
+    spec_2 : str
+        agent of player 2
+    games : int
+        number of games to play
+    seed : int
+        seed of the batch's dice and of the agents' random choices
+    record : bool
+        also return the GameRecord of every game, under "records"
+
+    Returns
+    -------
+    dict
+        counts of games, wins, gammons and backgammons per player, turns, and the sum and sum of squares of the points
+        won by player 1
+    """
+
+    random.seed(seed)
+    rng = random.Random(seed)
+    agents = {1: agent_from_spec(spec_1), 2: agent_from_spec(spec_2)}
+    totals = _empty_totals()
+    if record:
+        totals["records"] = []
+    for _ in range(games):
+        game_record = GameRecord(None) if record else None
+        winner, points, turns = play_game(agents, rng, record=game_record)
+        if record:
+            totals["records"].append(game_record)
+        totals["games"] += 1
+        totals["wins"][winner - 1] += 1
+        if points >= 2:
+            totals["gammons"][winner - 1] += 1
+        if points == 3:
+            totals["backgammons"][winner - 1] += 1
+        totals["turns"] += turns
+        signed_points = points if winner == 1 else -points
+        totals["points"] += signed_points
+        totals["points_squared"] += signed_points * signed_points
+    return totals
+
+
+def simulate(spec_1, spec_2, games, workers=None, batch_games=100, seed=None, record_path=None):
+    """
+    Plays games between two agents across a process pool and returns the aggregate statistics.
+
+    Parameters
+    ----------
+    spec_1 : str
+        agent of player 1, see agents.agent_from_spec
+    spec_2 : str
+        agent of player 2
+    games : int
+        number of games to play
+    workers : int, optional
+        number of worker processes; the number of CPUs by default, 0 to play in this process
+    batch_games : int
+        number of games per task sent to a worker
+    seed : int, optional
+        seed of the batches, for repeatable simulations
+    record_path : str, optional
+        game record file the games are appended to, see records.py
+
+    Returns
+    -------
+    dict
+        totals of _simulate_batch, plus the elapsed seconds
+    """
+
+    rng = random.Random(seed)
+    batches = [min(batch_games, games - start) for start in range(0, games, batch_games)]
+    totals = _empty_totals()
+    start = time.perf_counter()
+    recorder = GameRecordWriter(record_path) if record_path is not None else None
+    seeds = [rng.getrandbits(64) for _ in batches]
+    executor = ProcessPoolExecutor(workers or os.cpu_count() or 1) if workers != 0 else None
+    try:
+        if executor is None:
+            # played here, where profiling can see them
+            results = (_simulate_batch(spec_1, spec_2, batch, seed, recorder is not None)
+                       for batch, seed in zip(batches, seeds))
+        else:
+            futures = [executor.submit(_simulate_batch, spec_1, spec_2, batch, seed, recorder is not None)
+                       for batch, seed in zip(batches, seeds)]
+            results = (future.result() for future in futures)
+        for batch_totals in results:
+            # the workers only play, the records are all written here
+            for game_record in batch_totals.pop("records", ()):
+                recorder.write_game(game_record)
+            for key, value in batch_totals.items():
+                if isinstance(value, list):
+                    totals[key] = [total + part for total, part in zip(totals[key], value)]
+                else:
+                    totals[key] += value
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    if recorder is not None:
+        recorder.close()
+    totals["seconds"] = time.perf_counter() - start
+    return totals
+
+
+def summarize(totals, z=1.96):
+    """
+    Turns simulation totals into rates, with confidence intervals.
+
+    Parameters
+    ----------
+    totals : dict
+        the result of simulate
+    z : float
+        number of standard errors of the confidence intervals, 1.96 for 95%
+
+    Returns
+    -------
+    dict
+        games per second, average game length in turns, and per player the win, gammon and backgammon rates; the
+        win rate of player 1 and the points per game of player 1 come with the half-width of their interval
+    """
+
+    games = totals["games"]
+    win_rate = totals["wins"][0] / games
+    points = totals["points"] / games
+    variance = (totals["points_squared"] - games * points * points) / (games - 1) if games > 1 else 0.0
+    return {
+        "games": games,
+        "games_per_second": games / totals["seconds"],
+        "average_turns": totals["turns"] / games,
+        "win_rate": [wins / games for wins in totals["wins"]],
+        "win_rate_interval": z * math.sqrt(win_rate * (1 - win_rate) / games),
+        "gammon_rate": [gammons / games for gammons in totals["gammons"]],
+        "backgammon_rate": [backgammons / games for backgammons in totals["backgammons"]],
+        "points_per_game": points,
+        "points_per_game_interval": z * math.sqrt(max(variance, 0.0) / games),
+    }
+
+
+def main(argv=None):
+    """
+    Runs a simulation from the command line and prints its statistics.
+
+    Parameters
+    ----------
+    argv : list[str], optional
+        command line arguments; sys.argv by default
+
+    Returns
+    -------
+    int
+        exit status
+    """
+
+    parser = argparse.ArgumentParser(description="Play games between two AI agents, without any visuals.")
+    parser.add_argument("games", type=int, help="number of games to play")
+    parser.add_argument("--agent1", default="heuristic", help="agent of player 1, e.g. search:time_budget=0.05")
+    parser.add_argument("--agent2", default="random", help="agent of player 2")
+    parser.add_argument("--workers", type=int, help="number of worker processes, 0 to play in this process")
+    parser.add_argument("--batch", type=int, default=100, help="number of games per task")
+    parser.add_argument("--seed", type=int, help="seed, for repeatable simulations")
+    parser.add_argument("--record", metavar="PATH", help="append the games to a game record file")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="play in this process and write a profile: timings of the hot paths if PATH ends with "
+                             ".json, else a cProfile dump for pstats")
+    args = parser.parse_args(argv)
+
+    def run():
+        return simulate(args.agent1, args.agent2, args.games, 0 if args.profile else args.workers, args.batch,
+                        args.seed, args.record)
+
+    summary = summarize(run() if args.profile is None else profiling.run(run, args.profile))
+    print(f"{summary['games']} games, {summary['games_per_second']:.1f} games/s, "
+          f"{summary['average_turns']:.1f} turns per game")
+    for player, spec in ((1, args.agent1), (2, args.agent2)):
+        print(f"Player {player} ({spec}): wins {summary['win_rate'][player - 1]:.2%}, "
+              f"gammons {summary['gammon_rate'][player - 1]:.2%}, "
+              f"backgammons {summary['backgammon_rate'][player - 1]:.2%}")
+    print(f"Player 1 win rate 95% interval: +/- {summary['win_rate_interval']:.2%}")
+    print(f"Player 1 points per game: {summary['points_per_game']:+.3f} +/- {summary['points_per_game_interval']:.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
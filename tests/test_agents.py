@@ -0,0 +1,24 @@
+import random
+from agents import HeuristicAgent
+from game_state import ROLLS
+from opening_book import mirror
+from test_game_state import random_positions
+
+
+def test_heuristic_agent_plays_both_colours_alike():
+    agent = HeuristicAgent()
+    rng = random.Random(1)
+    different = 0
+    for state in random_positions(1000, seed=2):
+        dice_value_1, dice_value_2, _ = rng.choice(ROLLS)
+        state.set_dice(dice_value_1, dice_value_2)
+        mirrored = mirror(state)
+        after = state.copy()
+        for move in agent.choose_play(state):
+            after.apply_move(*move)
+        mirrored_after = mirrored.copy()
+        for move in agent.choose_play(mirrored):
+            mirrored_after.apply_move(*move)
+        different += mirror(after).position_key() != mirrored_after.position_key()
+    # only plays equal in both evaluation and spread may still differ
+    assert different <= 10
@@ -0,0 +1,83 @@
+import random
+import numpy as np
+import pytest
+from batch_evaluation import evaluate_batch, game_points_batch, stack_positions
+from evaluation import evaluate, game_points
+from game_state import GameState, VARIANTS
+
+
+def random_positions(variant, count, seed):
+    """Returns positions reached by random play, before each roll, with the player to move."""
+
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        state = GameState(variant=variant)
+        while state.winner() is None and len(positions) < count:
+            positions.append(state.copy())
+            state.roll(rng)
+            plays = state.legal_plays()
+            if plays:
+                for move in rng.choice(plays):
+                    state.apply_move(*move)
+            state.end_turn()
+    return positions
+
+
+def finished_positions(variant, count, seed):
+    """Returns random finished games: the winner has borne off every piece, the loser's pieces are anywhere."""
+
+    rng = random.Random(seed)
+    pieces = GameState(variant=variant).pieces
+    positions = []
+    for _ in range(count):
+        winner = rng.choice((1, 2))
+        # gammons and backgammons need a loser who bore off nothing
+        off = 0 if rng.random() < 0.5 else rng.randrange(pieces)
+        board = [0] * 26
+        # the loser's pieces go on points or on their bar, or stay out of the winner's home; the winner has none left
+        if rng.random() < 0.5:
+            columns = [*range(24), 25 if winner == 1 else 24]
+        else:
+            columns = list(range(18) if winner == 1 else range(6, 24))
+        for _ in range(pieces - off):
+            column = rng.choice(columns)
+            board[column] += -1 if winner == 1 and column < 24 else 1
+        light_count, dark_count = (pieces, off) if winner == 1 else (off, pieces)
+        positions.append(GameState(rng.choice((1, 2)), board, light_count, dark_count, variant=variant))
+    return positions
+
+
+@pytest.mark.parametrize("variant", sorted(VARIANTS))
+def test_finished_games_match_scalar_evaluation(variant):
+    positions = finished_positions(variant, 500, seed=1)
+    pieces = positions[0].pieces
+    boards = stack_positions(positions)
+    turns = np.array([state.turn for state in positions])
+    expected = [game_points(state, 1) if state.winner() == 1 else -game_points(state, 2) for state in positions]
+    assert game_points_batch(boards, pieces).tolist() == expected
+    for player in (1, 2):
+        values = evaluate_batch(boards, player, turns, pieces)
+        assert values.tolist() == [evaluate(state, player) for state in positions]
+    # a finished hypergammon game can be worth a gammon or a backgammon
+    assert {abs(points) for points in expected} == {1, 2, 3}
+
+
+@pytest.mark.parametrize("variant", sorted(VARIANTS))
+def test_positions_match_scalar_evaluation(variant):
+    positions = random_positions(variant, 2000, seed=2)
+    boards = stack_positions(positions)
+    turns = np.array([state.turn for state in positions])
+    for player in (1, 2):
+        values = evaluate_batch(boards, player, turns, positions[0].pieces)
+        assert values == pytest.approx([evaluate(state, player) for state in positions], abs=1e-9)
+
+
+def test_search_batch_chance_matches_scalar_in_hypergammon():
+    from search import ExpectiminimaxSearch, MAX_EQUITY, MIN_EQUITY
+
+    scalar = ExpectiminimaxSearch(max_depth=1)
+    batch = ExpectiminimaxSearch(max_depth=1, batch_evaluator=evaluate_batch)
+    for state in random_positions("hypergammon", 300, seed=3):
+        expected = scalar._chance(state.copy(), 1, MIN_EQUITY, MAX_EQUITY)
+        assert batch._chance(state.copy(), 1, MIN_EQUITY, MAX_EQUITY) == pytest.approx(expected, abs=1e-9)
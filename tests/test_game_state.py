@@ -0,0 +1,194 @@
+import random
+import pytest
+from game_state import GameState, ROLLS
+
+
+def mover_view(key, turn):
+    """Turns a position key into (points, bar, off, opponent bar), the player to move's pieces positive on points
+    numbered in their direction of travel."""
+
+    signed = [value - 256 if value > 127 else value for value in key[:26]]
+    if turn == 1:
+        return tuple(signed[:24]), signed[24], key[26], signed[25]
+    return tuple(-signed[23 - i] for i in range(24)), signed[25], key[27], signed[24]
+
+
+def brute_steps(position, dice_value):
+    """Lists the positions one dice move can reach, from the rules alone."""
+
+    points, bar, off, opponent_bar = position
+    reached = []
+
+    def move(source, target):
+        board = list(points)
+        entered_bar = bar
+        if source is None:
+            entered_bar -= 1
+        else:
+            board[source] -= 1
+        hits = 0
+        if target is not None:
+            if board[target] == -1:
+                board[target] = 0
+                hits = 1
+            board[target] += 1
+        reached.append((tuple(board), entered_bar, off + (target is None), opponent_bar + hits))
+
+    if bar > 0:
+        if points[dice_value - 1] >= -1:
+            move(None, dice_value - 1)
+        return reached
+    all_home = all(points[i] <= 0 for i in range(18))
+    for i in range(24):
+        if points[i] <= 0:
+            continue
+        target = i + dice_value
+        if target < 24:
+            if points[target] >= -1:
+                move(i, target)
+        elif all_home and (target == 24 or all(points[j] <= 0 for j in range(18, i))):
+            move(i, None)
+    return reached
+
+
+def brute_levels(position, order):
+    """Returns the sets of positions reached after using 0, 1, ... dice moves in the given order."""
+
+    levels = [{position}]
+    for dice_value in order:
+        reached = {after for before in levels[-1] for after in brute_steps(before, dice_value)}
+        if not reached:
+            break
+        levels.append(reached)
+    return levels
+
+
+def brute_plays(position, dice):
+    """Returns the positions reached by the legal plays, using as many dice moves as possible and the higher dice
+    move when only one of two can be used."""
+
+    if len(dice) == 2 and dice[0] != dice[1]:
+        orders = [tuple(sorted(dice, reverse=True)), tuple(sorted(dice))]
+    else:
+        orders = [tuple(dice)]
+    all_levels = [brute_levels(position, order) for order in orders]
+    most = max(len(levels) for levels in all_levels) - 1
+    if most == 1 and len(orders) == 2 and len(all_levels[0]) > 1:
+        return all_levels[0][1]
+    return set().union(*(levels[most] for levels in all_levels if len(levels) > most))
+
+
+def random_positions(count, seed):
+    """Returns positions of random games, with random ones where pieces are scattered, on the bar or borne off."""
+
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count // 2:
+        state = GameState()
+        while state.winner() is None and len(positions) < count // 2:
+            positions.append(state.copy())
+            state.roll(rng)
+            plays = state.legal_plays()
+            for move in rng.choice(plays):
+                state.apply_move(*move)
+            state.end_turn()
+    while len(positions) < count:
+        board = [0] * 26
+        counts = []
+        for sign, bar, home in ((1, 24, range(18, 24)), (-1, 25, range(6))):
+            off = rng.randrange(15)
+            # half of the positions keep every piece home, to exercise bearing off
+            columns = list(home) if rng.random() < 0.5 else [*range(24), bar]
+            # only columns the opponent does not hold, the bar if they hold them all
+            columns = [column for column in columns if column >= 24 or board[column] * sign >= 0] or [bar]
+            for _ in range(15 - off):
+                column = rng.choice(columns)
+                board[column] += sign if column < 24 else 1
+            counts.append(off)
+        positions.append(GameState(rng.choice((1, 2)), board, *counts))
+    return positions[:count]
+
+
+def test_random_positions_are_valid():
+    for seed in range(200):
+        positions = random_positions(40, seed)
+        assert len(positions) == 40
+        for state in positions:
+            board = state.board
+            light = sum(pieces for pieces in board[:24] if pieces > 0) + board[24] + state.light_count
+            dark = -sum(pieces for pieces in board[:24] if pieces < 0) + board[25] + state.dark_count
+            assert (light, dark) == (15, 15)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_legal_plays_match_brute_force(seed):
+    rng = random.Random(seed)
+    for state in random_positions(500, seed):
+        dice_value_1, dice_value_2, _ = rng.choice(ROLLS)
+        state.set_dice(dice_value_1, dice_value_2)
+        expected = brute_plays(mover_view(state.position_key(), state.turn), list(state.dice))
+        keys = state.legal_positions()
+        assert len(set(keys)) == len(keys)
+        assert {mover_view(key, state.turn) for key in keys} == expected
+        # every play leads to its key, and every legal first move starts a legal play
+        for play, key in zip(state.legal_plays(), keys):
+            after = state.copy()
+            for move in play:
+                after.apply_move(*move)
+            assert after.position_key() == key
+        steps = state.legal_steps()
+        assert {play[0] for play in state.legal_plays() if play} <= steps
+        for step in steps:
+            after = state.copy()
+            after.apply_move(*step)
+            assert {mover_view(key, state.turn) for key in after.legal_positions()} <= expected
+
+
+def test_no_legal_move_gives_the_empty_play():
+    # dark holds every entry point, so light cannot enter from the bar
+    board = [0] * 26
+    for i in range(6):
+        board[i] = -2
+    board[6] = -3
+    board[24] = 1
+    board[12] = 14
+    state = GameState(1, board)
+    state.set_dice(6, 5)
+    assert state.legal_plays() == [()]
+    assert state.valid_move_exists() == (False, None, None)
+
+
+def test_higher_dice_move_when_only_one_can_be_used():
+    # light's last piece can move 12 -> 18 or 12 -> 17, but dark blocks 23 for the other dice move
+    board = [0] * 26
+    board[12] = 1
+    board[23] = -2
+    board[0] = -13
+    state = GameState(1, board, light_count=14)
+    state.set_dice(6, 5)
+    assert state.legal_plays() == [((12, 18, 6),)]
+
+
+def test_bear_off_with_higher_dice_only_from_the_furthest_point():
+    board = [0] * 26
+    board[20] = 1
+    board[22] = 1
+    board[0] = -15
+    state = GameState(1, board, light_count=13)
+    state.set_dice(6, 6)
+    assert {play for play in state.legal_plays()} == {((20, None, 6), (22, None, 6))}
+
+
+def test_cache_is_dropped_by_moves_and_dice():
+    state = GameState()
+    state.set_dice(6, 5)
+    plays = state.legal_plays()
+    assert state.legal_plays() is plays
+    assert (state.cache_hits, state.cache_misses) == (1, 1)
+    state.set_dice(4, 2)
+    assert state.legal_plays() is not plays
+    record = state.apply_move(*state.legal_plays()[0][0])
+    state.undo_move(record)
+    assert sorted(state.dice) == [2, 4]
+    state.legal_plays()
+    assert state.cache_misses == 3
@@ -0,0 +1,103 @@
+import random
+import numpy as np
+import pytest
+from evaluation import game_points
+from game_state import LIGHT_BAR, DARK_BAR, ROLLS, GameState
+from hypergammon import _OFFSET, HypergammonTable, _flat, _places, _sides, build_successors, generate, position_count
+
+
+def state_of(mover, opponent, turn):
+    """Returns the hypergammon position with the given places of the pieces of the player to move and the
+    opponent's, see hypergammon._PLACES."""
+
+    board = [0] * 26
+    counts = {}
+    for player, places in ((turn, mover), (3 - turn, opponent)):
+        counts[player] = 0
+        for place in places:
+            if place == 0:
+                counts[player] += 1
+            elif place == 25:
+                board[LIGHT_BAR if player == 1 else DARK_BAR] += 1
+            elif player == 1:
+                board[24 - place] += 1
+            else:
+                board[place - 1] -= 1
+    return GameState(turn, board, counts[1], counts[2], variant="hypergammon")
+
+
+def expected_codes(state, ranks, side_total):
+    """Returns the successor codes of the legal plays of the state's roll, from GameState.legal_plays; the empty
+    play of a roll without legal move passes the same position to the opponent."""
+
+    codes = set()
+    for play in state.legal_plays():
+        after = state.copy()
+        for move in play:
+            after.apply_move(*move)
+        mover, opponent = _places(after)
+        if not any(mover):
+            codes.add(game_points(after, after.turn))
+        else:
+            rank_mover, rank_opponent = ranks[_flat(np.array([mover, opponent], dtype=np.int8))]
+            codes.add(int(rank_opponent) * side_total + int(rank_mover) + _OFFSET)
+    return codes
+
+
+def test_successors_match_legal_plays(tmp_path):
+    checkers = 2
+    sides, ranks = _sides(checkers)
+    total = position_count(checkers)
+    # one chunk: the codes are stored roll by roll, then position by position
+    build_successors(str(tmp_path), checkers, chunk_size=total)
+    counts = np.fromfile(tmp_path / "counts.u8", dtype=np.uint8).reshape(len(ROLLS), total)
+    successors = np.fromfile(tmp_path / "successors.i32", dtype=np.int32)
+    starts = np.concatenate(([0], np.cumsum(counts.ravel(), dtype=np.int64)))
+    rng = random.Random(3)
+    checked = 0
+    while checked < 3000:
+        index = rng.randrange(total)
+        mover, opponent = sides[index // len(sides)].tolist(), sides[index % len(sides)].tolist()
+        on_points = {place for place in mover if 0 < place < 25}
+        if not any(mover) or not any(opponent) or any(25 - place in on_points for place in opponent if 0 < place < 25):
+            continue
+        roll = rng.randrange(len(ROLLS))
+        dice_value_1, dice_value_2, _ = ROLLS[roll]
+        state = state_of(mover, opponent, rng.choice((1, 2)))
+        state.set_dice(dice_value_1, dice_value_2)
+        start = starts[roll * total + index]
+        codes = successors[start:start + counts[roll, index]].tolist()
+        assert sorted(codes) == sorted(expected_codes(state, ranks, len(sides)))
+        checked += 1
+
+
+def test_solved_equities_satisfy_the_bellman_equation(tmp_path):
+    path = str(tmp_path / "hypergammon.bin")
+    generate(path, checkers=1, tolerance=1e-5)
+    table = HypergammonTable(path)
+    checked = 0
+    for mover in range(1, 26):
+        for opponent in range(1, 26):
+            if 0 < mover < 25 and mover + opponent == 25:
+                continue
+            state = state_of([mover], [opponent], 1)
+            expected = 0.0
+            for dice_value_1, dice_value_2, probability in ROLLS:
+                state.set_dice(dice_value_1, dice_value_2)
+                best = -3.0
+                for play in state.legal_plays():
+                    after = state.copy()
+                    for move in play:
+                        after.apply_move(*move)
+                    if after.light_count == 1:
+                        value = game_points(after, 1)
+                    else:
+                        after.end_turn()
+                        value = -table.equity(after)
+                    best = max(best, value)
+                expected += probability * best
+            # float16 entries hold about 3 significant digits
+            assert table.equity(state) == pytest.approx(expected, abs=1e-2)
+            checked += 1
+    table.close()
+    assert checked == 25 * 25 - 24
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from batch_evaluation import stack_positions
+from game_state import GameState
+from position_id import KEY_SIZE, decode, decode_batch, encode, encode_batch, from_text, to_text
+from test_batch_evaluation import finished_positions, random_positions as random_variant_positions
+from test_game_state import random_positions
+
+
+def test_starting_position_has_the_gnu_backgammon_id():
+    assert to_text(encode(GameState())) == "4HPwATDgc/ABMA"
+    assert decode(from_text("4HPwATDgc/ABMA")).position_key() == GameState().position_key()
+
+
+def test_keys_round_trip():
+    positions = random_positions(3000, seed=11)
+    for state in positions:
+        key = encode(state)
+        assert len(key) == KEY_SIZE
+        assert decode(key, state.turn).position_key() == state.position_key()
+        for urlsafe in (False, True):
+            assert from_text(to_text(key, urlsafe)) == key
+    # different positions, or the same one with the other player to move, have different keys
+    assert len({(encode(state)) for state in positions}) == len({(state.position_key(), state.turn)
+                                                                 for state in positions})
+
+
+def test_batch_matches_scalar_encoding():
+    positions = random_positions(3000, seed=12)
+    boards = stack_positions(positions)
+    turns = np.array([state.turn for state in positions])
+    keys = encode_batch(boards, turns)
+    assert [bytes(key) for key in keys] == [encode(state) for state in positions]
+    assert np.array_equal(decode_batch(keys, turns), boards)
+
+
+def test_text_of_the_wrong_length_is_rejected():
+    with pytest.raises(ValueError):
+        from_text("4HPwATDgc/ABM")
+
+
+def test_hypergammon_keys_round_trip():
+    positions = finished_positions("hypergammon", 200, seed=13) + random_variant_positions("hypergammon", 1000, seed=14)
+    boards = stack_positions(positions)
+    turns = np.array([state.turn for state in positions])
+    keys = encode_batch(boards, turns)
+    assert np.array_equal(decode_batch(keys, turns, pieces=3), boards)
+    for state, key in zip(positions, keys):
+        decoded = decode(bytes(key), state.turn, "hypergammon")
+        assert decoded.position_key() == state.position_key()
+        assert decoded.winner() == state.winner()
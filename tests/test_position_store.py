@@ -0,0 +1,76 @@
+import random
+from collections import Counter
+import numpy as np
+import pytest
+from game_state import GameState
+from position_id import KEY_SIZE, encode
+from position_store import PositionStore
+from test_records import random_games
+
+
+def random_additions(count, seed):
+    """Returns keys drawn from a small pool, many sharing their first 8 bytes, with random outcomes."""
+
+    rng = random.Random(seed)
+    prefixes = [bytes(rng.randrange(256) for _ in range(8)) for _ in range(20)]
+    pool = [rng.choice(prefixes) + bytes(rng.randrange(256) for _ in range(2)) for _ in range(300)]
+    keys = [rng.choice(pool) for _ in range(count)]
+    outcomes = [(won, won and rng.random() < 0.2, not won and rng.random() < 0.2)
+                for won in (rng.random() < 0.5 for _ in range(count))]
+    return pool, keys, outcomes
+
+
+def expected_statistics(keys, outcomes):
+    statistics = Counter()
+    for key, (won, gammon_won, gammon_lost) in zip(keys, outcomes):
+        statistics[key, 0] += 1
+        statistics[key, 1] += won
+        statistics[key, 2] += gammon_won
+        statistics[key, 3] += gammon_lost
+    return statistics
+
+
+def as_array(keys):
+    return np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(len(keys), KEY_SIZE)
+
+
+def check(store, pool, expected):
+    totals = store.lookup(as_array(pool))
+    for key, row in zip(pool, totals):
+        assert list(row) == [expected[key, column] for column in range(4)]
+    assert store.get(b"\xff" * KEY_SIZE) == (0, 0, 0, 0)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_lookup_and_compact_match_counting(tmp_path, seed):
+    pool, keys, outcomes = random_additions(5000, seed)
+    expected = expected_statistics(keys, outcomes)
+    path = str(tmp_path / "positions")
+    with PositionStore(path, buffer_size=700) as store:
+        for start in range(0, len(keys), 250):
+            won, gammon_won, gammon_lost = (np.array(column) for column in zip(*outcomes[start:start + 250]))
+            store.add(as_array(keys[start:start + 250]), won, gammon_won, gammon_lost)
+    store = PositionStore(path)
+    assert len(store._runs) > 1
+    check(store, pool, expected)
+    store.compact(chunk_size=17)
+    assert len(store._runs) == 1
+    run = store._runs[0]
+    stored = [key.tobytes() for key in run.keys]
+    assert stored == sorted(set(keys))
+    check(store, pool, expected)
+    check(PositionStore(path), pool, expected)
+
+
+def test_games_are_added_from_the_player_to_move(tmp_path):
+    games = [record for record in random_games(30, 1) if record.winner is not None]
+    store = PositionStore(str(tmp_path / "positions"))
+    for record in games:
+        store.add_game(record)
+    store.flush()
+    # the starting position has the same key whoever moves first
+    visits, wins, gammons_won, gammons_lost = store.get(encode(GameState()))
+    assert visits == len(games)
+    assert wins == sum(record.winner == record.starting_player for record in games)
+    assert gammons_won == sum(record.winner == record.starting_player and record.points >= 2 for record in games)
+    assert gammons_lost == sum(record.winner != record.starting_player and record.points >= 2 for record in games)
@@ -0,0 +1,109 @@
+import random
+import pytest
+from evaluation import game_points
+from game_state import BAR, GameState
+from records import GameRecord, GameRecordWriter, import_match, read_games, replay
+
+
+MATCH = """\
+ 3 point match
+
+ Game 1
+ Alice : 0                             Bob : 0
+  1)                                   31: 8/5 6/5
+  2) 64: 24/18 13/9                    52: 13/8 13/11
+  3) 64: 24/18 18/14*                  Doubles => 2
+  4)  Takes                            31: bar/22 6/5
+  5) 21: 9/7 6/5                       Wins 2 points
+
+ Game 2
+ Alice : 0                             Bob : 2
+  1) 43: 24/20 13/10
+  2)                                   Wins 1 point
+"""
+
+
+def random_games(count, seed):
+    """Plays games with random legal plays, the last one left unfinished."""
+
+    rng = random.Random(seed)
+    games = []
+    for index in range(count):
+        state = GameState(rng.choice((1, 2)))
+        record = GameRecord(state.turn)
+        while state.winner() is None and (index < count - 1 or len(record.turns) < 10):
+            state.roll(rng)
+            play = rng.choice(state.legal_plays())
+            record.turns.append((tuple(state.dice[:2]), play))
+            for move in play:
+                state.apply_move(*move)
+            state.end_turn()
+        if state.winner() is not None:
+            record.winner = state.winner()
+            record.points = game_points(state, record.winner)
+        games.append(record)
+    return games
+
+
+def as_tuples(records):
+    return [(record.starting_player, record.turns, record.winner, record.points) for record in records]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 16])
+def test_written_games_read_back(tmp_path, chunk_size):
+    games = random_games(20, chunk_size)
+    path = str(tmp_path / "games.bgr")
+    with GameRecordWriter(path, buffer_size=100) as writer:
+        for record in games[:10]:
+            writer.write_game(record)
+    # appending to an existing file keeps a single header
+    with GameRecordWriter(path) as writer:
+        for record in games[10:]:
+            writer.write_game(record)
+    read = list(read_games(path, chunk_size))
+    assert as_tuples(read) == as_tuples(games)
+    for record in read:
+        for _ in replay(record, validate=True):
+            pass
+
+
+def test_truncated_and_foreign_files_are_rejected(tmp_path):
+    path = tmp_path / "games.bgr"
+    with GameRecordWriter(str(path)) as writer:
+        for record in random_games(3, 0):
+            writer.write_game(record)
+    data = path.read_bytes()
+    path.write_bytes(data[:-1])
+    with pytest.raises(ValueError, match="truncated"):
+        list(read_games(str(path), 7))
+    path.write_bytes(b"PNG" + data[3:])
+    with pytest.raises(ValueError, match="not a game record file"):
+        list(read_games(str(path)))
+
+
+def test_import_match(tmp_path):
+    path = tmp_path / "match.txt"
+    path.write_text(MATCH)
+    games = import_match(str(path))
+    assert [(record.starting_player, record.winner, record.points) for record in games] == [(2, 2, 2), (1, 2, 1)]
+    assert games[0].turns == [
+        ((3, 1), ((7, 4, 3), (5, 4, 1))),
+        ((6, 4), ((0, 6, 6), (11, 15, 4))),
+        ((5, 2), ((12, 7, 5), (12, 10, 2))),
+        ((6, 4), ((0, 6, 6), (6, 10, 4))),
+        ((3, 1), ((BAR, 21, 3), (5, 4, 1))),
+        ((2, 1), ((15, 17, 2), (18, 19, 1))),
+    ]
+    assert games[1].turns == [((4, 3), ((0, 4, 4), (11, 14, 3)))]
+    records = str(tmp_path / "games.bgr")
+    with GameRecordWriter(records) as writer:
+        for record in games:
+            writer.write_game(record)
+    assert as_tuples(read_games(records)) == as_tuples(games)
+
+
+def test_illegal_match_play_is_reported(tmp_path):
+    path = tmp_path / "match.txt"
+    path.write_text(MATCH.replace("24/18 13/9", "24/18 13/7"))
+    with pytest.raises(ValueError, match="line 6: 24/18 13/7 is not a legal play"):
+        import_match(str(path))
@@ -0,0 +1,23 @@
+import random
+from game_state import GameState
+from rollout import _rollout_batch
+
+
+def test_random_policy_depends_only_on_the_batch_seed():
+    state = GameState()
+    state.set_dice(3, 1)
+    plays = state.legal_plays()[:3]
+    results = []
+    # forked workers start from the same state of the random module, which must not decide their games
+    for module_seed, batch_seed in ((0, 1), (1, 1), (0, 2)):
+        random.seed(module_seed)
+        results.append(_rollout_batch(state, plays, 20, batch_seed, "random"))
+    assert results[0] == results[1]
+    assert results[0] != results[2]
+
+
+def test_heuristic_rollouts_are_repeatable():
+    state = GameState()
+    state.set_dice(6, 5)
+    plays = state.legal_plays()[:2]
+    assert _rollout_batch(state, plays, 5, 3, "heuristic") == _rollout_batch(state, plays, 5, 3, "heuristic")
@@ -0,0 +1,43 @@
+import random
+from game_state import GameState, ROLLS
+from search import ExpectiminimaxSearch, MAX_EQUITY, MIN_EQUITY, ROLL_KEYS
+
+
+def test_decision_nodes_store_their_best_play():
+    search = ExpectiminimaxSearch(max_depth=1)
+    state = GameState()
+    for dice_value_1, dice_value_2, _ in ROLLS:
+        value = search._decision(state, dice_value_1, dice_value_2, 1, MIN_EQUITY, MAX_EQUITY)
+        state.set_dice(dice_value_1, dice_value_2)
+        plays = state.legal_plays()
+        values = [search._play_value(state, play, 1, MIN_EQUITY, MAX_EQUITY) for play in plays]
+        best_play = search.table.best_play(state.hash ^ ROLL_KEYS[dice_value_1, dice_value_2])
+        assert best_play in plays
+        assert value == max(values) == values[plays.index(best_play)]
+        state.dice = []
+
+
+def test_stored_best_play_is_tried_first_without_changing_values():
+    rng = random.Random(5)
+    state = GameState()
+    for _ in range(6):
+        state.roll(rng)
+        for move in rng.choice(state.legal_plays()):
+            state.apply_move(*move)
+        state.end_turn()
+    cold = ExpectiminimaxSearch(max_depth=2)
+    warm = ExpectiminimaxSearch(max_depth=2)
+    for dice_value_1, dice_value_2, _ in ROLLS[:6]:
+        # the warm search first stores the best plays of its one play deep decision nodes
+        warm._chance(state, 1, MIN_EQUITY, MAX_EQUITY)
+        warm.table.new_search()
+        expected = cold._decision(state, dice_value_1, dice_value_2, 2, MIN_EQUITY, MAX_EQUITY)
+        assert warm._decision(state, dice_value_1, dice_value_2, 2, MIN_EQUITY, MAX_EQUITY) == expected
+
+
+def test_search_returns_a_legal_play():
+    state = GameState()
+    state.set_dice(3, 1)
+    search = ExpectiminimaxSearch(time_budget=0.2, max_depth=2)
+    assert search.choose_play(state) in state.legal_plays()
+    assert search.depth_reached >= 1
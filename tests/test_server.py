@@ -0,0 +1,56 @@
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import server
+from server import Client, GameServer, load_test, play_client
+
+
+async def joined_client(game_server, **fields):
+    listener = await game_server.start(port=0)
+    client = await Client.connect(*listener.sockets[0].getsockname()[:2])
+    return client, await client.request("join", **fields)
+
+
+def test_games_against_ai_seats_finish():
+    result = asyncio.run(load_test(10, opponent="random", seed=1, executor=ThreadPoolExecutor(2)))
+    assert result["server"]["ai"]["count"] > 0
+    assert result["server"]["move"]["count"] > 0
+
+
+@pytest.mark.parametrize("opponent", ["search:max_depth=99", "rollout", "nobody"])
+def test_only_difficulties_can_be_asked_for(opponent):
+    async def run():
+        game_server = GameServer(ThreadPoolExecutor(1))
+        client, reply = await joined_client(game_server, opponent=opponent)
+        await client.close()
+        await game_server.close()
+        return reply
+
+    reply = asyncio.run(run())
+    assert not reply["ok"]
+    assert "unknown opponent" in reply["error"]
+
+
+def test_failed_ai_turn_aborts_the_game(monkeypatch):
+    def fail(spec, state):
+        raise RuntimeError("no play")
+
+    monkeypatch.setattr(server, "_ai_play", fail)
+    errors = []
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        game_server = GameServer(ThreadPoolExecutor(1), random.Random(0))
+        client, reply = await joined_client(game_server, opponent="random")
+        try:
+            with pytest.raises(RuntimeError, match="the AI player failed"):
+                await asyncio.wait_for(play_client(client, random.Random(0), reply["seat"]), 10)
+            assert (await client.request("roll"))["error"] == "the game is not in progress"
+            assert not game_server.games and not game_server._ai_tasks
+        finally:
+            await client.close()
+            await game_server.close()
+
+    asyncio.run(run())
+    assert [context["message"] for context in errors] == ["AI turn of game 1 failed"]
@@ -0,0 +1,58 @@
+import random
+import pytest
+from game_state import GameState
+from transposition import TranspositionTable
+
+
+@pytest.mark.parametrize("variant", ["standard", "hypergammon"])
+def test_hash_is_kept_up_to_date(variant):
+    rng = random.Random(7)
+    for _ in range(20):
+        state = GameState(variant=variant)
+        assert state.hash == state.compute_hash()
+        while state.winner() is None:
+            state.roll(rng)
+            before = (state.position_key(), state.hash, sorted(state.dice))
+            for step in state.legal_steps():
+                record = state.apply_move(*step)
+                assert state.hash == state.compute_hash()
+                state.undo_move(record)
+                assert (state.position_key(), state.hash, sorted(state.dice)) == before
+            for move in rng.choice(state.legal_plays()):
+                state.apply_move(*move)
+                assert state.hash == state.compute_hash()
+            state.end_turn()
+            assert state.hash == state.compute_hash()
+            assert state.copy().hash == state.hash
+
+
+def test_equal_positions_have_equal_hashes():
+    state = GameState()
+    state.set_dice(3, 1)
+    # 8/5 6/5 in either order reaches the same position
+    first = state.copy()
+    first.apply_move(16, 19, 3)
+    first.apply_move(18, 19, 1)
+    second = state.copy()
+    second.apply_move(18, 19, 1)
+    second.apply_move(16, 19, 3)
+    assert first.position_key() == second.position_key()
+    assert first.hash == second.hash != state.hash
+
+
+def test_table_keeps_deeper_entries_of_the_current_search():
+    table = TranspositionTable(1000)
+    assert table.size == 512
+    table.store(5, 2, 0.5, ((0, 1, 1),))
+    table.store(5 + 512, 1, 0.1)
+    # the shallower entry of the same slot does not replace the deeper one
+    assert table.lookup(5, 2) == (0.5, ((0, 1, 1),))
+    assert table.lookup(5 + 512) is None
+    assert table.lookup(5, 3) is None
+    table.new_search()
+    table.store(5 + 512, 1, 0.1)
+    assert table.lookup(5 + 512, 1) == (0.1, None)
+    assert table.best_play(5) is None
+    assert (table.hits, table.misses) == (2, 2)
+    table.clear()
+    assert table.lookup(5 + 512) is None
@@ -0,0 +1,279 @@
+import argparse
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import profiling
+from agents import DIFFICULTIES, agent_from_spec
+from simulate import play_game
+
+
+# agent specs of the default tournament, quick enough for a few hundred games in minutes
+DEFAULT_AGENTS = ("random", "heuristic", "search:time_budget=0.02,max_depth=2", "rollout:trials=8,workers=1")
+ELO_SCALE = 400 / math.log(10)
+
+
+def _play_pairs(spec_1, spec_2, pairs, seed):
+    """
+    Plays mirrored pairs of games between two agents, in a worker process.
+
+    Both games of a pair use the same dice, the agents swapping seats: whatever luck one agent had in the first game,
+    the other has in the second. Player 1 starts both games.
+
+    Parameters
+    ----------
+    spec_1 : str
+        first agent, see agents.agent_from_spec
+    spec_2 : str
+        second agent
+    pairs : int
+        number of pairs of games
+    seed : int
+        seed of the dice and of the agents' random choices
+
+    Returns
+    -------
+    (int, int, int)
+        games played, games won by the first agent and points won by the first agent, net of the points lost
+    """
+
+    random.seed(seed)
+    rng = random.Random(seed)
+    first = agent_from_spec(spec_1)
+    second = agent_from_spec(spec_2)
+    games = wins = points = 0
+    for _ in range(pairs):
+        dice_seed = rng.getrandbits(64)
+        for agents, first_player in (({1: first, 2: second}, 1), ({1: second, 2: first}, 2)):
+            winner, game_points, _ = play_game(agents, random.Random(dice_seed), starting_player=1)
+            games += 1
+            if winner == first_player:
+                wins += 1
+                points += game_points
+            else:
+                points -= game_points
+    return games, wins, points
+
+
+def run_tournament(specs, pairs=50, workers=None, batch_pairs=5, seed=None, report=None):
+    """
+    Plays a round robin between agents across a process pool.
+
+    Parameters
+    ----------
+    specs : list[str]
+        the agents, see agents.agent_from_spec
+    pairs : int
+        number of mirrored pairs of games between every two agents
+    workers : int, optional
+        number of worker processes; the number of CPUs by default, 0 to play in this process
+    batch_pairs : int
+        number of pairs of games per task sent to a worker
+    seed : int, optional
+        seed of the tasks, for repeatable tournaments
+    report : callable, optional
+        called with the number of tasks done and the number of tasks, as tasks finish
+
+    Returns
+    -------
+    dict[(int, int), list[int]]
+        per pair of agent indices (i, j) with i < j: games played, games won by agent i, and net points of agent i
+    """
+
+    rng = random.Random(seed)
+    results = {pair: [0, 0, 0] for pair in itertools.combinations(range(len(specs)), 2)}
+    tasks = [((first, second), (specs[first], specs[second], min(batch_pairs, pairs - start), rng.getrandbits(64)))
+             for first, second in results for start in range(0, pairs, batch_pairs)]
+    executor = ProcessPoolExecutor(workers or os.cpu_count() or 1) if workers != 0 else None
+    try:
+        if executor is None:
+            # played here, where profiling can see them
+            done_tasks = ((pair, _play_pairs(*arguments)) for pair, arguments in tasks)
+        else:
+            futures = {executor.submit(_play_pairs, *arguments): pair for pair, arguments in tasks}
+            done_tasks = ((futures[future], future.result()) for future in as_completed(futures))
+        for done, (pair, task_results) in enumerate(done_tasks):
+            for index, value in enumerate(task_results):
+                results[pair][index] += value
+            if report is not None:
+                report(done + 1, len(tasks))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return results
+
+
+def _invert(matrix):
+    """
+    Returns the inverse of a small square matrix, by Gauss-Jordan elimination.
+
+    Parameters
+    ----------
+    matrix : list[list[float]]
+        an invertible matrix
+
+    Returns
+    -------
+    list[list[float]]
+    """
+
+    size = len(matrix)
+    rows = [list(row) + [float(column == index) for column in range(size)] for index, row in enumerate(matrix)]
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda row: abs(rows[row][column]))
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        scale = rows[column][column]
+        rows[column] = [value / scale for value in rows[column]]
+        for row in range(size):
+            if row != column and rows[row][column] != 0:
+                factor = rows[row][column]
+                rows[row] = [value - factor * pivot_value for value, pivot_value in zip(rows[row], rows[column])]
+    return [row[size:] for row in rows]
+
+
+def elo_ratings(count, results, prior=1.0, iterations=1000):
+    """
+    Fits Elo ratings to the game results, with their standard errors.
+
+    The ratings maximize the likelihood of the wins under the Bradley-Terry model, the probability that a wins over
+    b being 1 / (1 + 10 ** ((rating_b - rating_a) / 400)). Every pairing also counts prior virtual games, half won
+    by each side, so that a clean sweep still gives a finite rating. Ratings average to 0; their standard errors come
+    from the curvature of the likelihood at its maximum.
+
+    Parameters
+    ----------
+    count : int
+        number of agents
+    results : dict[(int, int), list[int]]
+        results of run_tournament
+    prior : float
+        number of virtual games per pairing
+    iterations : int
+        maximum number of iterations of the fit
+
+    Returns
+    -------
+    (list[float], list[float])
+        the rating and its standard error of each agent
+    """
+
+    games = [[0.0] * count for _ in range(count)]
+    wins = [prior * (count - 1) / 2] * count
+    for (first, second), (played, won, _) in results.items():
+        games[first][second] = games[second][first] = played + prior
+        wins[first] += won
+        wins[second] += played - won
+    strengths = [1.0] * count
+    # minorization-maximization updates of the Bradley-Terry strengths, see Hunter (2004)
+    for _ in range(iterations):
+        updated = [wins[agent] / sum(games[agent][other] / (strengths[agent] + strengths[other])
+                                     for other in range(count) if other != agent)
+                   for agent in range(count)]
+        scale = math.exp(sum(math.log(strength) for strength in updated) / count)
+        updated = [strength / scale for strength in updated]
+        converged = max(abs(math.log(new / old)) for new, old in zip(updated, strengths)) < 1e-10
+        strengths = updated
+        if converged:
+            break
+    ratings = [ELO_SCALE * math.log(strength) for strength in strengths]
+    # the information matrix is a graph Laplacian; adding 1/count everywhere pins the average rating at 0
+    information = [[0.0] * count for _ in range(count)]
+    for first, second in itertools.combinations(range(count), 2):
+        p = strengths[first] / (strengths[first] + strengths[second])
+        weight = games[first][second] * p * (1 - p)
+        information[first][second] -= weight
+        information[second][first] -= weight
+        information[first][first] += weight
+        information[second][second] += weight
+    covariance = _invert([[value + 1 / count for value in row] for row in information])
+    errors = [ELO_SCALE * math.sqrt(max(covariance[agent][agent] - 1 / count, 0.0)) for agent in range(count)]
+    return ratings, errors
+
+
+def standings(specs, results, prior=1.0, z=1.96):
+    """
+    Ranks the agents by Elo rating.
+
+    Parameters
+    ----------
+    specs : list[str]
+        the agents
+    results : dict[(int, int), list[int]]
+        results of run_tournament
+    prior : float
+        number of virtual games per pairing, see elo_ratings
+    z : float
+        number of standard errors of the rating intervals, 1.96 for 95%
+
+    Returns
+    -------
+    list[dict]
+        per agent, best first: spec, rating, half-width of its interval, games, score and points per game
+    """
+
+    ratings, errors = elo_ratings(len(specs), results, prior)
+    table = []
+    for agent, spec in enumerate(specs):
+        games = wins = points = 0
+        for (first, second), (played, won, net_points) in results.items():
+            if agent == first:
+                games, wins, points = games + played, wins + won, points + net_points
+            elif agent == second:
+                games, wins, points = games + played, wins + played - won, points - net_points
+        table.append({"agent": spec, "rating": ratings[agent], "interval": z * errors[agent], "games": games,
+                      "score": wins / games if games else 0.0, "points_per_game": points / games if games else 0.0})
+    table.sort(key=lambda row: row["rating"], reverse=True)
+    return table
+
+
+def main(argv=None):
+    """
+    Runs a round robin tournament from the command line and prints the standings.
+
+    Parameters
+    ----------
+    argv : list[str], optional
+        command line arguments; sys.argv by default
+
+    Returns
+    -------
+    int
+        exit status
+    """
+
+    parser = argparse.ArgumentParser(description="Play a round robin between AI agents and rate them.")
+    parser.add_argument("agents", nargs="*", help="agent specs, e.g. search:time_budget=0.05; a default set if none")
+    parser.add_argument("--pairs", type=int, default=50, help="mirrored pairs of games between every two agents")
+    parser.add_argument("--workers", type=int, help="number of worker processes, 0 to play in this process")
+    parser.add_argument("--batch", type=int, default=5, help="number of pairs of games per task")
+    parser.add_argument("--seed", type=int, help="seed, for repeatable tournaments")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="play in this process and write a profile: timings of the hot paths if PATH ends with "
+                             ".json, else a cProfile dump for pstats")
+    args = parser.parse_args(argv)
+
+    # the neural agent joins the default tournament once trained
+    specs = args.agents or list(DEFAULT_AGENTS) + (["neural"] if "neural" in DIFFICULTIES else [])
+    start = time.perf_counter()
+
+    def report(done, total):
+        print(f"\r{done}/{total} tasks, {time.perf_counter() - start:.0f}s", end="", file=sys.stderr, flush=True)
+
+    def run():
+        return run_tournament(specs, args.pairs, 0 if args.profile else args.workers, args.batch, args.seed, report)
+
+    results = run() if args.profile is None else profiling.run(run, args.profile)
+    print(file=sys.stderr)
+    width = max(len(spec) for spec in specs)
+    print(f"{'':4}{'agent':{width}}  {'Elo':>6} {'95%':>6} {'games':>6} {'score':>7} {'points/game':>12}")
+    for rank, row in enumerate(standings(specs, results), 1):
+        print(f"{rank:<4}{row['agent']:{width}}  {row['rating']:6.0f} {row['interval']:6.0f} {row['games']:6} "
+              f"{row['score']:7.1%} {row['points_per_game']:+12.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,393 @@
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import numpy as np
+import profiling
+from batch_evaluation import stack_keys
+from position_id import KEY_SIZE, encode_batch
+from records import read_games, replay
+from simulate import _simulate_batch
+
+
+# arrays of a shard and of a batch: position keys relative to the player to move (see position_id.py), the player to
+# move, the roll, and the points the player to move won in the end, negative when lost
+FIELDS = {"positions": (np.uint8, (KEY_SIZE,)), "turns": (np.int8, ()), "dice": (np.uint8, (2,)),
+          "outcomes": (np.int8, ())}
+
+
+def positions_of_games(records):
+    """
+    Turns finished games into a batch of training positions: every position before a play, with its roll.
+
+    Parameters
+    ----------
+    records : iterable[records.GameRecord]
+        the games; unfinished ones are skipped
+
+    Returns
+    -------
+    dict[str, numpy.ndarray]
+        one array per entry of FIELDS, a row per position
+    """
+
+    keys = []
+    turns = []
+    dice = []
+    outcomes = []
+    for record in records:
+        if record.winner is None:
+            continue
+        for (state, _), (roll, _) in zip(replay(record), record.turns):
+            keys.append(state.position_key())
+            turns.append(state.turn)
+            dice.append(roll)
+            outcomes.append(record.points if state.turn == record.winner else -record.points)
+    turns = np.array(turns, dtype=np.int8)
+    positions = encode_batch(stack_keys(keys), turns) if keys else np.empty((0, KEY_SIZE), dtype=np.uint8)
+    return {"positions": positions, "turns": turns, "dice": np.array(dice, dtype=np.uint8).reshape(-1, 2),
+            "outcomes": np.array(outcomes, dtype=np.int8)}
+
+
+def _play_batch(spec_1, spec_2, games, seed):
+    """
+    Plays a batch of games in a worker process and returns their training positions.
+
+    Parameters
+    ----------
+    spec_1 : str
+        agent of player 1, see agents.agent_from_spec
+    spec_2 : str
+        agent of player 2
+    games : int
+        number of games to play
+    seed : int
+        seed of the batch's dice and of the agents' random choices
+
+    Returns
+    -------
+    dict[str, numpy.ndarray]
+        see positions_of_games
+    """
+
+    return positions_of_games(_simulate_batch(spec_1, spec_2, games, seed, record=True)["records"])
+
+
+def simulated_positions(spec_1, spec_2, games, workers=None, batch_games=50, seed=None):
+    """
+    Plays games between two agents across a process pool, yielding their training positions batch by batch.
+
+    Only a few batches per worker are queued at a time, so memory stays flat however many games are played. Batches
+    are yielded as they finish, not in submission order.
+
+    Parameters
+    ----------
+    spec_1 : str
+        agent of player 1, see agents.agent_from_spec
+    spec_2 : str
+        agent of player 2
+    games : int
+        number of games to play
+    workers : int, optional
+        number of worker processes; the number of CPUs by default, 0 to play in this process
+    batch_games : int
+        number of games per task sent to a worker
+    seed : int, optional
+        seed of the batches, for repeatable data; the order of the batches may still vary
+
+    Returns
+    -------
+    iterator[dict[str, numpy.ndarray]]
+        see positions_of_games
+    """
+
+    rng = random.Random(seed)
+    batches = iter([min(batch_games, games - start) for start in range(0, games, batch_games)])
+    if workers == 0:
+        # played here, where profiling can see them
+        for batch in batches:
+            yield _play_batch(spec_1, spec_2, batch, rng.getrandbits(64))
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as executor:
+        pending = set()
+        while True:
+            for batch in batches:
+                pending.add(executor.submit(_play_batch, spec_1, spec_2, batch, rng.getrandbits(64)))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def recorded_positions(path, batch_games=50):
+    """
+    Reads logged games, like those played in the game window, yielding their training positions batch by batch.
+
+    Parameters
+    ----------
+    path : str
+        game record file, see records.py
+    batch_games : int
+        number of games per batch
+
+    Returns
+    -------
+    iterator[dict[str, numpy.ndarray]]
+        see positions_of_games
+    """
+
+    games = []
+    for record in read_games(path):
+        games.append(record)
+        if len(games) == batch_games:
+            yield positions_of_games(games)
+            games = []
+    if games:
+        yield positions_of_games(games)
+
+
+class ShardWriter:
+    """
+    A class used to write training positions to NumPy shard files of a fixed number of rows.
+
+    ...
+
+    Rows are copied into the buffers of the current shard; a full shard is written by a pool of threads while the
+    next one fills, at most writers shards waiting at a time, so memory stays flat. Shards are numbered .npz files
+    holding one array per entry of FIELDS; only the last one may be smaller.
+
+    Attributes
+    ----------
+    directory : str
+        directory of the shard files, created if needed
+    shard_size : int
+        number of rows per shard
+    compress : bool
+        whether shards are compressed
+    rows : int
+        number of rows added
+
+    Methods
+    -------
+    add(batch):
+        Adds rows, returning the paths of the shards written since the last call.
+    close():
+        Writes the last shard and returns the paths of the shards not returned yet.
+    """
+
+    def __init__(self, directory, shard_size=1 << 16, compress=False, writers=2):
+        """
+        Parameters
+        ----------
+        directory : str
+            directory of the shard files, created if needed
+        shard_size : int
+            number of rows per shard
+        compress : bool
+            compress the shards, for less disk space but slower reading
+        writers : int
+            number of threads writing shards
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.shard_size = shard_size
+        self.compress = compress
+        self.rows = 0
+        self._writers = writers
+        self._executor = ThreadPoolExecutor(writers)
+        self._pending = []
+        self._shards = 0
+        self._filled = 0
+        self._buffers = self._new_buffers()
+
+    def _new_buffers(self):
+        """Allocates the arrays of one shard."""
+
+        return {name: np.empty((self.shard_size,) + shape, dtype=dtype) for name, (dtype, shape) in FIELDS.items()}
+
+    def _write(self, path, buffers):
+        """Writes one shard, in a writer thread."""
+
+        (np.savez_compressed if self.compress else np.savez)(path, **buffers)
+        return path
+
+    def _submit(self):
+        """Hands the current shard to the writer threads, waiting while too many shards are queued."""
+
+        if len(self._pending) >= self._writers:
+            wait(self._pending[:len(self._pending) - self._writers + 1])
+        buffers = {name: array[:self._filled] for name, array in self._buffers.items()}
+        path = os.path.join(self.directory, f"shard-{self._shards:05d}.npz")
+        self._pending.append(self._executor.submit(self._write, path, buffers))
+        self._shards += 1
+        self._filled = 0
+        self._buffers = self._new_buffers()
+
+    def _written(self, block=False):
+        """Returns the paths of the shards written so far, in order, and forgets them."""
+
+        paths = []
+        while self._pending and (block or self._pending[0].done()):
+            paths.append(self._pending.pop(0).result())
+        return paths
+
+    def add(self, batch):
+        """
+        Adds rows, returning the paths of the shards written since the last call.
+
+        Parameters
+        ----------
+        batch : dict[str, numpy.ndarray]
+            one array per entry of FIELDS, with the same number of rows
+
+        Returns
+        -------
+        list[str]
+        """
+
+        count = len(batch["turns"])
+        start = 0
+        while start < count:
+            taken = min(count - start, self.shard_size - self._filled)
+            for name, array in self._buffers.items():
+                array[self._filled:self._filled + taken] = batch[name][start:start + taken]
+            self._filled += taken
+            start += taken
+            if self._filled == self.shard_size:
+                self._submit()
+        self.rows += count
+        return self._written()
+
+    def close(self):
+        """
+        Writes the last shard, if it has any rows, and returns the paths of the shards not returned yet.
+
+        Returns
+        -------
+        list[str]
+        """
+
+        if self._executor is None:
+            return []
+        if self._filled > 0:
+            self._submit()
+        paths = self._written(block=True)
+        self._executor.shutdown()
+        self._executor = None
+        return paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def export(batches, directory, shard_size=1 << 16, compress=False, writers=2):
+    """
+    Writes batches of training positions to shards, yielding the path of each shard once written.
+
+    Parameters
+    ----------
+    batches : iterable[dict[str, numpy.ndarray]]
+        see simulated_positions and recorded_positions
+    directory : str
+        directory of the shard files
+    shard_size : int
+        number of rows per shard
+    compress : bool
+        compress the shards
+    writers : int
+        number of threads writing shards
+
+    Returns
+    -------
+    iterator[str]
+    """
+
+    with ShardWriter(directory, shard_size, compress, writers) as writer:
+        for batch in batches:
+            yield from writer.add(batch)
+        yield from writer.close()
+
+
+def read_shards(directory):
+    """
+    Yields the shards of a directory in order, each as a dict of arrays, see FIELDS.
+
+    Parameters
+    ----------
+    directory : str
+        directory of the shard files
+
+    Returns
+    -------
+    iterator[dict[str, numpy.ndarray]]
+    """
+
+    for name in sorted(os.listdir(directory)):
+        if name.startswith("shard-") and name.endswith(".npz"):
+            with np.load(os.path.join(directory, name)) as shard:
+                yield {field: shard[field] for field in FIELDS}
+
+
+def main(argv=None):
+    """
+    Exports training positions from simulated or logged games from the command line.
+
+    Parameters
+    ----------
+    argv : list[str], optional
+        command line arguments; sys.argv by default
+
+    Returns
+    -------
+    int
+        exit status
+    """
+
+    parser = argparse.ArgumentParser(description="Write training positions of games to NumPy shard files.")
+    parser.add_argument("directory", help="directory of the shard files")
+    parser.add_argument("games", type=int, nargs="?", default=1000, help="number of games to simulate")
+    parser.add_argument("--agent1", default="heuristic", help="agent of player 1, e.g. search:time_budget=0.05")
+    parser.add_argument("--agent2", default="heuristic", help="agent of player 2")
+    parser.add_argument("--records", metavar="PATH", help="export the games of a game record file instead")
+    parser.add_argument("--shard-size", type=int, default=1 << 16, help="number of positions per shard")
+    parser.add_argument("--compress", action="store_true", help="compress the shards")
+    parser.add_argument("--workers", type=int, help="number of game worker processes, 0 to play in this process")
+    parser.add_argument("--writers", type=int, default=2, help="number of threads writing shards")
+    parser.add_argument("--batch", type=int, default=50, help="number of games per task")
+    parser.add_argument("--seed", type=int, help="seed, for repeatable data")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="play in this process and write a profile: timings of the hot paths if PATH ends with "
+                             ".json, else a cProfile dump for pstats")
+    args = parser.parse_args(argv)
+
+    if args.records is not None:
+        batches = recorded_positions(args.records, args.batch)
+    else:
+        batches = simulated_positions(args.agent1, args.agent2, args.games, 0 if args.profile else args.workers,
+                                      args.batch, args.seed)
+    start = time.perf_counter()
+
+    def run():
+        shards = 0
+        for path in export(batches, args.directory, args.shard_size, args.compress, args.writers):
+            shards += 1
+            print(f"{time.perf_counter() - start:7.1f}s  {path}", flush=True)
+        return shards
+
+    shards = run() if args.profile is None else profiling.run(run, args.profile)
+    print(f"{shards} shards written to {args.directory} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import profiling
+
+
+class TranspositionTable:
+    """
+    A class used to represent a size-bounded table of evaluated positions, keyed by Zobrist hash.
+
+    ...
+
+    Each hash maps to one slot. A slot is replaced when it is empty, was stored during an older search, or holds an
+    evaluation that was searched at most as deeply as the new one.
+
+    Attributes
+    ----------
+    size : int
+        number of slots, a power of two
+    generation : int
+        index of the current search, used to age out entries from previous ones
+    hits : int
+        number of lookups that found their position
+    misses : int
+        number of lookups that did not
+
+    Methods
+    -------
+    lookup(position_hash, depth):
+        Returns the value and best play stored for the position, if searched at least depth deep.
+    best_play(position_hash):
+        Returns the best play stored for the position, whatever its depth.
+    store(position_hash, depth, value, best_play):
+        Stores the evaluation of a position, if the replacement policy allows it.
+    new_search():
+        Marks the start of a new search, letting its entries replace older ones.
+    clear():
+        Drops every entry.
+    """
+
+    def __init__(self, size=1 << 20):
+        """
+        Provides an empty table.
+
+        Parameters
+        ----------
+        size : int
+            maximum number of entries, rounded down to a power of two
+        """
+
+        self.size = 1 << (max(size, 1).bit_length() - 1)
+        self._mask = self.size - 1
+        self._slots = [None] * self.size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, position_hash, depth=0):
+        """
+        Returns the value and best play stored for the position, if searched at least depth deep.
+
+        Parameters
+        ----------
+        position_hash : int
+            Zobrist hash of the position, see GameState.hash
+        depth : int
+            minimum search depth of the stored value
+
+        Returns
+        -------
+        (float, tuple), optional
+        """
+
+        entry = self._slots[position_hash & self._mask]
+        if entry is not None and entry[0] == position_hash and entry[1] >= depth:
+            self.hits += 1
+            return entry[2], entry[3]
+        self.misses += 1
+        return None
+
+    def best_play(self, position_hash):
+        """
+        Returns the best play stored for the position, whatever its depth.
+
+        Used to try the previous best play first when searching deeper.
+
+        Parameters
+        ----------
+        position_hash : int
+            Zobrist hash of the position
+
+        Returns
+        -------
+        tuple, optional
+        """
+
+        entry = self._slots[position_hash & self._mask]
+        if entry is not None and entry[0] == position_hash:
+            return entry[3]
+        return None
+
+    def store(self, position_hash, depth, value, best_play=None):
+        """
+        Stores the evaluation of a position, if the replacement policy allows it.
+
+        Parameters
+        ----------
+        position_hash : int
+            Zobrist hash of the position
+        depth : int
+            search depth the value was computed with
+        value : float
+            the evaluation
+        best_play : tuple, optional
+            the best play found, if any
+
+        Returns
+        -------
+        None
+        """
+
+        index = position_hash & self._mask
+        entry = self._slots[index]
+        if entry is None or entry[4] != self.generation or entry[1] <= depth:
+            self._slots[index] = (position_hash, depth, value, best_play, self.generation)
+
+    def new_search(self):
+        """
+        Marks the start of a new search, letting its entries replace older ones.
+
+        Returns
+        -------
+        None
+        """
+
+        self.generation += 1
+
+    def clear(self):
+        """
+        Drops every entry.
+
+        Returns
+        -------
+        None
+        """
+
+        self._slots = [None] * self.size
+        self.hits = 0
+        self.misses = 0
+
+
+# timed while profiling is enabled, see profiling.py
+profiling.register(TranspositionTable, "lookup", cache_counter="hits")